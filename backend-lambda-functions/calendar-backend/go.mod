@@ -1,4 +1,4 @@
-module main
+module calendar-backend
 
 go 1.21.4
 
@@ -2,13 +2,19 @@ package main
 
 import (
 	"context"
+	"crypto/sha256"
+	"encoding/base64"
+	"encoding/hex"
 	"encoding/json"
 	"fmt"
 	"log"
 	"net/http"
 	"os"
 	"strconv"
+	"strings"
+	"sync"
 	"time"
+	"unicode/utf8"
 
 	"github.com/aws/aws-lambda-go/events"
 	"github.com/aws/aws-lambda-go/lambda"
@@ -23,19 +29,102 @@ import (
 )
 
 type CalendarEvent struct {
-	DateTime string `json:"dateTime"`
-	Summary  string `json:"summary"`
+	DateTime string    `json:"dateTime"`
+	Summary  string    `json:"summary"`
+	Start    time.Time `json:"-"`
+	AllDay   bool      `json:"-"`
 }
 
+// Compact binary representation of the events list, requested with the Accept header or ?format=bin.
+// Layout (all integers are unsigned bytes):
+//
+//	header: version, number of records
+//	record: day, month, hour, minute, flags (bit 0 - all-day event), summary length, summary (UTF-8)
+const (
+	binaryEventsContentType = "application/vnd.inkyframe.events"
+	binaryEventsVersion     = 1
+	binaryEventsFlagAllDay  = 1
+	binaryEventsMaxLen      = 255
+)
+
 type Config struct {
 	GoogleAPIOAuthToken  string
 	GoogleAPICredentials string
 }
 
-var ssmClient *ssm.Client
+// The SSM Parameter Store calls used here, implemented by *ssm.Client and replaced in tests.
+type ssmAPI interface {
+	GetParameter(ctx context.Context, params *ssm.GetParameterInput, optFns ...func(*ssm.Options)) (*ssm.GetParameterOutput, error)
+	PutParameter(ctx context.Context, params *ssm.PutParameterInput, optFns ...func(*ssm.Options)) (*ssm.PutParameterOutput, error)
+}
+
+var ssmClient ssmAPI
 var googleAPICreds Config
 var numEvents int64
 
+// Per-container caches. A warm Lambda container keeps them between invocations,
+// which saves the SSM reads and the calendar list lookups on every request.
+var (
+	cacheMu            sync.Mutex
+	cachedOAuthConfig  *oauth2.Config
+	cachedTokenSource  oauth2.TokenSource
+	cachedCalendarSvc  *calendar.Service
+	cachedCalendarIDs  = map[string]calendarIDEntry{}
+	calendarIDCacheTTL = time.Hour
+	cacheStatsMu       sync.Mutex
+	cacheHits          = map[string]int{}
+	cacheMisses        = map[string]int{}
+)
+
+type calendarIDEntry struct {
+	id      string
+	expires time.Time
+}
+
+// Counts and logs a cache lookup.
+func recordCacheLookup(cache string, hit bool) {
+	cacheStatsMu.Lock()
+	defer cacheStatsMu.Unlock()
+	if hit {
+		cacheHits[cache]++
+	} else {
+		cacheMisses[cache]++
+	}
+	log.Printf("cache %s: hit=%t hits=%d misses=%d", cache, hit, cacheHits[cache], cacheMisses[cache])
+}
+
+// A TokenSource that writes the token back to SSM only when it has actually been refreshed.
+type persistingTokenSource struct {
+	base         oauth2.TokenSource
+	ssmParamName string
+	mu           sync.Mutex
+	lastSaved    string
+}
+
+func (s *persistingTokenSource) Token() (*oauth2.Token, error) {
+	tok, err := s.base.Token()
+	if err != nil {
+		return nil, err
+	}
+	s.mu.Lock()
+	defer s.mu.Unlock()
+	if tok.AccessToken == s.lastSaved {
+		return tok, nil
+	}
+	tokenJson, err := json.Marshal(tok)
+	if err != nil {
+		return nil, fmt.Errorf("failed to marshal the token to JSON: %v", err)
+	}
+	// The refreshed token is usable even if saving it fails, so the request goes on and the save is retried next time
+	if err := saveValueToSSM(s.ssmParamName, string(tokenJson)); err != nil {
+		log.Printf("failed to save token to %s parameter: %v", s.ssmParamName, err)
+		return tok, nil
+	}
+	log.Printf("saved the refreshed token to %s", s.ssmParamName)
+	s.lastSaved = tok.AccessToken
+	return tok, nil
+}
+
 // Gets a value from SSM Parameter Store.
 func getValueFromSSM(ssmParamName string) (string, error) {
 	input := &ssm.GetParameterInput{
@@ -64,8 +153,34 @@ func saveValueToSSM(ssmParamName string, value string) error {
 	return nil
 }
 
-// Retrieves an OAuth Google API token, refreshes it, saves the refreshed token, and returns the generated client.
-func getClient(config *oauth2.Config) (*http.Client, error) {
+// Returns the OAuth2 config parsed from the Google API credentials, read from SSM once per container.
+func getOAuthConfig() (*oauth2.Config, error) {
+	if cachedOAuthConfig != nil {
+		recordCacheLookup("oauth2-config", true)
+		return cachedOAuthConfig, nil
+	}
+	recordCacheLookup("oauth2-config", false)
+	secretName := googleAPICreds.GoogleAPICredentials
+	googleApiCredentials, err := getValueFromSSM(secretName)
+	if err != nil {
+		return nil, fmt.Errorf("failed to read secret %v from AWS SSM Parameter Store: %w", secretName, err)
+	}
+	googleAPIConfig, err := google.ConfigFromJSON([]byte(googleApiCredentials), calendar.CalendarReadonlyScope)
+	if err != nil {
+		return nil, fmt.Errorf("failed to parse client secret file to googleAPIConfig: %w", err)
+	}
+	cachedOAuthConfig = googleAPIConfig
+	return cachedOAuthConfig, nil
+}
+
+// Returns a TokenSource that refreshes the OAuth Google API token as necessary and saves it to SSM when it changes.
+// The token is read from SSM once per container.
+func getTokenSource(config *oauth2.Config) (oauth2.TokenSource, error) {
+	if cachedTokenSource != nil {
+		recordCacheLookup("oauth2-token", true)
+		return cachedTokenSource, nil
+	}
+	recordCacheLookup("oauth2-token", false)
 	ssmParamName := googleAPICreds.GoogleAPIOAuthToken
 	rawJSON, err := getValueFromSSM(ssmParamName)
 	if err != nil {
@@ -76,41 +191,57 @@ func getClient(config *oauth2.Config) (*http.Client, error) {
 	if err != nil {
 		return nil, fmt.Errorf("failed to unmarshal the token from JSON: %w", err)
 	}
-	// Create a new TokenSource that automatically refreshes the token as necessary.
-	tokenSource := config.TokenSource(context.Background(), tok)
-
-	// Get the refreshed token.
-	tok, err = tokenSource.Token()
-	if err != nil {
-		return nil, fmt.Errorf("failed to refresh token: %w", err)
+	cachedTokenSource = &persistingTokenSource{
+		base:         oauth2.ReuseTokenSource(tok, config.TokenSource(context.Background(), tok)),
+		ssmParamName: ssmParamName,
+		lastSaved:    tok.AccessToken,
 	}
+	return cachedTokenSource, nil
+}
 
-	tokenJson, err := json.Marshal(tok)
+// Returns the Google Calendar service, created once per container so its HTTP connections are reused.
+func getCalendarService() (*calendar.Service, error) {
+	if cachedCalendarSvc != nil {
+		return cachedCalendarSvc, nil
+	}
+	googleAPIConfig, err := getOAuthConfig()
 	if err != nil {
-		return nil, fmt.Errorf("failed to marshal the token to JSON: %v", err)
+		return nil, err
 	}
-	// Save the token back to SSM, regardless of whether it has been refreshed or not.
-	err = saveValueToSSM(ssmParamName, string(tokenJson))
+	tokenSource, err := getTokenSource(googleAPIConfig)
 	if err != nil {
-		return nil, fmt.Errorf("failed to save token to %s parameter: %w", ssmParamName, err)
+		return nil, err
+	}
+	// Make sure the token is valid (refreshing it if necessary) before the first API call
+	if _, err := tokenSource.Token(); err != nil {
+		return nil, fmt.Errorf("failed to refresh token: %w", err)
 	}
-
-	// Create a new HTTP client with the TokenSource.
 	client := oauth2.NewClient(context.Background(), tokenSource)
-
-	return client, nil
+	calendarService, err := calendar.NewService(context.Background(), option.WithHTTPClient(client))
+	if err != nil {
+		return nil, fmt.Errorf("failed to retrieve Calendar client: %w", err)
+	}
+	cachedCalendarSvc = calendarService
+	return cachedCalendarSvc, nil
 }
 
 // Retrieves the calendar ID for a given calendar name from the Google Calendar service.
-func getCalendarID(calendarService *calendar.Service, calendarName string) (string, error) {
+// Resolved IDs are cached for calendarIDCacheTTL.
+func getCalendarID(ctx context.Context, calendarService *calendar.Service, calendarName string) (string, error) {
+	if entry, ok := cachedCalendarIDs[calendarName]; ok && time.Now().Before(entry.expires) {
+		recordCacheLookup("calendar-id", true)
+		return entry.id, nil
+	}
+	recordCacheLookup("calendar-id", false)
 	pageToken := ""
 	for {
-		calendarList, err := calendarService.CalendarList.List().PageToken(pageToken).Do()
+		calendarList, err := calendarService.CalendarList.List().PageToken(pageToken).Context(ctx).Do()
 		if err != nil {
 			return "", err
 		}
 		for _, item := range calendarList.Items {
 			if item.Summary == calendarName {
+				cachedCalendarIDs[calendarName] = calendarIDEntry{id: item.Id, expires: time.Now().Add(calendarIDCacheTTL)}
 				return item.Id, nil
 			}
 		}
@@ -122,118 +253,357 @@ func getCalendarID(calendarService *calendar.Service, calendarName string) (stri
 	return "", fmt.Errorf("failed to find the calendarID by name: %v", calendarName)
 }
 
-func HandleRequest(ctx context.Context, request events.APIGatewayV2HTTPRequest) (events.APIGatewayProxyResponse, error) {
-	calendarName := request.PathParameters["calendar-name"]
-	if calendarName == "" {
-		return events.APIGatewayProxyResponse{
-				StatusCode: http.StatusBadRequest,
-			},
-			fmt.Errorf("calendar name is empty or not provided")
+// Response cache. Events are cached per (calendar name, number of events) in the container's memory
+// and, when sharedEventsCache is set, in a tier shared by all containers. Entries older than the max-age
+// but within the stale-while-revalidate window are served while a refresh runs in the background.
+// Lambda freezes the container once the response is returned, so that refresh may be suspended until
+// the next invocation; it has its own timeout, and a refresh running for longer than that no longer
+// blocks a new one. Older entries are refreshed within the request, and served only if that fails and
+// they are within the stale-if-error window.
+type cachedEvents struct {
+	Events    []CalendarEvent
+	FetchedAt time.Time
+}
+
+// A response cache tier.
+type eventsCacheStore interface {
+	Get(key string) (cachedEvents, bool)
+	Set(key string, entry cachedEvents)
+}
+
+type memoryEventsCache struct {
+	mu      sync.Mutex
+	entries map[string]cachedEvents
+}
+
+func (c *memoryEventsCache) Get(key string) (cachedEvents, bool) {
+	c.mu.Lock()
+	defer c.mu.Unlock()
+	entry, ok := c.entries[key]
+	return entry, ok
+}
+
+func (c *memoryEventsCache) Set(key string, entry cachedEvents) {
+	c.mu.Lock()
+	defer c.mu.Unlock()
+	c.entries[key] = entry
+}
+
+var (
+	responseCacheMaxAge               = 5 * time.Minute
+	responseCacheStaleWhileRevalidate = 10 * time.Minute
+	responseCacheStaleIfError         = time.Hour
+	responseCacheRefreshTimeout       = 3 * time.Second
+	memoryResponseCache               = &memoryEventsCache{entries: map[string]cachedEvents{}}
+	// Optional shared tier, nil unless configured
+	sharedEventsCache eventsCacheStore
+	// Fetches the events on a cache miss, replaced in tests
+	eventsFetcher  = fetchEvents
+	revalidatingMu sync.Mutex
+	revalidating   = map[string]time.Time{} // key -> when its background refresh started
+)
+
+func eventsCacheKey(calendarName string, count int64) string {
+	return fmt.Sprintf("%s/%d", calendarName, count)
+}
+
+func lookupCachedEvents(key string) (cachedEvents, bool) {
+	if entry, ok := memoryResponseCache.Get(key); ok {
+		return entry, true
+	}
+	if sharedEventsCache != nil {
+		if entry, ok := sharedEventsCache.Get(key); ok {
+			memoryResponseCache.Set(key, entry)
+			return entry, true
+		}
 	}
+	return cachedEvents{}, false
+}
 
-	if request.QueryStringParameters["num-events"] != "" {
-		parsedInt, err := strconv.ParseInt(request.QueryStringParameters["num-events"], 10, 64)
+func storeCachedEvents(key string, entry cachedEvents) {
+	memoryResponseCache.Set(key, entry)
+	if sharedEventsCache != nil {
+		sharedEventsCache.Set(key, entry)
+	}
+}
+
+// Refreshes a cache entry in the background, at most one refresh per key at a time.
+func revalidateInBackground(key string, calendarName string, count int64) {
+	revalidatingMu.Lock()
+	if started, ok := revalidating[key]; ok && time.Since(started) < responseCacheRefreshTimeout {
+		revalidatingMu.Unlock()
+		return
+	}
+	started := time.Now()
+	revalidating[key] = started
+	revalidatingMu.Unlock()
+
+	go func() {
+		defer func() {
+			revalidatingMu.Lock()
+			// A refresh started after this one timed out owns the key now
+			if revalidating[key] == started {
+				delete(revalidating, key)
+			}
+			revalidatingMu.Unlock()
+		}()
+		ctx, cancel := context.WithTimeout(context.Background(), responseCacheRefreshTimeout)
+		defer cancel()
+		eventsList, err := eventsFetcher(ctx, calendarName, count)
 		if err != nil {
-			return events.APIGatewayProxyResponse{
-					StatusCode: http.StatusBadRequest,
-				},
-				fmt.Errorf("failed to parse number of calendar events: %w", err)
+			log.Printf("failed to revalidate %s: %v", key, err)
+			return
 		}
-		numEvents = parsedInt
-	}
+		storeCachedEvents(key, cachedEvents{Events: eventsList, FetchedAt: time.Now()})
+	}()
+}
 
-	secretName := googleAPICreds.GoogleAPICredentials
-	googleApiCredentials, err := getValueFromSSM(secretName)
-	if err != nil {
-		return events.APIGatewayProxyResponse{
-				StatusCode: http.StatusInternalServerError,
-			},
-			fmt.Errorf("failed to read secret %v from AWS SSM Parameter Store: %w", secretName, err)
+// Returns the events from the response cache or Google Calendar, together with the cache status: hit, stale or miss.
+func getEvents(ctx context.Context, calendarName string, count int64, maxAge time.Duration, allowStale bool) ([]CalendarEvent, string, error) {
+	key := eventsCacheKey(calendarName, count)
+	if responseCacheMaxAge <= 0 {
+		eventsList, err := eventsFetcher(ctx, calendarName, count)
+		if err != nil {
+			return nil, "", err
+		}
+		return eventsList, "miss", nil
 	}
-	googleAPIConfig, err := google.ConfigFromJSON([]byte(googleApiCredentials), calendar.CalendarReadonlyScope)
+	entry, cached := lookupCachedEvents(key)
+	age := time.Since(entry.FetchedAt)
+	if cached && age <= maxAge {
+		recordCacheLookup("response", true)
+		return entry.Events, "hit", nil
+	}
+	if cached && allowStale && age <= maxAge+responseCacheStaleWhileRevalidate {
+		recordCacheLookup("response", true)
+		revalidateInBackground(key, calendarName, count)
+		return entry.Events, "stale", nil
+	}
+	recordCacheLookup("response", false)
+	eventsList, err := eventsFetcher(ctx, calendarName, count)
 	if err != nil {
-		return events.APIGatewayProxyResponse{
-				StatusCode: http.StatusInternalServerError,
-			},
-			fmt.Errorf("failed to parse client secret file to googleAPIConfig: %w", err)
+		if cached && allowStale && age <= maxAge+responseCacheStaleIfError {
+			log.Printf("failed to refresh %s, serving the cached events: %v", key, err)
+			return entry.Events, "stale", nil
+		}
+		return nil, "", err
 	}
+	storeCachedEvents(key, cachedEvents{Events: eventsList, FetchedAt: time.Now()})
+	return eventsList, "miss", nil
+}
 
-	client, err := getClient(googleAPIConfig)
-	if err != nil {
-		return events.APIGatewayProxyResponse{
-				StatusCode: http.StatusInternalServerError,
-			},
-			fmt.Errorf("failed to get client: %w", err)
+// Parses the max-age (or no-cache) directive of a request Cache-Control header.
+func requestedMaxAge(cacheControl string) (time.Duration, bool) {
+	for _, directive := range strings.Split(cacheControl, ",") {
+		directive = strings.ToLower(strings.TrimSpace(directive))
+		if directive == "no-cache" {
+			return 0, true
+		}
+		if value, found := strings.CutPrefix(directive, "max-age="); found {
+			seconds, err := strconv.Atoi(value)
+			if err == nil && seconds >= 0 {
+				return time.Duration(seconds) * time.Second, true
+			}
+		}
 	}
+	return 0, false
+}
 
-	calendarService, err := calendar.NewService(ctx, option.WithHTTPClient(client))
+// Retrieves the upcoming events of a calendar from Google Calendar.
+func fetchEvents(ctx context.Context, calendarName string, count int64) ([]CalendarEvent, error) {
+	cacheMu.Lock()
+	calendarService, err := getCalendarService()
 	if err != nil {
-		return events.APIGatewayProxyResponse{
-			StatusCode: http.StatusInternalServerError,
-		}, fmt.Errorf("failed to retrieve Calendar client: %w", err)
+		cacheMu.Unlock()
+		return nil, fmt.Errorf("failed to get client: %w", err)
 	}
 
-	calendarID, err := getCalendarID(calendarService, string(calendarName))
+	calendarID, err := getCalendarID(ctx, calendarService, calendarName)
+	cacheMu.Unlock()
 	if err != nil {
-		return events.APIGatewayProxyResponse{
-			StatusCode: http.StatusInternalServerError,
-		}, fmt.Errorf("failed to get calendar ID: %w", err)
+		return nil, fmt.Errorf("failed to get calendar ID: %w", err)
 	}
 
 	calendarEvents, err := calendarService.Events.List(calendarID).
 		ShowDeleted(false).
 		SingleEvents(true).
 		TimeMin(time.Now().Format(time.RFC3339)).
-		MaxResults(numEvents).
-		OrderBy("startTime").Do()
+		MaxResults(count).
+		OrderBy("startTime").Context(ctx).Do()
 	if err != nil {
-		return events.APIGatewayProxyResponse{
-			StatusCode: http.StatusInternalServerError,
-		}, fmt.Errorf("failed to retrieve events from the calendar %v: %w", calendarID, err)
+		return nil, fmt.Errorf("failed to retrieve events from the calendar %v: %w", calendarID, err)
 	}
 
 	var eventsList []CalendarEvent
 	for _, item := range calendarEvents.Items {
 		var formattedDate string
-		if item.Start.DateTime != "" {
+		var startDate time.Time
+		allDay := item.Start.DateTime == ""
+		if !allDay {
 			parsedDate, err := time.Parse(time.RFC3339, item.Start.DateTime)
 			if err != nil {
-				return events.APIGatewayProxyResponse{
-					StatusCode: http.StatusInternalServerError,
-				}, fmt.Errorf("failed to parse date: %w", err)
+				return nil, fmt.Errorf("failed to parse date: %w", err)
 			}
 			formattedDate = parsedDate.Format("02.Jan.15:04")
+			startDate = parsedDate
 		} else {
 			parsedDate, err := time.Parse("2006-01-02", item.Start.Date)
 			if err != nil {
-				return events.APIGatewayProxyResponse{
-					StatusCode: http.StatusInternalServerError,
-				}, fmt.Errorf("failed to parse date: %w", err)
+				return nil, fmt.Errorf("failed to parse date: %w", err)
 			}
 			formattedDate = parsedDate.Format("02.Jan")
+			startDate = parsedDate
 		}
 
 		eventsList = append(eventsList, CalendarEvent{
 			DateTime: formattedDate,
 			Summary:  item.Summary,
+			Start:    startDate,
+			AllDay:   allDay,
 		})
 	}
+	return eventsList, nil
+}
+
+func HandleRequest(ctx context.Context, request events.APIGatewayV2HTTPRequest) (events.APIGatewayProxyResponse, error) {
+	calendarName := request.PathParameters["calendar-name"]
+	if calendarName == "" {
+		return events.APIGatewayProxyResponse{
+				StatusCode: http.StatusBadRequest,
+			},
+			fmt.Errorf("calendar name is empty or not provided")
+	}
 
-	jsonEvents, err := json.Marshal(eventsList)
+	count := numEvents
+	if request.QueryStringParameters["num-events"] != "" {
+		parsedInt, err := strconv.ParseInt(request.QueryStringParameters["num-events"], 10, 64)
+		if err != nil {
+			return events.APIGatewayProxyResponse{
+					StatusCode: http.StatusBadRequest,
+				},
+				fmt.Errorf("failed to parse number of calendar events: %w", err)
+		}
+		count = parsedInt
+	}
+
+	maxAge, allowStale := responseCacheMaxAge, true
+	if requested, ok := requestedMaxAge(request.Headers["cache-control"]); ok {
+		// A client asking for a max-age does not want anything older, stale responses included
+		if requested < maxAge {
+			maxAge = requested
+		}
+		allowStale = false
+	}
+
+	eventsList, cacheStatus, err := getEvents(ctx, calendarName, count, maxAge, allowStale)
 	if err != nil {
 		return events.APIGatewayProxyResponse{
 			StatusCode: http.StatusInternalServerError,
-		}, fmt.Errorf("failed to marshal events to JSON: %w", err)
+		}, err
+	}
+
+	var body []byte
+	var contentType string
+	if wantsBinaryEvents(request) {
+		body = encodeEventsBinary(eventsList)
+		contentType = binaryEventsContentType
+	} else {
+		body, err = json.Marshal(eventsList)
+		if err != nil {
+			return events.APIGatewayProxyResponse{
+				StatusCode: http.StatusInternalServerError,
+			}, fmt.Errorf("failed to marshal events to JSON: %w", err)
+		}
+		contentType = "application/json"
+	}
+
+	etag := computeETag(body)
+	if etagMatches(request.Headers["if-none-match"], etag) {
+		return events.APIGatewayProxyResponse{
+				StatusCode: http.StatusNotModified,
+				Headers:    map[string]string{"ETag": etag, "Vary": "Accept", "X-Cache": cacheStatus},
+			},
+			nil
 	}
 
+	headers := map[string]string{"Content-Type": contentType, "ETag": etag, "Vary": "Accept", "X-Cache": cacheStatus}
+	if contentType == binaryEventsContentType {
+		return events.APIGatewayProxyResponse{
+				StatusCode:      http.StatusOK,
+				Body:            base64.StdEncoding.EncodeToString(body),
+				IsBase64Encoded: true,
+				Headers:         headers,
+			},
+			nil
+	}
 	return events.APIGatewayProxyResponse{
 			StatusCode: http.StatusOK,
-			Body:       string(jsonEvents),
-			Headers:    map[string]string{"Content-Type": "application/json"},
+			Body:       string(body),
+			Headers:    headers,
 		},
 		nil
 }
 
+// Computes a strong ETag of the response body, so each representation of the events list gets its own tag.
+func computeETag(body []byte) string {
+	sum := sha256.Sum256(body)
+	return `"` + hex.EncodeToString(sum[:16]) + `"`
+}
+
+// Checks an If-None-Match header value against the current ETag.
+func etagMatches(ifNoneMatch string, etag string) bool {
+	if ifNoneMatch == "" {
+		return false
+	}
+	for _, candidate := range strings.Split(ifNoneMatch, ",") {
+		// If-None-Match uses the weak comparison, so a W/ prefix is ignored
+		candidate = strings.TrimPrefix(strings.TrimSpace(candidate), "W/")
+		if candidate == "*" || candidate == etag {
+			return true
+		}
+	}
+	return false
+}
+
+// Returns true when the client asked for the compact binary events format.
+func wantsBinaryEvents(request events.APIGatewayV2HTTPRequest) bool {
+	if request.QueryStringParameters["format"] == "bin" {
+		return true
+	}
+	return strings.Contains(request.Headers["accept"], binaryEventsContentType)
+}
+
+// Encodes the events list in the compact binary format.
+func encodeEventsBinary(eventsList []CalendarEvent) []byte {
+	count := len(eventsList)
+	if count > binaryEventsMaxLen {
+		count = binaryEventsMaxLen
+	}
+	buf := make([]byte, 0, 2+count*32)
+	buf = append(buf, binaryEventsVersion, byte(count))
+	for _, event := range eventsList[:count] {
+		var flags byte
+		if event.AllDay {
+			flags |= binaryEventsFlagAllDay
+		}
+		summary := event.Summary
+		if len(summary) > binaryEventsMaxLen {
+			// Cut on a rune boundary so the client always gets valid UTF-8
+			cut := binaryEventsMaxLen
+			for cut > 0 && !utf8.RuneStart(summary[cut]) {
+				cut--
+			}
+			summary = summary[:cut]
+		}
+		buf = append(buf,
+			byte(event.Start.Day()), byte(event.Start.Month()),
+			byte(event.Start.Hour()), byte(event.Start.Minute()),
+			flags, byte(len(summary)))
+		buf = append(buf, summary...)
+	}
+	return buf
+}
+
 // init initializes the application by setting up the Google API credentials and loading the AWS SDK config.
 func init() {
 	// Set up Google API credentials
@@ -245,6 +615,29 @@ func init() {
 	// Set up the default number of events to be returned
 	numEvents = 5
 
+	// Response cache settings, in seconds; a max-age of 0 disables the cache
+	if value := os.Getenv("RESPONSE_CACHE_MAX_AGE"); value != "" {
+		seconds, err := strconv.Atoi(value)
+		if err != nil {
+			log.Fatalf("failed to parse RESPONSE_CACHE_MAX_AGE: %v", err)
+		}
+		responseCacheMaxAge = time.Duration(seconds) * time.Second
+	}
+	if value := os.Getenv("RESPONSE_CACHE_STALE_WHILE_REVALIDATE"); value != "" {
+		seconds, err := strconv.Atoi(value)
+		if err != nil {
+			log.Fatalf("failed to parse RESPONSE_CACHE_STALE_WHILE_REVALIDATE: %v", err)
+		}
+		responseCacheStaleWhileRevalidate = time.Duration(seconds) * time.Second
+	}
+	if value := os.Getenv("RESPONSE_CACHE_STALE_IF_ERROR"); value != "" {
+		seconds, err := strconv.Atoi(value)
+		if err != nil {
+			log.Fatalf("failed to parse RESPONSE_CACHE_STALE_IF_ERROR: %v", err)
+		}
+		responseCacheStaleIfError = time.Duration(seconds) * time.Second
+	}
+
 	// Load AWS SDK config
 	cfg, err := config.LoadDefaultConfig(context.TODO())
 	if err != nil {
@@ -0,0 +1,382 @@
+package main
+
+import (
+	"context"
+	"errors"
+	"fmt"
+	"net/http"
+	"net/http/httptest"
+	"strings"
+	"sync"
+	"testing"
+	"time"
+
+	"github.com/aws/aws-sdk-go-v2/aws"
+	"github.com/aws/aws-sdk-go-v2/service/ssm"
+	"github.com/aws/aws-sdk-go-v2/service/ssm/types"
+	"golang.org/x/oauth2"
+	"google.golang.org/api/calendar/v3"
+	"google.golang.org/api/option"
+)
+
+// Stand-in for SSM Parameter Store, counts the reads and writes of each parameter.
+type fakeSSM struct {
+	mu     sync.Mutex
+	values map[string]string
+	gets   map[string]int
+	puts   map[string]int
+}
+
+func newFakeSSM(values map[string]string) *fakeSSM {
+	return &fakeSSM{values: values, gets: map[string]int{}, puts: map[string]int{}}
+}
+
+func (f *fakeSSM) GetParameter(ctx context.Context, params *ssm.GetParameterInput, optFns ...func(*ssm.Options)) (*ssm.GetParameterOutput, error) {
+	f.mu.Lock()
+	defer f.mu.Unlock()
+	name := aws.ToString(params.Name)
+	f.gets[name]++
+	value, ok := f.values[name]
+	if !ok {
+		return nil, fmt.Errorf("parameter %s not found", name)
+	}
+	return &ssm.GetParameterOutput{Parameter: &types.Parameter{Name: params.Name, Value: aws.String(value)}}, nil
+}
+
+func (f *fakeSSM) PutParameter(ctx context.Context, params *ssm.PutParameterInput, optFns ...func(*ssm.Options)) (*ssm.PutParameterOutput, error) {
+	f.mu.Lock()
+	defer f.mu.Unlock()
+	name := aws.ToString(params.Name)
+	f.puts[name]++
+	f.values[name] = aws.ToString(params.Value)
+	return &ssm.PutParameterOutput{}, nil
+}
+
+// In-memory stand-in for the shared response cache tier.
+type fakeSharedCache struct {
+	memoryEventsCache
+	gets, sets int
+}
+
+func newFakeSharedCache() *fakeSharedCache {
+	return &fakeSharedCache{memoryEventsCache: memoryEventsCache{entries: map[string]cachedEvents{}}}
+}
+
+func (c *fakeSharedCache) Get(key string) (cachedEvents, bool) {
+	c.gets++
+	return c.memoryEventsCache.Get(key)
+}
+
+func (c *fakeSharedCache) Set(key string, entry cachedEvents) {
+	c.sets++
+	c.memoryEventsCache.Set(key, entry)
+}
+
+// Replaces the events fetcher, returning the events of the calendar named after the call number.
+type fakeFetcher struct {
+	mu    sync.Mutex
+	calls int
+	err   error
+	block chan struct{} // when set, fetches wait until it is closed
+	done  chan struct{} // receives after every fetch
+}
+
+func (f *fakeFetcher) fetch(ctx context.Context, calendarName string, count int64) ([]CalendarEvent, error) {
+	f.mu.Lock()
+	f.calls++
+	call, err, block := f.calls, f.err, f.block
+	f.mu.Unlock()
+	defer func() { f.done <- struct{}{} }()
+	if block != nil {
+		select {
+		case <-block:
+		case <-ctx.Done():
+			return nil, ctx.Err()
+		}
+	}
+	if err != nil {
+		return nil, err
+	}
+	return []CalendarEvent{{DateTime: "18.Oct.09:00", Summary: fmt.Sprintf("%s #%d", calendarName, call)}}, nil
+}
+
+func (f *fakeFetcher) callCount() int {
+	f.mu.Lock()
+	defer f.mu.Unlock()
+	return f.calls
+}
+
+// Resets the response cache and installs a fake fetcher for the duration of a test.
+func useFakeFetcher(t *testing.T) *fakeFetcher {
+	t.Helper()
+	f := &fakeFetcher{done: make(chan struct{}, 16)}
+	saved := eventsFetcher
+	memoryResponseCache = &memoryEventsCache{entries: map[string]cachedEvents{}}
+	sharedEventsCache = nil
+	revalidating = map[string]time.Time{}
+	eventsFetcher = f.fetch
+	t.Cleanup(func() {
+		eventsFetcher = saved
+		sharedEventsCache = nil
+	})
+	return f
+}
+
+func waitForFetch(t *testing.T, f *fakeFetcher) {
+	t.Helper()
+	select {
+	case <-f.done:
+	case <-time.After(2 * time.Second):
+		t.Fatal("the background refresh did not run")
+	}
+}
+
+// Waits until the background refresh has released its key.
+func waitForRevalidation(t *testing.T, key string) {
+	t.Helper()
+	deadline := time.Now().Add(2 * time.Second)
+	for time.Now().Before(deadline) {
+		revalidatingMu.Lock()
+		_, running := revalidating[key]
+		revalidatingMu.Unlock()
+		if !running {
+			return
+		}
+		time.Sleep(time.Millisecond)
+	}
+	t.Fatalf("the refresh of %s did not finish", key)
+}
+
+func ageEntry(key string, by time.Duration) {
+	entry, _ := memoryResponseCache.Get(key)
+	entry.FetchedAt = entry.FetchedAt.Add(-by)
+	memoryResponseCache.Set(key, entry)
+}
+
+func TestResponseCacheHit(t *testing.T) {
+	f := useFakeFetcher(t)
+	ctx := context.Background()
+	first, status, err := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	if err != nil || status != "miss" {
+		t.Fatalf("first request: status %q, err %v", status, err)
+	}
+	second, status, err := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	if err != nil || status != "hit" {
+		t.Fatalf("second request: status %q, err %v", status, err)
+	}
+	if second[0].Summary != first[0].Summary || f.callCount() != 1 {
+		t.Fatalf("a hit fetched again: %d fetches", f.callCount())
+	}
+	// The number of events is part of the key
+	if _, status, _ := getEvents(ctx, "Familie", 3, responseCacheMaxAge, true); status != "miss" {
+		t.Fatalf("other count: status %q", status)
+	}
+}
+
+func TestResponseCacheExpiredEntryIsFetchedAgain(t *testing.T) {
+	f := useFakeFetcher(t)
+	ctx := context.Background()
+	getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	ageEntry("Familie/5", responseCacheMaxAge+responseCacheStaleWhileRevalidate+time.Second)
+	eventsList, status, err := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	if err != nil || status != "miss" || eventsList[0].Summary != "Familie #2" {
+		t.Fatalf("expired entry: status %q, events %v, err %v", status, eventsList, err)
+	}
+	// A client asking for a shorter max-age gets no stale response
+	ageEntry("Familie/5", 2*time.Second)
+	if _, status, _ := getEvents(ctx, "Familie", 5, time.Second, false); status != "miss" || f.callCount() != 3 {
+		t.Fatalf("requested max-age: status %q, %d fetches", status, f.callCount())
+	}
+}
+
+func TestResponseCacheServesStaleWhileRevalidating(t *testing.T) {
+	f := useFakeFetcher(t)
+	ctx := context.Background()
+	getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	<-f.done
+	ageEntry("Familie/5", responseCacheMaxAge+time.Second)
+
+	f.block = make(chan struct{})
+	for i := 0; i < 3; i++ {
+		eventsList, status, err := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+		if err != nil || status != "stale" || eventsList[0].Summary != "Familie #1" {
+			t.Fatalf("stale request: status %q, events %v, err %v", status, eventsList, err)
+		}
+	}
+	// The stale responses did not wait for the refresh, and only one refresh runs
+	close(f.block)
+	waitForFetch(t, f)
+	waitForRevalidation(t, "Familie/5")
+	if f.callCount() != 2 {
+		t.Fatalf("%d fetches, want 2", f.callCount())
+	}
+	eventsList, status, _ := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	if status != "hit" || eventsList[0].Summary != "Familie #2" {
+		t.Fatalf("after the refresh: status %q, events %v", status, eventsList)
+	}
+}
+
+func TestResponseCacheRefreshLeftBehindByFrozenContainerIsReplaced(t *testing.T) {
+	f := useFakeFetcher(t)
+	ctx := context.Background()
+	getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	<-f.done
+	ageEntry("Familie/5", responseCacheMaxAge+time.Second)
+	// A refresh started before the container was frozen, and never finished
+	revalidating["Familie/5"] = time.Now().Add(-2 * responseCacheRefreshTimeout)
+	if _, status, _ := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true); status != "stale" {
+		t.Fatalf("status %q, want stale", status)
+	}
+	waitForFetch(t, f)
+	waitForRevalidation(t, "Familie/5")
+	if eventsList, status, _ := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true); status != "hit" || eventsList[0].Summary != "Familie #2" {
+		t.Fatalf("after the refresh: status %q, events %v", status, eventsList)
+	}
+}
+
+func TestResponseCacheStaleIfError(t *testing.T) {
+	f := useFakeFetcher(t)
+	ctx := context.Background()
+	getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	<-f.done
+	ageEntry("Familie/5", responseCacheMaxAge+responseCacheStaleWhileRevalidate+time.Second)
+	f.err = errors.New("calendar API unavailable")
+
+	eventsList, status, err := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	if err != nil || status != "stale" || eventsList[0].Summary != "Familie #1" {
+		t.Fatalf("within stale-if-error: status %q, events %v, err %v", status, eventsList, err)
+	}
+	// The client asked for a fresh response
+	if _, _, err := getEvents(ctx, "Familie", 5, 0, false); err == nil {
+		t.Fatal("no-cache request got a stale response")
+	}
+	ageEntry("Familie/5", responseCacheStaleIfError)
+	if _, _, err := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true); err == nil {
+		t.Fatal("entry past stale-if-error was served")
+	}
+}
+
+func TestResponseCacheSharedTier(t *testing.T) {
+	f := useFakeFetcher(t)
+	shared := newFakeSharedCache()
+	sharedEventsCache = shared
+	ctx := context.Background()
+	getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	if shared.sets != 1 {
+		t.Fatalf("%d writes to the shared tier, want 1", shared.sets)
+	}
+	// Another container has an empty memory tier
+	memoryResponseCache = &memoryEventsCache{entries: map[string]cachedEvents{}}
+	eventsList, status, _ := getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	if status != "hit" || eventsList[0].Summary != "Familie #1" || f.callCount() != 1 {
+		t.Fatalf("shared hit: status %q, events %v, %d fetches", status, eventsList, f.callCount())
+	}
+	getEvents(ctx, "Familie", 5, responseCacheMaxAge, true)
+	// The entry was copied into the memory tier, the first lookup missed both tiers
+	if shared.gets != 2 {
+		t.Fatalf("%d reads of the shared tier, want 2", shared.gets)
+	}
+}
+
+const testCredentials = `{"installed":{"client_id":"frame","client_secret":"secret","redirect_uris":["http://localhost"],` +
+	`"auth_uri":"https://accounts.google.com/o/oauth2/auth","token_uri":"https://oauth2.googleapis.com/token"}}`
+
+const testToken = `{"access_token":"access","token_type":"Bearer","refresh_token":"refresh","expiry":"2100-01-01T00:00:00Z"}`
+
+func useFakeSSM(t *testing.T) *fakeSSM {
+	t.Helper()
+	fake := newFakeSSM(map[string]string{"credentials": testCredentials, "token": testToken})
+	saved, savedCreds := ssmClient, googleAPICreds
+	ssmClient = fake
+	googleAPICreds = Config{GoogleAPIOAuthToken: "token", GoogleAPICredentials: "credentials"}
+	cachedOAuthConfig, cachedTokenSource, cachedCalendarSvc = nil, nil, nil
+	t.Cleanup(func() {
+		ssmClient, googleAPICreds = saved, savedCreds
+		cachedOAuthConfig, cachedTokenSource, cachedCalendarSvc = nil, nil, nil
+	})
+	return fake
+}
+
+func TestCredentialsAreReadOncePerContainer(t *testing.T) {
+	fake := useFakeSSM(t)
+	for i := 0; i < 3; i++ {
+		config, err := getOAuthConfig()
+		if err != nil {
+			t.Fatal(err)
+		}
+		tokenSource, err := getTokenSource(config)
+		if err != nil {
+			t.Fatal(err)
+		}
+		if tok, err := tokenSource.Token(); err != nil || tok.AccessToken != "access" {
+			t.Fatalf("token %v, err %v", tok, err)
+		}
+	}
+	if fake.gets["credentials"] != 1 || fake.gets["token"] != 1 {
+		t.Fatalf("SSM reads: %v, want one of each", fake.gets)
+	}
+	// The token has not been refreshed, so it is not written back
+	if fake.puts["token"] != 0 {
+		t.Fatalf("token saved %d times", fake.puts["token"])
+	}
+}
+
+func TestRefreshedTokenIsSaved(t *testing.T) {
+	fake := useFakeSSM(t)
+	tokenSource := &persistingTokenSource{base: oauth2.StaticTokenSource(&oauth2.Token{AccessToken: "renewed"}), ssmParamName: "token", lastSaved: "access"}
+	for i := 0; i < 2; i++ {
+		if _, err := tokenSource.Token(); err != nil {
+			t.Fatal(err)
+		}
+	}
+	if fake.puts["token"] != 1 || !strings.Contains(fake.values["token"], `"renewed"`) {
+		t.Fatalf("token saved %d times: %s", fake.puts["token"], fake.values["token"])
+	}
+}
+
+func TestCalendarIDIsCached(t *testing.T) {
+	var lists int
+	server := httptest.NewServer(http.HandlerFunc(func(w http.ResponseWriter, r *http.Request) {
+		if !strings.HasSuffix(r.URL.Path, "/users/me/calendarList") {
+			http.NotFound(w, r)
+			return
+		}
+		lists++
+		w.Header().Set("Content-Type", "application/json")
+		fmt.Fprint(w, `{"items":[{"id":"work@group.calendar.google.com","summary":"Arbeit"},`+
+			`{"id":"family@group.calendar.google.com","summary":"Familie"}]}`)
+	}))
+	defer server.Close()
+	ctx := context.Background()
+	calendarService, err := calendar.NewService(ctx, option.WithHTTPClient(server.Client()), option.WithEndpoint(server.URL+"/"))
+	if err != nil {
+		t.Fatal(err)
+	}
+	cachedCalendarIDs = map[string]calendarIDEntry{}
+
+	for i := 0; i < 3; i++ {
+		id, err := getCalendarID(ctx, calendarService, "Familie")
+		if err != nil || id != "family@group.calendar.google.com" {
+			t.Fatalf("id %q, err %v", id, err)
+		}
+	}
+	if lists != 1 {
+		t.Fatalf("%d calendar list requests, want 1", lists)
+	}
+	// Expired IDs are resolved again
+	entry := cachedCalendarIDs["Familie"]
+	entry.expires = time.Now().Add(-time.Second)
+	cachedCalendarIDs["Familie"] = entry
+	if _, err := getCalendarID(ctx, calendarService, "Familie"); err != nil || lists != 2 {
+		t.Fatalf("after expiry: %d calendar list requests, err %v", lists, err)
+	}
+	// Unknown names are not cached
+	for i := 0; i < 2; i++ {
+		if _, err := getCalendarID(ctx, calendarService, "Urlaub"); err == nil {
+			t.Fatal("unknown calendar resolved")
+		}
+	}
+	if lists != 4 {
+		t.Fatalf("%d calendar list requests, want 4", lists)
+	}
+}
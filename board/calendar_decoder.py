@@ -0,0 +1,373 @@
+"""Allocation-light decoding of the calendar API responses.
+
+By default the calendar endpoint returns a JSON array of flat objects:
+[{"dateTime": "02.Jan.15:04", "summary": "Dentist"}, ...]
+Instead of buffering the whole body and building the full object tree,
+EventStreamDecoder reads the socket in fixed-size chunks into a reusable
+buffer and keeps only the fields the calendar screen needs.
+
+With "Accept: application/vnd.inkyframe.events" the endpoint returns the
+compact binary format decoded by BinaryEventDecoder:
+    header: version, number of records
+    record: day, month, hour, minute, flags, summary length, summary (UTF-8)
+all integers being unsigned bytes.
+
+Both decoders return events as (day, month, hour, minute, flags, summary) tuples.
+"""
+import struct
+
+BINARY_CONTENT_TYPE = "application/vnd.inkyframe.events"
+BINARY_VERSION = 1
+
+FLAG_ALL_DAY = 1
+
+# Indexes into the event tuples
+DAY, MONTH, HOUR, MINUTE, FLAGS, SUMMARY = 0, 1, 2, 3, 4, 5
+
+MONTH_NAMES = ("", "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+_MONTHS = b"JanFebMarAprMayJunJulAugSepOctNovDec"
+
+_QUOTE = 0x22      # "
+_BACKSLASH = 0x5C  # \
+_COLON = 0x3A      # :
+_COMMA = 0x2C      # ,
+_LBRACE = 0x7B     # {
+_RBRACE = 0x7D     # }
+_LBRACKET = 0x5B   # [
+_RBRACKET = 0x5D   # ]
+
+_SIMPLE_ESCAPES = {
+    0x22: 0x22, 0x5C: 0x5C, 0x2F: 0x2F,
+    0x62: 0x08, 0x66: 0x0C, 0x6E: 0x0A, 0x72: 0x0D, 0x74: 0x09,
+}
+
+_KEY_DATE_TIME = b"dateTime"
+_KEY_SUMMARY = b"summary"
+
+_MAX_KEY_LEN = 16
+_MAX_DATE_TIME_LEN = 32
+
+
+def utf8_trim(buf, length):
+    """Returns the largest length <= length that does not cut a UTF-8 sequence in half."""
+    i = length
+    # Walk back over continuation bytes to the lead byte of the last sequence
+    while i > 0 and buf[i - 1] & 0xC0 == 0x80:
+        i -= 1
+    if i == 0:
+        return 0
+    lead = buf[i - 1]
+    if lead < 0x80:
+        return length
+    if lead >= 0xF0:
+        needed = 4
+    elif lead >= 0xE0:
+        needed = 3
+    else:
+        needed = 2
+    if length - (i - 1) >= needed:
+        return length
+    return i - 1
+
+
+def _parse_number(buf, start, end):
+    value = 0
+    if start >= end:
+        raise ValueError("Invalid dateTime in calendar response")
+    for i in range(start, end):
+        digit = buf[i] - 0x30
+        if digit < 0 or digit > 9:
+            raise ValueError("Invalid dateTime in calendar response")
+        value = value * 10 + digit
+    return value
+
+
+def parse_date_time(buf, length):
+    """Parses "02.Jan.15:04" or "02.Jan" (all-day) straight from the buffer.
+    Returns (day, month, hour, minute, flags).
+    """
+    # dd.Mon
+    dot = 0
+    while dot < length and buf[dot] != 0x2E:
+        dot += 1
+    day = _parse_number(buf, 0, dot)
+    if dot + 4 > length:
+        raise ValueError("Invalid dateTime in calendar response")
+    month = 0
+    for m in range(12):
+        j = m * 3
+        if buf[dot + 1] == _MONTHS[j] and buf[dot + 2] == _MONTHS[j + 1] and buf[dot + 3] == _MONTHS[j + 2]:
+            month = m + 1
+            break
+    if not month:
+        raise ValueError("Invalid month in calendar response")
+    if dot + 4 == length:
+        return day, month, 0, 0, FLAG_ALL_DAY
+    # .HH:MM
+    start = dot + 5
+    colon = start
+    while colon < length and buf[colon] != 0x3A:
+        colon += 1
+    return day, month, _parse_number(buf, start, colon), _parse_number(buf, colon + 1, length), 0
+
+
+def format_date_time(event):
+    """Formats the event date the way the JSON API does: "02.Jan.15:04", or "02.Jan" for all-day events."""
+    if event[FLAGS] & FLAG_ALL_DAY:
+        return "{:02d}.{}".format(event[DAY], MONTH_NAMES[event[MONTH]])
+    return "{:02d}.{}.{:02d}:{:02d}".format(event[DAY], MONTH_NAMES[event[MONTH]], event[HOUR], event[MINUTE])
+
+
+def _equals(buf, length, value):
+    """Compares the first length bytes of buf with value without slicing buf."""
+    if length != len(value):
+        return False
+    for i in range(length):
+        if buf[i] != value[i]:
+            return False
+    return True
+
+
+class EventStreamDecoder:
+    """Incremental decoder for the calendar API response.
+    Keyword arguments:
+        max_events - events after this many are not decoded; reading stops early
+        max_summary_len - summaries are truncated to this many bytes (on a UTF-8 boundary)
+        buf_size - size of the reusable socket read buffer
+    Example:
+        decoder = EventStreamDecoder(max_events=20, max_summary_len=64)
+        events = decoder.decode(response.raw)
+    """
+
+    def __init__(self, max_events=20, max_summary_len=64, buf_size=256):
+        self.max_events = max_events
+        self.max_summary_len = max_summary_len
+        self.buf = bytearray(buf_size)
+        self.events = [None] * max_events
+        self._key = bytearray(_MAX_KEY_LEN)
+        self._date_time = bytearray(_MAX_DATE_TIME_LEN)
+        self._summary = bytearray(max_summary_len)
+        self._reset()
+
+    def _reset(self):
+        self.count = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = 0       # 0 - none, 1 - after backslash, 2..5 - reading \uXXXX digits
+        self._code_point = 0
+        self._high_surrogate = 0
+        self._expect_value = False
+        self._target = None    # bytearray the current string is collected into, or None to skip it
+        self._target_len = 0
+        self._len = 0
+        self._field = 0        # 1 - dateTime, 2 - summary
+        self._date_time_len = -1
+        self._summary_len = -1
+        self.done = False
+
+    def decode(self, stream):
+        """Reads the whole stream (anything with readinto() or read()) and returns the list of event tuples."""
+        self._reset()
+        buf = self.buf
+        readinto = getattr(stream, "readinto", None)
+        while not self.done:
+            if readinto is not None:
+                n = readinto(buf)
+            else:
+                data = stream.read(len(buf))
+                n = len(data)
+                buf[:n] = data
+            if not n:
+                break
+            self.feed(buf, n)
+        if self._depth != 0 and not self.done:
+            raise ValueError("Truncated calendar response")
+        return self.events[:self.count]
+
+    def feed(self, data, length=None):
+        """Feeds length bytes of data into the decoder. Returns False once enough events have been decoded."""
+        if length is None:
+            length = len(data)
+        i = 0
+        while i < length and not self.done:
+            c = data[i]
+            i += 1
+            if self._in_string:
+                if self._escape:
+                    self._feed_escape(c)
+                elif c == _QUOTE:
+                    self._end_string()
+                elif c == _BACKSLASH:
+                    self._escape = 1
+                else:
+                    self._append(c)
+            elif c == _QUOTE:
+                self._begin_string()
+            elif c == _COLON:
+                self._expect_value = True
+            elif c == _COMMA:
+                self._expect_value = False
+            elif c == _LBRACE or c == _LBRACKET:
+                self._depth += 1
+                if c == _LBRACE and self._depth == 2:
+                    self._date_time_len = -1
+                    self._summary_len = -1
+                self._expect_value = False
+            elif c == _RBRACE or c == _RBRACKET:
+                if self._depth == 0:
+                    raise ValueError("Unbalanced calendar response")
+                if c == _RBRACE and self._depth == 2:
+                    self._end_event()
+                self._depth -= 1
+                if self._depth == 0:
+                    self.done = True
+        return not self.done
+
+    def _begin_string(self):
+        self._in_string = True
+        self._len = 0
+        self._high_surrogate = 0
+        self._target = None
+        if self._depth != 2:
+            return
+        if not self._expect_value:
+            self._target = self._key
+            self._field = 0
+        elif self._field == 1:
+            self._target = self._date_time
+        elif self._field == 2:
+            self._target = self._summary
+        if self._target is not None:
+            self._target_len = len(self._target)
+
+    def _end_string(self):
+        self._in_string = False
+        target = self._target
+        if target is None:
+            return
+        if target is self._key:
+            if _equals(target, self._len, _KEY_DATE_TIME):
+                self._field = 1
+            elif _equals(target, self._len, _KEY_SUMMARY):
+                self._field = 2
+        elif target is self._date_time:
+            self._date_time_len = utf8_trim(target, self._len)
+        else:
+            self._summary_len = utf8_trim(target, self._len)
+        self._target = None
+
+    def _end_event(self):
+        if self._date_time_len < 0:
+            return
+        summary = ""
+        if self._summary_len > 0:
+            summary = bytes(memoryview(self._summary)[:self._summary_len]).decode()
+        day, month, hour, minute, flags = parse_date_time(self._date_time, self._date_time_len)
+        self.events[self.count] = (day, month, hour, minute, flags, summary)
+        self.count += 1
+        if self.count >= self.max_events:
+            self.done = True
+
+    def _append(self, c):
+        if self._target is not None and self._len < self._target_len:
+            self._target[self._len] = c
+            self._len += 1
+
+    def _append_code_point(self, cp):
+        if cp < 0x80:
+            self._append(cp)
+        elif cp < 0x800:
+            self._append(0xC0 | (cp >> 6))
+            self._append(0x80 | (cp & 0x3F))
+        elif cp < 0x10000:
+            self._append(0xE0 | (cp >> 12))
+            self._append(0x80 | ((cp >> 6) & 0x3F))
+            self._append(0x80 | (cp & 0x3F))
+        else:
+            self._append(0xF0 | (cp >> 18))
+            self._append(0x80 | ((cp >> 12) & 0x3F))
+            self._append(0x80 | ((cp >> 6) & 0x3F))
+            self._append(0x80 | (cp & 0x3F))
+
+    def _feed_escape(self, c):
+        if self._escape == 1:
+            if c == 0x75:  # u
+                self._escape = 2
+                self._code_point = 0
+                return
+            if c not in _SIMPLE_ESCAPES:
+                raise ValueError("Invalid escape in calendar response")
+            self._escape = 0
+            self._append(_SIMPLE_ESCAPES[c])
+            return
+        # \uXXXX
+        if 0x30 <= c <= 0x39:
+            digit = c - 0x30
+        elif 0x61 <= c <= 0x66:
+            digit = c - 0x57
+        elif 0x41 <= c <= 0x46:
+            digit = c - 0x37
+        else:
+            raise ValueError("Invalid unicode escape in calendar response")
+        self._code_point = (self._code_point << 4) | digit
+        self._escape += 1
+        if self._escape < 6:
+            return
+        self._escape = 0
+        cp = self._code_point
+        if 0xD800 <= cp < 0xDC00:
+            self._high_surrogate = cp
+            return
+        if 0xDC00 <= cp < 0xE000:
+            if not self._high_surrogate:
+                return
+            cp = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (cp - 0xDC00)
+        self._high_surrogate = 0
+        self._append_code_point(cp)
+
+
+def _read_exactly(stream, buf, length):
+    """Fills the first length bytes of buf from the stream; socket reads may return less than asked for."""
+    mv = memoryview(buf)
+    got = 0
+    while got < length:
+        n = stream.readinto(mv[got:length])
+        if not n:
+            raise ValueError("Truncated calendar response")
+        got += n
+
+
+class BinaryEventDecoder:
+    """Decoder for the compact binary calendar response.
+    Records are read one by one into preallocated buffers, no intermediate strings are created
+    besides the summaries themselves.
+    Keyword arguments:
+        max_events - events after this many are not decoded; reading stops early
+        max_summary_len - summaries are truncated to this many bytes (on a UTF-8 boundary)
+    Example:
+        decoder = BinaryEventDecoder(max_events=20, max_summary_len=64)
+        events = decoder.decode(response.raw)
+    """
+
+    def __init__(self, max_events=20, max_summary_len=64):
+        self.max_events = max_events
+        self.max_summary_len = max_summary_len
+        self.events = [None] * max_events
+        self._header = bytearray(6)
+        self._summary = bytearray(255)
+
+    def decode(self, stream):
+        header = self._header
+        _read_exactly(stream, header, 2)
+        version, count = struct.unpack_from("BB", header)
+        if version != BINARY_VERSION:
+            raise ValueError("Unsupported calendar response version")
+        count = min(count, self.max_events)
+        for i in range(count):
+            _read_exactly(stream, header, 6)
+            day, month, hour, minute, flags, length = struct.unpack_from("BBBBBB", header)
+            _read_exactly(stream, self._summary, length)
+            length = utf8_trim(self._summary, min(length, self.max_summary_len))
+            summary = bytes(memoryview(self._summary)[:length]).decode()
+            self.events[i] = (day, month, hour, minute, flags, summary)
+        return self.events[:count]
@@ -0,0 +1,299 @@
+"""Layout of the calendar screen.
+
+CalendarLayout turns the events into regions of draw ops with integer
+coordinates, render() replays them on a PicoGraphics display. Every string
+is measured once through TextMeasurer, summaries are word wrapped and
+ellipsized to the panel width and the rows are fitted to the panel height.
+
+A region is a (key, x, y, w, h, ops) tuple: the title bar, the date badge,
+one per event row and the footer. Regions do not overlap and their ops
+set the font, thickness and pen they need, so any of them can be redrawn
+on its own. signatures() and dirty_regions() compare two layouts, so a
+frame whose visible regions did not change needs no panel refresh.
+
+Ops are tuples:
+    (OP_PEN, pen)
+    (OP_FONT, name)
+    (OP_THICKNESS, thickness)
+    (OP_RECT, x, y, w, h)
+    (OP_TEXT, text, x, y, wordwrap, scale)
+"""
+import ubinascii
+from calendar_decoder import format_date_time, MONTH_NAMES, DAY, MONTH, SUMMARY
+
+OP_PEN, OP_FONT, OP_THICKNESS, OP_RECT, OP_TEXT = 0, 1, 2, 3, 4
+
+ELLIPSIS = "..."
+
+
+class DrawingSettings:
+    # Drawing constants
+    # BLACK, WHITE, GREEN, BLUE, RED, YELLOW, ORANGE, TAUPE = 0, 1, 2, 3, 4, 5, 6, 7
+    BACKGROUND_COLOR = 1
+
+    TITLE_TEXT = "Upcoming Events"
+    TITLE_FONT = "sans"
+    TITLE_FONT_SCALE = 14/10
+    TITLE_FONT_THICKNESS = 4
+    TITLE_RECTANGLE_HEIGHT = 75
+    TITLE_FONT_COLOR = 1
+    TITLE_BACKGROUND_COLOR = 2
+
+    TITLE_DATE_BACKGROUND_COLOR = 4
+    TITLE_DATE_BACKGROUND_WIDTH = 25/10 * TITLE_RECTANGLE_HEIGHT
+
+    DATE_BACKGROUND_COLOR = 4
+    DATE_BACKGROUND_WIDTH = 2.5 * TITLE_RECTANGLE_HEIGHT
+
+    EVENTS_FONT = "sans"
+    EVENTS_FONT_SCALE = 12/10
+    EVENTS_FONT_BASELINE = 10 * EVENTS_FONT_SCALE
+    EVENTS_FONT_DESCENDERS = 20 * EVENTS_FONT_SCALE
+    EVENTS_BASE_SPACING = 70
+    EVENTS_FONT_THICKNESS = 3
+    # Long summaries are wrapped onto this many lines, the last one is ellipsized
+    EVENTS_MAX_LINES = 2
+    EVENTS_LINE_SPACING = 40
+
+    EVENT_HIGHLIGHT_COLOR_TODAY = 4
+    EVENT_FONT_COLOR_DEFAULT = 0
+    EVENT_FONT_COLOR_TODAY = 1
+
+    # "Last updated" footer is rounded down to this many minutes so it does not
+    # force a panel refresh on every fetch; 0 hides the footer
+    LAST_UPDATED_GRANULARITY = 60
+    FOOTER_FONT = "bitmap8"
+    FOOTER_FONT_SCALE = 2
+    FOOTER_HEIGHT = 16
+
+
+class TextMeasurer:
+    """Caches display.measure_text() per font, scale and string.
+    The cache is dropped as a whole once it holds max_entries strings.
+    """
+
+    def __init__(self, display, max_entries=128):
+        self.display = display
+        self.max_entries = max_entries
+        self.font = None
+        self.cache = {}
+        # measure_text() calls that missed the cache
+        self.calls = 0
+
+    def set_font(self, font):
+        if font != self.font:
+            self.display.set_font(font)
+            self.font = font
+
+    def width(self, text, scale):
+        key = (self.font, scale, text)
+        w = self.cache.get(key)
+        if w is None:
+            if len(self.cache) >= self.max_entries:
+                self.cache = {}
+            w = self.display.measure_text(text, scale)
+            self.cache[key] = w
+            self.calls += 1
+        return w
+
+    def ellipsize(self, text, width, scale):
+        """Returns text if it fits width, otherwise its longest prefix that fits with an ellipsis appended."""
+        if self.width(text, scale) <= width:
+            return text
+        lo, hi = 0, len(text) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.width(text[:mid].rstrip() + ELLIPSIS, scale) <= width:
+                lo = mid
+            else:
+                hi = mid - 1
+        return text[:lo].rstrip() + ELLIPSIS
+
+    def wrap(self, text, width, scale, max_lines):
+        """Greedy word wrap of text into at most max_lines lines of width.
+        Whatever does not fit ends up ellipsized on the last line, so does a single word wider than a line.
+        """
+        words = text.split()
+        lines = []
+        start = 0
+        while start < len(words):
+            if len(lines) == max_lines - 1:
+                lines.append(self.ellipsize(" ".join(words[start:]), width, scale))
+                break
+            line = words[start]
+            end = start + 1
+            while end < len(words):
+                candidate = line + " " + words[end]
+                if self.width(candidate, scale) > width:
+                    break
+                line = candidate
+                end += 1
+            lines.append(self.ellipsize(line, width, scale))
+            start = end
+        return lines
+
+
+class CalendarLayout:
+    """Computes the draw regions of the calendar screen for a display of width x height pixels."""
+
+    def __init__(self, measurer, width, height, settings=DrawingSettings):
+        s = settings
+        self.settings = s
+        self.measurer = measurer
+        self.width = width
+        self.height = height
+        # Integer geometry, derived from the settings once
+        self.badge_x = int(width - s.DATE_BACKGROUND_WIDTH)
+        self.badge_w = width - self.badge_x
+        self.title_y = s.TITLE_RECTANGLE_HEIGHT // 2
+        self.row_above = int(2 * s.EVENTS_FONT_BASELINE)
+        self.row_h = int(2 * s.EVENTS_FONT_DESCENDERS)
+        self.row_below = self.row_h - self.row_above
+        # Events that did not fit on the panel in the last layout()
+        self.hidden = 0
+
+    def layout(self, events, now, last_updated=""):
+        """Returns the draw regions for events.
+        now is a utime.localtime() tuple, last_updated the footer text ("" hides the footer).
+        """
+        s = self.settings
+        m = self.measurer
+        width = self.width
+        title_h = s.TITLE_RECTANGLE_HEIGHT
+        regions = []
+
+        # Title bar with today's date on a badge at its right end
+        m.set_font(s.TITLE_FONT)
+        regions.append(("title", 0, 0, self.badge_x, title_h, (
+            (OP_FONT, s.TITLE_FONT),
+            (OP_THICKNESS, s.TITLE_FONT_THICKNESS),
+            (OP_PEN, s.TITLE_BACKGROUND_COLOR),
+            (OP_RECT, 0, 0, self.badge_x, title_h),
+            (OP_PEN, s.TITLE_FONT_COLOR),
+            (OP_TEXT, s.TITLE_TEXT, 0, self.title_y, self.badge_x, s.TITLE_FONT_SCALE),
+        )))
+        today = "{:02d} {}".format(now[2], MONTH_NAMES[now[1]])
+        text_len = m.width(today, s.TITLE_FONT_SCALE)
+        regions.append(("date", self.badge_x, 0, self.badge_w, title_h, (
+            (OP_FONT, s.TITLE_FONT),
+            (OP_THICKNESS, s.TITLE_FONT_THICKNESS),
+            (OP_PEN, s.DATE_BACKGROUND_COLOR),
+            (OP_RECT, self.badge_x, 0, self.badge_w, title_h),
+            (OP_PEN, s.TITLE_FONT_COLOR),
+            (OP_TEXT, today, self.badge_x + (self.badge_w - text_len) // 2, self.title_y, width, s.TITLE_FONT_SCALE),
+        )))
+
+        # Event rows, as many as fit above the footer
+        m.set_font(s.EVENTS_FONT)
+        scale = s.EVENTS_FONT_SCALE
+        spacing = s.EVENTS_LINE_SPACING
+        bottom = self.height - s.FOOTER_HEIGHT if last_updated else self.height
+        y = title_h + s.EVENTS_BASE_SPACING
+        shown = 0
+        for event in events:
+            if y + self.row_below > bottom:
+                break
+            prefix = format_date_time(event) + " "
+            indent = m.width(prefix, scale)
+            max_lines = min(s.EVENTS_MAX_LINES, 1 + (bottom - y - self.row_below) // spacing)
+            lines = m.wrap(event[SUMMARY], width - indent, scale, max_lines) or ("",)
+            # The row owns the whole slot down to the next row, spacing included
+            top = y - self.row_above
+            h = s.EVENTS_BASE_SPACING + (len(lines) - 1) * spacing
+            ops = [(OP_FONT, s.EVENTS_FONT), (OP_THICKNESS, s.EVENTS_FONT_THICKNESS)]
+            if event[DAY] == now[2] and event[MONTH] == now[1]:
+                ops.append((OP_PEN, s.EVENT_HIGHLIGHT_COLOR_TODAY))
+                ops.append((OP_RECT, 0, top, width, self.row_h + (len(lines) - 1) * spacing))
+                ops.append((OP_PEN, s.EVENT_FONT_COLOR_TODAY))
+            else:
+                ops.append((OP_PEN, s.EVENT_FONT_COLOR_DEFAULT))
+            ops.append((OP_TEXT, prefix, 0, y, width, scale))
+            for line in lines:
+                if line:
+                    ops.append((OP_TEXT, line, indent, y, width - indent, scale))
+                y += spacing
+            y += s.EVENTS_BASE_SPACING - spacing
+            regions.append(("row{}".format(shown), 0, top, width, min(h, bottom - top), ops))
+            shown += 1
+        self.hidden = len(events) - shown
+
+        if last_updated:
+            m.set_font(s.FOOTER_FONT)
+            text_len = m.width(last_updated, s.FOOTER_FONT_SCALE)
+            regions.append(("footer", 0, bottom, width, s.FOOTER_HEIGHT, (
+                (OP_FONT, s.FOOTER_FONT),
+                (OP_PEN, s.EVENT_FONT_COLOR_DEFAULT),
+                (OP_TEXT, last_updated, width - text_len, bottom, width, s.FOOTER_FONT_SCALE),
+            )))
+        return regions
+
+
+def signatures(regions):
+    """Returns {key: [x, y, w, h, crc of the ops]} of regions, small enough to be persisted as JSON."""
+    sigs = {}
+    for key, x, y, w, h, ops in regions:
+        sigs[key] = [x, y, w, h, ubinascii.crc32(repr(ops).encode())]
+    return sigs
+
+
+def dirty_regions(old, new):
+    """Compares the signatures of two layouts.
+    Returns the keys of the regions of new that have to be redrawn, and the rectangles that
+    have to be cleared first: those regions and whatever old regions they no longer cover.
+    """
+    keys = []
+    rects = []
+    for key, sig in new.items():
+        prev = old.get(key)
+        if prev != sig:
+            keys.append(key)
+            rects.append(sig[:4])
+            if prev is not None and prev[:4] != sig[:4]:
+                rects.append(prev[:4])
+    for key, prev in old.items():
+        if key not in new:
+            rects.append(prev[:4])
+    return keys, rects
+
+
+class _Renderer:
+    """Replays ops on a display, skipping state changes that would not change anything."""
+
+    def __init__(self, display):
+        self.display = display
+        self.pen = None
+        self.font = None
+        self.thickness = None
+
+    def set_pen(self, pen):
+        if pen != self.pen:
+            self.display.set_pen(pen)
+            self.pen = pen
+
+    def replay(self, ops):
+        display = self.display
+        for op in ops:
+            code = op[0]
+            if code == OP_TEXT:
+                display.text(op[1], op[2], op[3], op[4], op[5])
+            elif code == OP_PEN:
+                self.set_pen(op[1])
+            elif code == OP_RECT:
+                display.rectangle(op[1], op[2], op[3], op[4])
+            elif code == OP_FONT:
+                if op[1] != self.font:
+                    display.set_font(op[1])
+                    self.font = op[1]
+            elif code == OP_THICKNESS:
+                if op[1] != self.thickness:
+                    display.set_thickness(op[1])
+                    self.thickness = op[1]
+
+
+def render(display, regions, background=DrawingSettings.BACKGROUND_COLOR):
+    """Clears the framebuffer and draws all regions."""
+    r = _Renderer(display)
+    r.set_pen(background)
+    display.clear()
+    for region in regions:
+        r.replay(region[5])
@@ -1,37 +1,28 @@
 import utime
+import ujson
+import uhashlib
+import ubinascii
 import requests
+from calendar_decoder import EventStreamDecoder, BinaryEventDecoder, BINARY_CONTENT_TYPE, format_date_time, MONTH_NAMES, SUMMARY
+from calendar_layout import DrawingSettings, TextMeasurer, CalendarLayout, render, signatures, dirty_regions
 
 class AppUpdateError(Exception):
     """Exception raised when there is an error updating the calendar."""
     pass
 
-class DrawingSettings:
-    # Drawing constants
-    # BLACK, WHITE, GREEN, BLUE, RED, YELLOW, ORANGE, TAUPE = 0, 1, 2, 3, 4, 5, 6, 7
-    TITLE_FONT_SCALE = 14/10
-    TITLE_FONT_THICKNESS = 4
-    TITLE_RECTANGLE_HEIGHT = 75
-    TITLE_FONT_COLOR = 1
-    TITLE_BACKGROUND_COLOR = 2
+def _header(response, name):
+    """Case-insensitive lookup of a response header, returns an empty string if it is missing."""
+    name = name.lower()
+    for key, value in response.headers.items():
+        if key.lower() == name:
+            return value
+    return ""
 
-    TITLE_DATE_BACKGROUND_COLOR = 4
-    TITLE_DATE_BACKGROUND_WIDTH = 25/10 * TITLE_RECTANGLE_HEIGHT
-
-    DATE_BACKGROUND_COLOR = 4
-    DATE_BACKGROUND_WIDTH = 2.5 * TITLE_RECTANGLE_HEIGHT
-
-    EVENTS_FONT_SCALE = 12/10
-    EVENTS_FONT_BASELINE = 10 * EVENTS_FONT_SCALE
-    EVENTS_FONT_DESCENDERS = 20 * EVENTS_FONT_SCALE
-    EVENTS_BASE_SPACING = 70
-    EVENTS_FONT_THICKNESS = 3
-
-    EVENT_HIGHLIGHT_COLOR_TODAY = 4
-    EVENT_FONT_COLOR_DEFAULT = 0
-    EVENT_FONT_COLOR_TODAY = 1
-    
 
 class InkyApp:
+    CACHE_FILE = "/calendar_cache.json"
+    RENDER_STATE_FILE = "/render_state.json"
+
     def __init__(self):
         self.api_auth_header = ""
         self.api_auth_key = ""
@@ -40,8 +31,19 @@ class InkyApp:
         self.calendar_api_path = "/calendars"
         self.calendar_name = "Personal"
         self.num_cal_events = 5
-        self.calendar_events = []
-        self.last_update = 0
+        self.max_events = 20  # upper bound of decoded events, whatever num_cal_events is
+        self.max_summary_len = 64  # in bytes
+        self.use_binary_format = True  # ask the API for the compact binary events format
+        self.cache_max_age = None  # in seconds, how old a server-side cached response may be; None leaves it to the server
+        self.calendar_events = []  # list of (day, month, hour, minute, flags, summary) tuples
+        self.last_update = 0  # when the events were last fetched or revalidated
+        self.last_modified = 0  # when the events last changed, shown in the footer
+        self.etag = None
+        self.render_fingerprint = None
+        self.refreshes_performed = 0
+        self.refreshes_skipped = 0
+        self.rendered_regions = {}  # signatures of the regions on the panel, see calendar_layout
+        self.layout = None
 
     def set_api_info(self, api_auth_header, api_auth_key, api_url):
         print("Setting API info...")
@@ -50,78 +52,180 @@ class InkyApp:
         self.api_url = api_url
 
     def update(self):
+        """Fetches the events. Returns False when the server confirmed the cached events are still current."""
         print("Updating calendar...")
         request_address = None
 
         request_address = self.api_url + self.calendar_api_path + "/" + self.calendar_name + "?num-events=" + str(self.num_cal_events)
 
         headers = {self.api_auth_header: self.api_auth_key, "Content-Type": "application/json"}
+        if self.use_binary_format:
+            headers["Accept"] = BINARY_CONTENT_TYPE + ", application/json"
+        if self.cache_max_age is not None:
+            headers["Cache-Control"] = "max-age=" + str(self.cache_max_age)
+        if self.etag and self.calendar_events:
+            headers["If-None-Match"] = self.etag
         response = None
         response = requests.get(request_address, headers=headers)
+        if response.status_code == 304:
+            # Nothing to parse or redraw, the cached events are confirmed to be current
+            print("Calendar not modified")
+            response.close()
+            self.last_update = utime.time()
+            self.save_cache()
+            return False
         if response.status_code != 200:
             print("Failed to update calendar", response.status_code)
             response.raise_for_status()
         try:
-            self.calendar_events = response.json()
-        except IOError as e:
+            # Older API deployments ignore the Accept header and keep sending JSON
+            if _header(response, "Content-Type").startswith(BINARY_CONTENT_TYPE):
+                decoder = BinaryEventDecoder(self.max_events, self.max_summary_len)
+            else:
+                decoder = EventStreamDecoder(self.max_events, self.max_summary_len)
+            self.calendar_events = decoder.decode(response.raw)
+        except (IOError, ValueError) as e:
             raise AppUpdateError("Failed to update calendar", e)
         finally:
             response.close() 
-
-    def draw(self, display):
+        self.etag = _header(response, "ETag") or None
+        self.last_update = utime.time()
+        self.last_modified = self.last_update
+        self.save_cache()
+        return True
+
+    def _cache_key(self):
+        # The version prefix invalidates caches written with a different event layout
+        return "v3/" + self.calendar_name + "/" + str(self.num_cal_events)
+
+    def load_cache(self):
+        """Restores the last fetched events from flash; returns False if there is no usable cache."""
+        try:
+            with open(self.CACHE_FILE, "r") as f:
+                data = ujson.loads(f.read())
+        except (OSError, ValueError):
+            return False
+        if type(data) is not dict or data.get("key") != self._cache_key():
+            return False
+        self.calendar_events = data.get("events", [])
+        self.last_update = data.get("fetched_at", 0)
+        self.last_modified = data.get("modified_at", self.last_update)
+        self.etag = data.get("etag")
+        return True
+
+    def save_cache(self):
+        data = {
+            "key": self._cache_key(),
+            "events": self.calendar_events,
+            "fetched_at": self.last_update,
+            "modified_at": self.last_modified,
+            "etag": self.etag,
+        }
+        try:
+            with open(self.CACHE_FILE, "w") as f:
+                f.write(ujson.dumps(data))
+        except OSError as e:
+            print("Failed to save calendar cache", e)
+
+    def is_cache_fresh(self, now=None):
+        """True when the cached events were fetched less than update_interval minutes ago."""
+        if not self.calendar_events or not self.last_update:
+            return False
+        if now is None:
+            now = utime.time()
+        age = now - self.last_update
+        # A negative age means the clock went backwards; do not trust the cache then
+        return 0 <= age < self.update_interval * 60
+
+    def load_render_state(self):
+        try:
+            with open(self.RENDER_STATE_FILE, "r") as f:
+                data = ujson.loads(f.read())
+        except (OSError, ValueError):
+            return
+        if type(data) is dict:
+            self.render_fingerprint = data.get("fingerprint")
+            self.refreshes_performed = data.get("performed", 0)
+            self.refreshes_skipped = data.get("skipped", 0)
+            self.rendered_regions = data.get("regions") or {}
+
+    def save_render_state(self):
+        data = {
+            "fingerprint": self.render_fingerprint,
+            "performed": self.refreshes_performed,
+            "skipped": self.refreshes_skipped,
+            "regions": self.rendered_regions,
+        }
+        try:
+            with open(self.RENDER_STATE_FILE, "w") as f:
+                f.write(ujson.dumps(data))
+        except OSError as e:
+            print("Failed to save render state", e)
+
+    def _fingerprint(self, today, last_updated):
+        """Hashes everything that ends up on the panel: the normalized events, today's date and the footer."""
+        h = uhashlib.sha256()
+        for event in self.calendar_events:
+            h.update(format_date_time(event).encode())
+            h.update(b"\x1f")
+            h.update(event[SUMMARY].strip().encode())
+            h.update(b"\x1e")
+        h.update(today.encode())
+        h.update(b"\x1e")
+        h.update(last_updated.encode())
+        return ubinascii.hexlify(h.digest()).decode()
+
+    def draw(self, display, force=False):
+        """Draws the calendar and refreshes the panel, unless the rendered content is identical to the last frame.
+        Returns True if the panel was refreshed.
+        """
         print("Drawing calendar...")
         # check if self.calendar_events is not empty; otherwise raise exception
         if not self.calendar_events:
             raise AppUpdateError("Calendar events list is empty")
-        display.set_pen(1)
-        display.clear()
-        display.set_font("sans")
-        WIDTH, HEIGHT = display.get_bounds()
 
         current_time = utime.time()
-        month_names = ["", "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
-        
-        display.set_pen(DrawingSettings.TITLE_BACKGROUND_COLOR)
-        display.rectangle(0, 0, WIDTH, DrawingSettings.TITLE_RECTANGLE_HEIGHT)
-        display.set_pen(DrawingSettings.TITLE_FONT_COLOR)
-        display.set_thickness(DrawingSettings.TITLE_FONT_THICKNESS)
-        title_text = "Upcoming Events"
-
-        display.text(title_text, 0, int(DrawingSettings.TITLE_RECTANGLE_HEIGHT / 2), WIDTH, DrawingSettings.TITLE_FONT_SCALE)
-        
-        today = "{:02d} {}".format(utime.localtime(current_time)[2], month_names[utime.localtime(current_time)[1]])  # format today's date as 'dd MMM
-        text_len = display.measure_text(today, DrawingSettings.TITLE_FONT_SCALE)
-        display.set_pen(DrawingSettings.DATE_BACKGROUND_COLOR)
-        display.rectangle(int(WIDTH - DrawingSettings.DATE_BACKGROUND_WIDTH), 0, int(DrawingSettings.DATE_BACKGROUND_WIDTH), DrawingSettings.TITLE_RECTANGLE_HEIGHT)
-        display.set_pen(DrawingSettings.TITLE_FONT_COLOR)
-        display.text(today, int(WIDTH - DrawingSettings.DATE_BACKGROUND_WIDTH + (DrawingSettings.DATE_BACKGROUND_WIDTH - text_len) / 2), int(DrawingSettings.TITLE_RECTANGLE_HEIGHT / 2), WIDTH, DrawingSettings.TITLE_FONT_SCALE)
-
-        display.set_pen(DrawingSettings.TITLE_FONT_COLOR)
-        display.rectangle(0, DrawingSettings.TITLE_RECTANGLE_HEIGHT, WIDTH, HEIGHT)    
-        
-
-        today = "{:02d}.{}".format(utime.localtime(current_time)[2], month_names[utime.localtime(current_time)[1]])  # format today's date as 'dd MMM'
-        line_num = 1
-        display.set_thickness(DrawingSettings.EVENTS_FONT_THICKNESS)
-        for i in self.calendar_events:
-            event_date = i['dateTime'].split(".")[0]+"."+i['dateTime'].split(".")[1]  # get the date part of 'dateTime'
-            if event_date == today:
-                display.set_pen(DrawingSettings.EVENT_HIGHLIGHT_COLOR_TODAY)
-                display.rectangle(0, int(DrawingSettings.EVENTS_BASE_SPACING * line_num + DrawingSettings.TITLE_RECTANGLE_HEIGHT - 2*DrawingSettings.EVENTS_FONT_BASELINE), WIDTH, int(2*DrawingSettings.EVENTS_FONT_DESCENDERS) )
-                display.set_pen(DrawingSettings.EVENT_FONT_COLOR_TODAY)
-                display.text(i['dateTime']+" "+i['summary'], 0, int(DrawingSettings.EVENTS_BASE_SPACING * line_num + DrawingSettings.TITLE_RECTANGLE_HEIGHT), WIDTH, DrawingSettings.EVENTS_FONT_SCALE)
-                line_num += 1
-            else:
-                display.set_pen(DrawingSettings.EVENT_FONT_COLOR_DEFAULT)
-                display.text(i['dateTime']+" "+i['summary'], 0, int(DrawingSettings.EVENTS_BASE_SPACING * line_num + DrawingSettings.TITLE_RECTANGLE_HEIGHT), WIDTH, DrawingSettings.EVENTS_FONT_SCALE)
-                line_num += 1
-        
-        display.set_font("bitmap8")
-        display.set_pen(DrawingSettings.EVENT_FONT_COLOR_DEFAULT)
-        last_updated = "Last updated: "+"{:02d} {}, {:02d}:{:02d}".format(utime.localtime(current_time)[2], month_names[utime.localtime(current_time)[1]], utime.localtime(current_time)[3], utime.localtime(current_time)[4])
-        last_updated_len = display.measure_text(text=last_updated, scale=2)
-        display.text(last_updated, WIDTH-last_updated_len, HEIGHT - 16, scale=2)
-        
+        now = utime.localtime(current_time)
+
+        last_updated = ""
+        if DrawingSettings.LAST_UPDATED_GRANULARITY:
+            last_update = self.last_modified or current_time
+            last_update -= last_update % (DrawingSettings.LAST_UPDATED_GRANULARITY * 60)
+            t = utime.localtime(last_update)
+            last_updated = "Last updated: {:02d} {}, {:02d}:{:02d}".format(t[2], MONTH_NAMES[t[1]], t[3], t[4])
+
+        self.load_render_state()
+        fingerprint = self._fingerprint("{:02d}.{:02d}.{:02d}".format(*now[:3]), last_updated)
+        if fingerprint == self.render_fingerprint and not force:
+            self.refreshes_skipped += 1
+            self.save_render_state()
+            print("Screen content unchanged, skipping refresh ({} skipped, {} performed)".format(self.refreshes_skipped, self.refreshes_performed))
+            return False
+
+        if self.layout is None or self.layout.measurer.display is not display:
+            WIDTH, HEIGHT = display.get_bounds()
+            self.layout = CalendarLayout(TextMeasurer(display), WIDTH, HEIGHT)
+        regions = self.layout.layout(self.calendar_events, now, last_updated)
+        if self.layout.hidden:
+            print("{} events did not fit on the screen".format(self.layout.hidden))
+        drawn = signatures(regions)
+        _, rects = dirty_regions(self.rendered_regions, drawn)
+        if not rects and not force:
+            # Only something that did not make it onto the screen has changed
+            self.render_fingerprint = fingerprint
+            self.refreshes_skipped += 1
+            self.save_render_state()
+            print("Screen content unchanged, skipping refresh ({} skipped, {} performed)".format(self.refreshes_skipped, self.refreshes_performed))
+            return False
+
+        # The framebuffer does not survive deep sleep and the panel has no partial refresh,
+        # so a changed frame is always drawn and refreshed as a whole
+        render(display, regions)
         display.update()
+        self.rendered_regions = drawn
+        self.render_fingerprint = fingerprint
+        self.refreshes_performed += 1
+        self.save_render_state()
+        return True
 
 
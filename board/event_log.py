@@ -0,0 +1,149 @@
+"""Buffered binary event log on the SD card.
+
+EventLog keeps fixed-size records in a RAM ring buffer and writes them out
+with one flush() per wake (and right away for errors), instead of opening,
+appending and closing a text file per message. A record is 16 bytes,
+little-endian:
+    time (I, seconds), level (B), code (B), arg (h, e.g. an errno or HTTP status), payload (8s)
+Records hold utime.ticks_ms() until flush() turns it into RTC time, so
+records logged before the RTC is loaded get the right timestamp too.
+
+The log is made of segments (at least 2) files, <path>.0.bin (newest) to
+<path>.<segments - 1>.bin (oldest); when the newest reaches segment_size
+they are rotated and the oldest is dropped. While path is None (the SD card
+is not mounted) flush() parks the records in PENDING_FILE on flash; the next
+flush to the SD card moves them over, see pending_records. decode() reads the
+records back.
+"""
+import struct
+import uos
+import utime
+import pending_records
+
+RECORD = "<IBBh8s"
+RECORD_SIZE = struct.calcsize(RECORD)
+PAYLOAD_SIZE = 8
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+CODE_BOOT, CODE_FAST_PATH, CODE_SD_MOUNT, CODE_SECRETS, CODE_WIFI, CODE_TIME_SYNC, CODE_UPDATE, CODE_DRAW, CODE_SLEEP, CODE_DROPPED = range(10)
+CODE_NAMES = ("boot", "fast path", "sd mount", "secrets", "wifi", "time sync", "update", "draw", "sleep", "dropped")
+
+PENDING_FILE = "/events-pending.bin"
+
+
+def error_arg(e):
+    """The errno (or first int argument) of an exception, 0 if it has none."""
+    if e.args and isinstance(e.args[0], int):
+        return max(-32768, min(e.args[0], 32767))
+    return 0
+
+
+class EventLog:
+    def __init__(self, path=None, capacity=32, segment_size=16384, segments=4, level=INFO):
+        self.path = path
+        self.capacity = capacity
+        self.segment_size = segment_size
+        self.segments = segments
+        self.level = level
+        self.buffer = bytearray(capacity * RECORD_SIZE)
+        # Index of the oldest record and number of records in the buffer
+        self.first = 0
+        self.count = 0
+        self.dropped = 0
+
+    def log(self, level, code, arg=0, payload=b""):
+        if level < self.level:
+            return
+        if isinstance(payload, str):
+            payload = payload.encode()
+        if self.count == self.capacity:
+            # Full: the oldest record makes room
+            self.first = (self.first + 1) % self.capacity
+            self.count -= 1
+            self.dropped += 1
+        index = (self.first + self.count) % self.capacity
+        struct.pack_into(RECORD, self.buffer, index * RECORD_SIZE, utime.ticks_ms() & 0xFFFFFFFF,
+                         level, code, arg, payload[:PAYLOAD_SIZE])
+        self.count += 1
+        if level >= ERROR:
+            self.flush()
+
+    def debug(self, code, arg=0, payload=b""):
+        self.log(DEBUG, code, arg, payload)
+
+    def info(self, code, arg=0, payload=b""):
+        self.log(INFO, code, arg, payload)
+
+    def warning(self, code, arg=0, payload=b""):
+        self.log(WARNING, code, arg, payload)
+
+    def error(self, code, arg=0, payload=b""):
+        self.log(ERROR, code, arg, payload)
+
+    def _records(self):
+        """The buffered records, oldest first, with RTC timestamps.
+        Records dropped on overflow are counted by a CODE_DROPPED record in
+        their place, right before the oldest record that was kept.
+        """
+        gap = 1 if self.dropped else 0
+        data = bytearray((gap + self.count) * RECORD_SIZE)
+        for n in range(self.count):
+            offset = ((self.first + n) % self.capacity) * RECORD_SIZE
+            data[(gap + n) * RECORD_SIZE:(gap + n + 1) * RECORD_SIZE] = self.buffer[offset:offset + RECORD_SIZE]
+        if gap:
+            # Logged no later than the oldest record kept
+            logged = struct.unpack_from("<I", data, RECORD_SIZE)[0]
+            struct.pack_into(RECORD, data, 0, logged, WARNING, CODE_DROPPED, min(self.dropped, 32767), b"")
+            self.dropped = 0
+        now, ticks = utime.time(), utime.ticks_ms()
+        for offset in range(0, len(data), RECORD_SIZE):
+            logged = struct.unpack_from("<I", data, offset)[0]
+            age = utime.ticks_diff(ticks, logged) // 1000
+            struct.pack_into("<I", data, offset, max(0, now - age))
+        return data
+
+    def flush(self):
+        """Writes the buffered records out with a single append, see the module docstring."""
+        if not self.count:
+            return
+        data = self._records()
+        self.first = self.count = 0
+        try:
+            if self.path is None:
+                pending_records.park(PENDING_FILE, data)
+                return
+            segment = self.segment(0)
+            size = pending_records.file_size(segment) + pending_records.file_size(PENDING_FILE)
+            if size + len(data) > self.segment_size:
+                self.rotate()
+            pending_records.append(segment, data, PENDING_FILE)
+        except OSError as e:
+            print("Failed to write the event log", e)
+
+    def segment(self, n):
+        return "{}.{}.bin".format(self.path, n)
+
+    def rotate(self):
+        """Drops the oldest segment and shifts the others up, segment 0 starts empty."""
+        for n in range(self.segments - 1, 0, -1):
+            try:
+                if n == self.segments - 1:
+                    uos.remove(self.segment(n))
+            except OSError:
+                pass
+            try:
+                uos.rename(self.segment(n - 1), self.segment(n))
+            except OSError:
+                pass
+
+
+def decode(data):
+    """Yields (time, level, code, arg, payload) for the records in data."""
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        secs, level, code, arg, payload = struct.unpack_from(RECORD, data, offset)
+        yield secs, level, code, arg, payload.rstrip(b"\0")
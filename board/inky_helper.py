@@ -4,6 +4,7 @@ from machine import Pin, SPI, lightsleep
 import time
 import inky_frame # https://github.com/pimoroni/pimoroni-pico/blob/main/micropython/modules_py/inky_frame.py
 import ujson
+import ubinascii
 from network import WLAN, STA_IF
 import os
 import sdcard
@@ -140,33 +141,204 @@ def battery_sleep(minutes):
 ###############
 
 ### NETWORK ###
-def network_connect(SSID, PSK):
+# WLAN.status() codes
+STAT_IDLE = 0              # no connection and no activity
+STAT_CONNECTING = 1        # connecting in progress
+STAT_WRONG_PASSWORD = -3   # failed due to incorrect password
+STAT_NO_AP_FOUND = -2      # failed because no access point replied
+STAT_CONNECT_FAIL = -1     # failed due to other problems
+STAT_GOT_IP = 3            # connection successful
+
+# Retrying cannot fix these, so there is no point in waiting for the deadline
+TERMINAL_WIFI_STATUSES = (STAT_WRONG_PASSWORD, STAT_NO_AP_FOUND)
+
+WIFI_CONNECT_TIMEOUT_MS = 30000
+WIFI_POLL_INTERVAL_MS = 100
+WIFI_RETRY_BACKOFF_MS = 500
+
+# Fast reconnect: the BSSID and DHCP lease of the last successful join are kept in flash,
+# so after a deep sleep the board can do a directed join with a static configuration
+WIFI_CACHE_FILE = "/wifi_cache.json"
+WIFI_CACHE_MAX_FAILURES = 3
+WIFI_CACHE_MAX_AGE = 24 * 60 * 60  # seconds, refresh the lease from DHCP at least once a day
+WIFI_WARM_TIMEOUT_MS = 3000
+
+# Milliseconds it took to get an IP address on the last successful connect
+last_connect_ms = None
+_connect_started = 0
+_attempt_started = 0
+_retry_backoff_ms = WIFI_RETRY_BACKOFF_MS
+# BSSID the current attempt is directed to, None for a full join
+_attempt_bssid = None
+_warm_cache = None
+_wifi_cache_failures = 0
+
+def _read_wifi_cache(SSID):
+    """Returns the WiFi cache record for SSID if it is younger than WIFI_CACHE_MAX_AGE, otherwise None."""
+    try:
+        with open(WIFI_CACHE_FILE, "r") as f:
+            data = ujson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if type(data) is not dict or data.get("ssid") != SSID:
+        return None
+    age = time.time() - data.get("saved_at", 0)
+    if age < 0 or age >= WIFI_CACHE_MAX_AGE:
+        return None
+    return data
+
+def _write_wifi_cache(data):
+    try:
+        with open(WIFI_CACHE_FILE, "w") as f:
+            f.write(ujson.dumps(data))
+    except OSError as e:
+        print("Failed to save the WiFi cache", e)
+
+def save_wifi_cache(wlan, SSID, failures=0):
+    """Stores the BSSID, channel and DHCP lease of the current connection."""
+    # The access point's BSSID is only reported by a scan; this runs after a full join only
+    best = None
+    for ssid, bssid, channel, rssi, security, hidden in wlan.scan():
+        if ssid.decode() == SSID and (best is None or rssi > best[2]):
+            best = (bssid, channel, rssi)
+    if best is None:
+        print("Could not find the access point in the scan results, the WiFi cache is not saved")
+        return
+    _write_wifi_cache({
+        "ssid": SSID,
+        "bssid": ubinascii.hexlify(best[0]).decode(),
+        "channel": best[1],
+        "ifconfig": list(wlan.ifconfig()),
+        "saved_at": time.time(),
+        "failures": failures,
+    })
+
+def _record_warm_failure(cache):
+    global _wifi_cache_failures
+    cache["failures"] = cache.get("failures", 0) + 1
+    _wifi_cache_failures = cache["failures"]
+    if cache["failures"] >= WIFI_CACHE_MAX_FAILURES:
+        # The record is kept, so the fast reconnect stays disabled until it ages out
+        print("Fast reconnect failed {} times, invalidating the WiFi cache".format(cache["failures"]))
+    _write_wifi_cache(cache)
+
+def _join(wlan, SSID, PSK, cache=None):
+    global _attempt_started, _retry_backoff_ms, _attempt_bssid
+    _attempt_started = time.ticks_ms()
+    _retry_backoff_ms = WIFI_RETRY_BACKOFF_MS
+    if cache is None:
+        _attempt_bssid = None
+        wlan.connect(SSID, PSK)
+    else:
+        print("Reconnecting to {} on channel {} with a static IP {}".format(cache["bssid"], cache["channel"], cache["ifconfig"][0]))
+        _attempt_bssid = ubinascii.unhexlify(cache["bssid"])
+        wlan.ifconfig(tuple(cache["ifconfig"]))
+        wlan.connect(SSID, PSK, bssid=_attempt_bssid)
+
+def network_begin(SSID, PSK, wlan=None):
+    """Starts joining the WiFi network and returns the WLAN interface without waiting for the connection.
+    A directed reconnect from the WiFi cache is tried first, when there is one.
+    """
+    global _connect_started, _warm_cache, _wifi_cache_failures
     print("Attempting to connect the WiFi network", SSID)
     # Turn on the WiFi LED
     led_wifi.on()
-    
-    wlan = WLAN(STA_IF)
+
+    if wlan is None:
+        wlan = WLAN(STA_IF)
     wlan.active(True)    
     wlan.config(pm=0xa11140)  # Turn WiFi power saving off for some slow APs
 
-    # Wait for the WiFi to connect
-    wlan.connect(SSID, PSK)
-    max_wait_wifi = 15
-    while max_wait_wifi > 0:
-        if wlan.isconnected():
-            print("Connected to the WiFi network", SSID)
-            time.sleep(5) # sometimes, well... sometimes it just helps to wait a little longer
-            return  
-        max_wait_wifi -= 1
-        time.sleep(5)                 
-    led_wifi.off()
-    raise InkyHelperError("Failed to connect to the WiFi network", SSID)
-    # 0   STAT_IDLE -- no connection and no activity,
-    # 1   STAT_CONNECTING -- connecting in progress,
-    # -3  STAT_WRONG_PASSWORD -- failed due to incorrect password,
-    # -2  STAT_NO_AP_FOUND -- failed because no access point replied,
-    # -1  STAT_CONNECT_FAIL -- failed due to other problems,
-    # 3   STAT_GOT_IP -- connection successful.
+    _connect_started = time.ticks_ms()
+    cache = _read_wifi_cache(SSID)
+    _wifi_cache_failures = cache.get("failures", 0) if cache else 0
+    _warm_cache = cache if _wifi_cache_failures < WIFI_CACHE_MAX_FAILURES else None
+    _join(wlan, SSID, PSK, _warm_cache)
+    return wlan
+
+def _poll_connection(wlan, SSID, PSK, timeout_ms):
+    """Checks the connection once.
+    Returns None when an IP is assigned, otherwise the number of milliseconds to wait before the next poll.
+    Raises InkyHelperError on a terminal status or when the attempt's deadline has passed.
+    """
+    global last_connect_ms, _retry_backoff_ms
+    elapsed = time.ticks_diff(time.ticks_ms(), _attempt_started)
+    status = wlan.status()
+    if status == STAT_GOT_IP or wlan.isconnected():
+        last_connect_ms = time.ticks_diff(time.ticks_ms(), _connect_started)
+        print("Connected to the WiFi network {} in {} ms".format(SSID, last_connect_ms))
+        return None
+    if status in TERMINAL_WIFI_STATUSES or elapsed >= timeout_ms:
+        led_wifi.off()
+        raise InkyHelperError("Failed to connect to the WiFi network", SSID, status)
+    if status == STAT_CONNECT_FAIL:
+        # A transient failure: associate again and give it a growing amount of time before the next check
+        print("WiFi connection failed, retrying in {} ms".format(_retry_backoff_ms))
+        if _attempt_bssid is None:
+            wlan.connect(SSID, PSK)
+        else:
+            # Still the directed join of the fast reconnect, the static IP config is kept as well
+            wlan.connect(SSID, PSK, bssid=_attempt_bssid)
+        delay = min(_retry_backoff_ms, timeout_ms - elapsed)
+        _retry_backoff_ms *= 2
+        return delay
+    return WIFI_POLL_INTERVAL_MS
+
+def _connect_steps(wlan, SSID, PSK, timeout_ms):
+    """Drives the connection started by network_begin, yields the number of milliseconds to wait between polls."""
+    global _warm_cache
+    cache = _warm_cache
+    _warm_cache = None
+    if cache is not None:
+        try:
+            while True:
+                delay = _poll_connection(wlan, SSID, PSK, WIFI_WARM_TIMEOUT_MS)
+                if delay is None:
+                    break
+                yield delay
+        except InkyHelperError:
+            print("Fast reconnect failed, falling back to a full join")
+            _record_warm_failure(cache)
+            led_wifi.on()
+            wlan.disconnect()
+            wlan.ifconfig("dhcp")
+            _join(wlan, SSID, PSK)
+        else:
+            if cache.get("failures"):
+                cache["failures"] = 0
+                _write_wifi_cache(cache)
+            return
+    while True:
+        delay = _poll_connection(wlan, SSID, PSK, timeout_ms)
+        if delay is None:
+            break
+        yield delay
+    if _wifi_cache_failures >= WIFI_CACHE_MAX_FAILURES:
+        return
+    try:
+        # Failures of the fast reconnect are carried over, only a successful one resets them
+        save_wifi_cache(wlan, SSID, _wifi_cache_failures)
+    except Exception as e:
+        print("Failed to save the WiFi cache", e)
+
+def network_wait(wlan, SSID, PSK, timeout_ms=WIFI_CONNECT_TIMEOUT_MS):
+    """Blocks until the connection started by network_begin has an IP address."""
+    for delay in _connect_steps(wlan, SSID, PSK, timeout_ms):
+        time.sleep_ms(delay)
+    return wlan
+
+def network_connect(SSID, PSK, timeout_ms=WIFI_CONNECT_TIMEOUT_MS, wlan=None):
+    return network_wait(network_begin(SSID, PSK, wlan), SSID, PSK, timeout_ms)
+
+async def network_connect_async(SSID, PSK, timeout_ms=WIFI_CONNECT_TIMEOUT_MS, wlan=None):
+    """Like network_connect, but sleeps in uasyncio between the polls.
+    Other tasks of the event loop, e.g. a tinyweb server, keep running while the radio associates.
+    """
+    import uasyncio as asyncio
+    wlan = network_begin(SSID, PSK, wlan)
+    for delay in _connect_steps(wlan, SSID, PSK, timeout_ms):
+        await asyncio.sleep_ms(delay)
+    return wlan
 
 
 def network_disconnect():
@@ -213,11 +385,6 @@ def launch_app(app_name):
 
 ######################## 
 
-def write_debug_msg(filename, message):
-    year, month, day, hour, mins, secs, weekday, yearday = time.localtime() 
-    with open (filename, "a") as f:
-        print("{}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}: ".format(year, month, day, hour, mins, secs) + message, file=f)
-
 def show_error(display, text):
     WIDTH, HEIGHT = display.get_bounds()
     print(text)
@@ -236,17 +403,101 @@ def stop_execution():
     inky_frame.turn_off()
     sys.exit() # for usb power
 
+# Whether the Pico RTC was set from the PCF85063A during this wake
+rtc_loaded = False
+
+def load_time_from_rtc():
+    # The PCF85063A keeps time through deep sleep, so the Pico RTC can be set without any network
+    global rtc_loaded
+    rtc_loaded = False
+    try:
+        inky_frame.pcf_to_pico_rtc()
+    except Exception as e:
+        raise InkyHelperError(e)
+    rtc_loaded = True
+
+### TIME SYNC POLICY ###
+# The PCF85063A is trusted until its estimated drift since the last NTP sync exceeds
+# TIME_SYNC_MAX_DRIFT seconds, or TIME_SYNC_MAX_INTERVAL seconds have passed, whichever comes first.
+TIME_SYNC_FILE = "/time_sync.json"
+TIME_SYNC_MAX_DRIFT = 2
+TIME_SYNC_MAX_INTERVAL = 24 * 60 * 60
+# Used until the drift has been measured, a typical tolerance of a 32.768 kHz crystal
+TIME_SYNC_DEFAULT_DRIFT_PPM = 20
+# Drift is measured in whole seconds, shorter intervals would make the estimate meaningless
+TIME_SYNC_MIN_MEASURE_INTERVAL = 60 * 60
+
+def load_time_sync():
+    try:
+        with open(TIME_SYNC_FILE, "r") as f:
+            data = ujson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if type(data) is not dict or "synced_at" not in data:
+        return None
+    return data
+
+def estimated_rtc_drift(now=None, data=None):
+    """Estimated absolute error of the RTC in seconds, or None when it has never been synced."""
+    if data is None:
+        data = load_time_sync()
+    if data is None:
+        return None
+    if now is None:
+        now = time.time()
+    elapsed = now - data["synced_at"]
+    if elapsed < 0:
+        return None
+    return abs(data.get("drift_ppm", TIME_SYNC_DEFAULT_DRIFT_PPM)) * elapsed / 1000000
+
+def time_sync_due(now=None):
+    data = load_time_sync()
+    if data is None:
+        return True
+    if now is None:
+        now = time.time()
+    drift = estimated_rtc_drift(now, data)
+    if drift is None or now - data["synced_at"] >= TIME_SYNC_MAX_INTERVAL:
+        return True
+    return drift >= TIME_SYNC_MAX_DRIFT
+
 def sync_time():
     try:
         print("Synchronizing the time")
+        last_sync = load_time_sync()
+        started = time.ticks_ms()
+        rtc_time = time.time()
         inky_frame.set_time()
         inky_frame.pcf_to_pico_rtc()
+        ntp_time = time.time()
         year, month, day, hour, mins, secs, weekday, yearday = time.localtime()   
         print("Time set to: " + "{}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}".format(year, month, day, hour, mins, secs) + "UTC")  
-        return True
     except Exception as e:
         raise InkyHelperError(e)
-    
+
+    data = {"synced_at": ntp_time}
+    if last_sync is not None:
+        if "drift_ppm" in last_sync:
+            data["drift_ppm"] = last_sync["drift_ppm"]
+        interval = ntp_time - last_sync["synced_at"]
+        # Without the RTC time loaded this wake, rtc_time is the Pico RTC's reset value
+        if rtc_loaded and interval >= TIME_SYNC_MIN_MEASURE_INTERVAL:
+            # Where the RTC thought we were, corrected for the time the NTP round trip took
+            offset = rtc_time + time.ticks_diff(time.ticks_ms(), started) // 1000 - ntp_time
+            drift_ppm = offset * 1000000 / interval
+            if "drift_ppm" in data:
+                drift_ppm = (data["drift_ppm"] + drift_ppm) / 2
+            data["drift_ppm"] = drift_ppm
+            print("RTC was off by {} s, estimated drift {:.1f} ppm".format(offset, drift_ppm))
+    try:
+        with open(TIME_SYNC_FILE, "w") as f:
+            f.write(ujson.dumps(data))
+    except OSError as e:
+        print("Failed to save the time sync state", e)
+    return True
+
+###############
+
 def file_exists(filename):
     try:
         return (os.stat(filename)[0] & 0x4000) == 0
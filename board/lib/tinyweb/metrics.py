@@ -0,0 +1,259 @@
+"""
+Tiny Web - instrumentation for tinyweb server:
+per route metrics in Prometheus text / JSON format and sampling profiler
+MIT license
+"""
+import gc
+import sys
+import ujson as json
+import utime as time
+from tinyweb import server
+from tinyweb.server import middleware, chunkedwriter, parse_query_string
+
+
+# Latency histogram buckets: upper bound in ms, Prometheus 'le' label (seconds)
+LATENCY_BUCKETS = ((5, '0.005'), (10, '0.01'), (25, '0.025'), (50, '0.05'),
+                   (100, '0.1'), (250, '0.25'), (500, '0.5'), (1000, '1'),
+                   (2500, '2.5'), (5000, '5'))
+
+
+class routestats:
+    """Counters of one route"""
+
+    def __init__(self):
+        # Last one is +Inf bucket
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.latency_ms = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # Time in collections made by server while request was processed
+        self.gc_us = 0
+        # Heap consumed by request: drop of gc.mem_free(), total and max
+        self.heap_used = 0
+        self.heap_used_max = 0
+        # HTTP status code -> count
+        self.codes = {}
+
+    def to_dict(self):
+        return {'count': self.count,
+                'latency_ms': self.latency_ms,
+                'buckets': self.buckets,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'gc_us': self.gc_us,
+                'heap_used': self.heap_used,
+                'heap_used_max': self.heap_used_max,
+                'codes': self.codes,
+                }
+
+
+class metrics(middleware):
+    """Middleware collecting per route metrics.
+    Routes are identified by URL pattern given to add_route(),
+    requests to unknown URLs are accounted as route '-'.
+    NOTE: Time of collections and heap usage are sampled server wide, so
+    requests running concurrently are partially accounted to each other.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.routes = {}
+
+    def request_start(self, req, resp):
+        req.metrics_start = (time.ticks_ms(), server.gc_time_us, gc.mem_free())
+
+    def request_end(self, req, resp):
+        started, gc_us, free = req.metrics_start
+        ms = time.ticks_diff(time.ticks_ms(), started)
+        route = req.params['url'] if req.params else '-'
+        st = self.routes.get(route)
+        if st is None:
+            st = self.routes[route] = routestats()
+        idx = 0
+        for bound, _ in LATENCY_BUCKETS:
+            if ms <= bound:
+                break
+            idx += 1
+        st.buckets[idx] += 1
+        st.count += 1
+        st.latency_ms += ms
+        st.bytes_in += req.reader.consumed() - req.rx_start
+        st.bytes_out += resp.bytes_sent
+        st.gc_us += server.gc_time_us - gc_us
+        used = free - gc.mem_free()
+        st.heap_used += used
+        if used > st.heap_used_max:
+            st.heap_used_max = used
+        st.codes[resp.code] = st.codes.get(resp.code, 0) + 1
+
+    def to_dict(self):
+        routes = {}
+        for route, st in self.routes.items():
+            routes[route] = st.to_dict()
+        return {'server': self.app.stats(),
+                'gc_us': server.gc_time_us,
+                'mem_free': gc.mem_free(),
+                'mem_alloc': gc.mem_alloc(),
+                'routes': routes,
+                }
+
+    def prometheus(self):
+        """Generator of metrics in Prometheus text exposition format"""
+        stats = self.app.stats()
+        for name, key, kind in (('connections_total', 'connections', 'counter'),
+                                ('requests_total', 'requests', 'counter'),
+                                ('active_connections', 'active', 'gauge'),
+                                ('queued_connections', 'queued', 'gauge'),
+                                ('idle_connections', 'idle', 'gauge'),
+                                ('rejected_total', 'rejected', 'counter'),
+                                ('timed_out_total', 'timed_out', 'counter'),
+                                ('cache_hits_total', 'cache_hits', 'counter'),
+                                ('cache_misses_total', 'cache_misses', 'counter'),
+                                ('cache_bytes', 'cache_bytes', 'gauge')):
+            yield '# TYPE tinyweb_{} {}\ntinyweb_{} {}\n'.format(name, kind, name, stats[key])
+        yield '# TYPE tinyweb_handler_seconds summary\n'
+        yield 'tinyweb_handler_seconds{{quantile="0.5"}} {:.3f}\n'.format(stats['handler_ms_p50'] / 1000)
+        yield 'tinyweb_handler_seconds{{quantile="0.99"}} {:.3f}\n'.format(stats['handler_ms_p99'] / 1000)
+        yield '# TYPE tinyweb_gc_seconds_total counter\ntinyweb_gc_seconds_total {:.6f}\n'.format(
+            server.gc_time_us / 1000000)
+        yield '# TYPE tinyweb_heap_free_bytes gauge\ntinyweb_heap_free_bytes {}\n'.format(gc.mem_free())
+        yield '# TYPE tinyweb_heap_alloc_bytes gauge\ntinyweb_heap_alloc_bytes {}\n'.format(gc.mem_alloc())
+
+        yield '# TYPE tinyweb_request_duration_seconds histogram\n'
+        for route, st in self.routes.items():
+            total = 0
+            for i in range(len(LATENCY_BUCKETS)):
+                total += st.buckets[i]
+                yield 'tinyweb_request_duration_seconds_bucket{{route="{}",le="{}"}} {}\n'.format(
+                    route, LATENCY_BUCKETS[i][1], total)
+            yield 'tinyweb_request_duration_seconds_bucket{{route="{}",le="+Inf"}} {}\n'.format(route, st.count)
+            yield 'tinyweb_request_duration_seconds_sum{{route="{}"}} {:.3f}\n'.format(route, st.latency_ms / 1000)
+            yield 'tinyweb_request_duration_seconds_count{{route="{}"}} {}\n'.format(route, st.count)
+        for name, attr, kind, scale in (('request_bytes_total', 'bytes_in', 'counter', 0),
+                                        ('response_bytes_total', 'bytes_out', 'counter', 0),
+                                        ('request_gc_seconds_total', 'gc_us', 'counter', 1000000),
+                                        ('request_heap_used_bytes_total', 'heap_used', 'counter', 0),
+                                        ('request_heap_used_bytes_max', 'heap_used_max', 'gauge', 0)):
+            yield '# TYPE tinyweb_{} {}\n'.format(name, kind)
+            for route, st in self.routes.items():
+                value = getattr(st, attr)
+                if scale:
+                    value = '{:.6f}'.format(value / scale)
+                yield 'tinyweb_{}{{route="{}"}} {}\n'.format(name, route, value)
+        yield '# TYPE tinyweb_responses_total counter\n'
+        for route, st in self.routes.items():
+            for code, count in st.codes.items():
+                yield 'tinyweb_responses_total{{route="{}",code="{}"}} {}\n'.format(route, code, count)
+
+
+class profiler(middleware):
+    """Sampling profiler of URL handlers.
+    While handler runs function calls are traced (sys.settrace), the called
+    function is sampled at most once per interval_ms. Requires firmware built
+    with MICROPY_PY_SYS_SETTRACE, otherwise 'available' is False.
+    Tracing is global, so code of other tasks running meanwhile is sampled too.
+    """
+
+    def __init__(self, interval_ms=10, max_entries=64):
+        self.available = hasattr(sys, 'settrace')
+        self.enabled = False
+        self.interval_ms = interval_ms
+        self.max_entries = max_entries
+        # 'file:function' -> number of samples
+        self.samples = {}
+        self.active = 0
+        self.last = time.ticks_ms()
+
+    def handler_start(self, req, resp):
+        if self.enabled:
+            self.active += 1
+            if self.active == 1:
+                sys.settrace(self._trace)
+
+    def handler_end(self, req, resp):
+        if self.active:
+            self.active -= 1
+            if self.active == 0:
+                sys.settrace(None)
+
+    def _trace(self, frame, event, arg):
+        if event != 'call':
+            return None
+        now = time.ticks_ms()
+        if time.ticks_diff(now, self.last) < self.interval_ms:
+            return None
+        self.last = now
+        code = frame.f_code
+        key = '{}:{}'.format(code.co_filename, code.co_name)
+        if key not in self.samples and len(self.samples) >= self.max_entries:
+            key = '(other)'
+        self.samples[key] = self.samples.get(key, 0) + 1
+        # No line tracing
+        return None
+
+    def to_dict(self):
+        top = sorted(self.samples.items(), key=lambda x: x[1], reverse=True)
+        return {'available': self.available,
+                'enabled': self.enabled,
+                'interval_ms': self.interval_ms,
+                'samples': top,
+                }
+
+
+async def _send_json(resp, data):
+    res = json.dumps(data).encode()
+    resp.add_header('Content-Type', 'application/json')
+    resp.add_header('Content-Length', str(len(res)))
+    await resp._send_headers()
+    await resp.send(res)
+
+
+def install(app, profile=False, prefix=''):
+    """Install instrumentation into webserver 'app' and add endpoints:
+        prefix/metrics - Prometheus text format
+        prefix/metrics.json - the same as JSON
+        prefix/debug/profile - profiler (only if 'profile' is True),
+            query parameters: enable=1 / enable=0, reset=1
+    Returns tuple (metrics, profiler or None)
+    Example:
+        app = webserver()
+        metrics.install(app, profile=True)
+    """
+    m = metrics(app)
+    app.add_middleware(m)
+
+    async def prometheus(req, resp):
+        resp.add_header('Content-Type', 'text/plain; version=0.0.4')
+        resp.add_header('Transfer-Encoding', 'chunked')
+        if resp.version != '1.1':
+            resp.version = '1.1'
+            resp.keep_alive = False
+        await resp._send_headers()
+        w = chunkedwriter(resp.writer, write_timeout=resp.write_timeout)
+        for line in m.prometheus():
+            await w.write(line)
+        await w.close()
+        resp.bytes_sent += w.sent
+
+    async def metrics_json(req, resp):
+        await _send_json(resp, m.to_dict())
+
+    app.add_route(prefix + '/metrics', prometheus)
+    app.add_route(prefix + '/metrics.json', metrics_json)
+
+    prof = None
+    if profile:
+        prof = profiler()
+        app.add_middleware(prof)
+
+        async def profile_handler(req, resp):
+            query = parse_query_string(req.query_string.decode()) if req.query_string else {}
+            if 'reset' in query:
+                prof.samples = {}
+            if 'enable' in query:
+                prof.enabled = prof.available and query['enable'] == '1'
+            await _send_json(resp, prof.to_dict())
+
+        app.add_route(prefix + '/debug/profile', profile_handler)
+    return m, prof
@@ -5,22 +5,33 @@ MIT license
 """
 import logging
 import uasyncio as asyncio
-import uasyncio.core
 import ujson as json
 import gc
 import uos as os
 import sys
 import uerrno as errno
-import usocket as socket
+import utime as time
+import uhashlib as hashlib
+import ubinascii as binascii
 
 
 log = logging.getLogger('WEB')
 
 type_gen = type((lambda: (yield))())  # noqa: E275
 
-# uasyncio v3 is shipped with MicroPython 1.13, and contains some subtle
-# but breaking changes. See also https://github.com/peterhinch/micropython-async/blob/master/v3/README.md
-IS_UASYNCIO_V3 = hasattr(asyncio, "__version__") and asyncio.__version__ >= (3,)
+# Total time spent in collect(), us. Used by instrumentation (metrics.py)
+gc_time_us = 0
+
+
+def collect():
+    """gc.collect() which keeps track of time spent in it"""
+    global gc_time_us
+    started = time.ticks_us()
+    gc.collect()
+    gc_time_us += time.ticks_diff(time.ticks_us(), started)
+
+# Server requires uasyncio v3, shipped with MicroPython 1.13 (start_server, Event, current_task).
+# See also https://github.com/peterhinch/micropython-async/blob/master/v3/README.md
 
 
 def urldecode_plus(s):
@@ -55,6 +66,57 @@ def parse_query_string(s):
     return res
 
 
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(secs):
+    """Format timestamp as HTTP date, e.g. Sun, 06 Nov 1994 08:49:37 GMT"""
+    t = time.gmtime(secs)
+    return '{}, {:02d} {} {} {:02d}:{:02d}:{:02d} GMT'.format(
+        _WEEKDAYS[t[6]], t[2], _MONTHS[t[1] - 1], t[0], t[3], t[4], t[5])
+
+
+def parse_http_date(s):
+    """Parse HTTP date (IMF-fixdate, as sent by browsers).
+    Returns timestamp or None if date is malformed
+    """
+    try:
+        _, day, mon, year, hms, _ = s.split()
+        hh, mm, ss = hms.split(':')
+        return time.mktime((int(year), _MONTHS.index(mon) + 1, int(day),
+                            int(hh), int(mm), int(ss), 0, 0))
+    except ValueError:
+        return None
+
+
+def parse_range(value, size):
+    """Parse Range header value (single range only), like bytes=0-499
+    Returns tuple (first, last) byte positions, None if header should be
+    ignored (other unit, several ranges, invalid range like bytes=5-3).
+    Raises HTTPException(416) if range is not satisfiable, i.e. starts
+    at or past the end of file.
+    """
+    if not value.startswith('bytes=') or ',' in value:
+        return None
+    first, _, last = value[6:].strip().partition('-')
+    # Digits only, int() would also take signs and spaces
+    if first and not first.isdigit() or last and not last.isdigit() or not (first or last):
+        return None
+    if not first:
+        # Suffix range: last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            raise HTTPException(416)
+        return max(size - suffix, 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise HTTPException(416)
+    return first, min(int(last), size - 1) if last else size - 1
+
+
 class HTTPException(Exception):
     """HTTP protocol exceptions"""
 
@@ -62,15 +124,417 @@ class HTTPException(Exception):
         self.code = code
 
 
+class ConnectionClosed(Exception):
+    """Peer closed connection before sending a request"""
+    pass
+
+
+def _name_equals(buf, start, end, name):
+    """Case insensitive compare of buf[start:end] with bytestring 'name'
+    without making copy of buffer.
+    """
+    if end - start != len(name):
+        return False
+    for i in range(len(name)):
+        a = buf[start + i]
+        b = name[i]
+        if a != b:
+            # Fold ASCII uppercase letters
+            if 65 <= a <= 90:
+                a += 32
+            if 65 <= b <= 90:
+                b += 32
+            if a != b:
+                return False
+    return True
+
+
+class bufreader:
+    """Stream wrapper with fixed size, reusable line buffer.
+    Request line and headers are parsed in place, so reading them does not
+    allocate memory per line. Bytes buffered beyond headers (request body,
+    next pipelined request) are returned first by read functions.
+    """
+
+    def __init__(self, _reader, size=512):
+        self.reader = _reader
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        # Unread data is buf[pos:end], buf[pos:scan] is known to have no newline
+        self.pos = 0
+        self.scan = 0
+        self.end = 0
+        # Offsets of the last line read by readline_inplace(), without line ending
+        self.line_start = 0
+        self.line_end = 0
+        # Total bytes received
+        self.nread = 0
+        # Max time to wait for each read of request body, None - unlimited
+        self.read_timeout = None
+
+    async def _fill(self):
+        """Read more data into buffer.
+        Returns number of bytes read, 0 means EOF.
+        """
+        if self.pos > 0:
+            # Move unread data to the beginning of buffer
+            n = self.end - self.pos
+            self.buf[:n] = self.mv[self.pos:self.end]
+            self.scan -= self.pos
+            self.pos = 0
+            self.end = n
+        if self.end == len(self.buf):
+            # Line does not fit into buffer
+            raise HTTPException(431)
+        n = await self.reader.readinto(self.mv[self.end:])
+        if n:
+            self.end += n
+            self.nread += n
+        return n
+
+    async def _recv(self, coro):
+        """Await read from stream, at most read_timeout.
+        Deadline is per read, so slow but progressing body is not cut off.
+        """
+        if self.read_timeout:
+            return await asyncio.wait_for(coro, self.read_timeout)
+        return await coro
+
+    async def readline_inplace(self):
+        """Read next line into buffer.
+        Line is buf[line_start:line_end] (without \r\n).
+        Returns False if stream was closed before any line data.
+        """
+        buf = self.buf
+        while True:
+            i = self.scan
+            end = self.end
+            while i < end and buf[i] != 10:
+                i += 1
+            self.scan = i
+            if i < end:
+                break
+            if not await self._fill():
+                if self.pos == self.end:
+                    return False
+                # Incomplete line
+                raise HTTPException(400)
+        self.line_start = self.pos
+        self.pos = self.scan = i + 1
+        if i > self.line_start and buf[i - 1] == 13:
+            i -= 1
+        self.line_end = i
+        return True
+
+    def consumed(self):
+        """Total bytes handed over to parser / handlers"""
+        return self.nread - (self.end - self.pos)
+
+    def _take(self, n):
+        """Return up to n buffered bytes"""
+        n = min(n, self.end - self.pos)
+        data = bytes(self.mv[self.pos:self.pos + n])
+        self.pos += n
+        self.scan = max(self.scan, self.pos)
+        return data
+
+    async def read(self, n=-1):
+        if self.pos < self.end:
+            if n < 0:
+                n = self.end - self.pos
+            return self._take(n)
+        data = await self._recv(self.reader.read(n))
+        self.nread += len(data)
+        return data
+
+    async def readexactly(self, n):
+        data = self._take(n)
+        if len(data) < n:
+            rest = n - len(data)
+            data += await self._recv(self.reader.readexactly(rest))
+            self.nread += rest
+        return data
+
+    async def readinto(self, buf):
+        n = min(len(buf), self.end - self.pos)
+        if n == 0:
+            n = await self._recv(self.reader.readinto(buf))
+            self.nread += n
+            return n
+        buf[:n] = self.mv[self.pos:self.pos + n]
+        self.pos += n
+        self.scan = max(self.scan, self.pos)
+        return n
+
+    async def readline(self):
+        if self.pos < self.end:
+            if not await self.readline_inplace():
+                return b''
+            return bytes(self.mv[self.line_start:self.pos])
+        data = await self._recv(self.reader.readline())
+        self.nread += len(data)
+        return data
+
+
+class bodystream:
+    """Async iterator over request body.
+    Chunks are memoryviews of one reused buffer, each valid only until
+    the next iteration, so memory usage does not depend on body size.
+    Example:
+        async for chunk in req.body():
+            f.write(chunk)
+    """
+
+    def __init__(self, req, buf_size=512):
+        if req.content_length < 0:
+            # Chunked request body
+            raise HTTPException(411)
+        self.req = req
+        self.remaining = req.content_length
+        self.mv = memoryview(bytearray(max(min(self.remaining, buf_size), 1)))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.remaining <= 0:
+            self.req.body_consumed = True
+            raise StopAsyncIteration
+        mv = self.mv
+        if self.remaining < len(mv):
+            mv = mv[:self.remaining]
+        n = await self.req.reader.readinto(mv)
+        if not n:
+            # Connection closed in the middle of body
+            raise HTTPException(400)
+        self.remaining -= n
+        return self.mv[:n]
+
+
+class formdecoder:
+    """Incremental application/x-www-form-urlencoded decoder.
+    Body is passed in chunks to feed(), fields are collected into 'fields'.
+    Only the field being parsed is buffered, names / values longer
+    than max_field are rejected with HTTP 413.
+    """
+
+    def __init__(self, max_field=256):
+        self.max_field = max_field
+        self.fields = {}
+        self.token = b''
+        self.name = None
+
+    def feed(self, chunk):
+        data = self.token + bytes(chunk)
+        start = 0
+        while True:
+            amp = data.find(b'&', start)
+            end = len(data) if amp < 0 else amp
+            if self.name is None:
+                eq = data.find(b'=', start, end)
+                if eq >= 0:
+                    self.name = urldecode_plus(data[start:eq].decode())
+                    start = eq + 1
+            if amp < 0:
+                break
+            self._field(data[start:amp])
+            start = amp + 1
+        self.token = data[start:]
+        if len(self.token) > self.max_field:
+            raise HTTPException(413)
+
+    def close(self):
+        """Finish decoding, returns dict of fields"""
+        if self.token or self.name is not None:
+            self._field(self.token)
+        self.token = b''
+        return self.fields
+
+    def _field(self, value):
+        value = urldecode_plus(value.decode())
+        if self.name is None:
+            # Field without '='
+            if value:
+                self.fields[value] = ''
+        else:
+            self.fields[self.name] = value
+        self.name = None
+
+
+class multipartparser:
+    """Incremental multipart/form-data parser.
+    File parts are written straight into upload_dir, under the name given
+    by client (directories stripped). File is written as name.part and
+    renamed when complete, so a failed upload never replaces existing file.
+    Other parts are collected as strings, up to max_field bytes.
+    After close(), 'fields' maps part names to values, for files - to path.
+    """
+
+    def __init__(self, boundary, upload_dir, max_field=256):
+        self.delim = b'\r\n--' + boundary
+        self.upload_dir = upload_dir.rstrip('/')
+        self.max_field = max_field
+        self.fields = {}
+        # Body starts with delimiter without leading CRLF
+        self.data = b'\r\n'
+        self.state = 0
+        self.part_name = None
+        self.filename = None
+        self.file = None
+        self.value = None
+
+    def feed(self, chunk):
+        self.data += bytes(chunk)
+        while self._step():
+            pass
+
+    def close(self):
+        """Finish parsing, returns dict of fields"""
+        if self.state != 4:
+            # Body ended before closing delimiter
+            raise HTTPException(400)
+        return self.fields
+
+    def abort(self):
+        """Remove partially written file, if any"""
+        if self.file:
+            self.file.close()
+            self.file = None
+            os.remove(self.filename + '.part')
+
+    def _step(self):
+        """Parse as much of pending data as possible in current state.
+        Returns True if state changed and parsing should continue
+        """
+        data = self.data
+        dlen = len(self.delim)
+        if self.state == 0:
+            # Preamble, look for first delimiter
+            i = data.find(self.delim)
+            if i < 0:
+                self.data = data[-dlen:]
+                return False
+            self.data = data[i + dlen:]
+            self.state = 1
+        elif self.state == 1:
+            # After delimiter: -- (end of body) or CRLF (next part)
+            if len(data) < 2:
+                return False
+            if data[:2] == b'--':
+                self.state = 4
+                self.data = b''
+                return False
+            if data[:2] != b'\r\n':
+                raise HTTPException(400)
+            self.data = data[2:]
+            self.part_name = None
+            self.filename = None
+            self.state = 2
+        elif self.state == 2:
+            # Part headers
+            i = data.find(b'\r\n')
+            if i < 0:
+                if len(data) > 512:
+                    raise HTTPException(431)
+                return False
+            line = data[:i]
+            self.data = data[i + 2:]
+            if line:
+                self._part_header(line)
+            else:
+                self._part_start()
+                self.state = 3
+        elif self.state == 3:
+            # Part body, up to the next delimiter
+            i = data.find(self.delim)
+            if i < 0:
+                # Keep tail which may be beginning of delimiter
+                safe = len(data) - dlen + 1
+                if safe > 0:
+                    self._part_data(data[:safe])
+                    self.data = data[safe:]
+                return False
+            self._part_data(data[:i])
+            self.data = data[i + dlen:]
+            self._part_end()
+            self.state = 1
+        else:
+            # Epilogue is ignored
+            self.data = b''
+            return False
+        return True
+
+    def _part_header(self, line):
+        name, _, value = line.partition(b':')
+        if name.strip().lower() != b'content-disposition':
+            return
+        for param in value.split(b';'):
+            key, _, val = param.strip().partition(b'=')
+            val = val.strip(b'"').decode()
+            if key == b'name':
+                self.part_name = val
+            elif key == b'filename':
+                self.filename = val
+
+    def _part_start(self):
+        if self.part_name is None:
+            raise HTTPException(400)
+        if not self.filename:
+            # Not a file, or file input left empty
+            self.filename = None
+            self.value = b''
+            return
+        # Strip any directories given by client
+        name = self.filename.replace('\\', '/').split('/')[-1]
+        if name in ('', '.', '..'):
+            raise HTTPException(400)
+        self.filename = self.upload_dir + '/' + name
+        self.file = open(self.filename + '.part', 'wb')
+
+    def _part_data(self, data):
+        if self.file:
+            self.file.write(data)
+        else:
+            self.value += data
+            if len(self.value) > self.max_field:
+                raise HTTPException(413)
+
+    def _part_end(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            try:
+                os.remove(self.filename)
+            except OSError:
+                pass
+            os.rename(self.filename + '.part', self.filename)
+            self.fields[self.part_name] = self.filename
+        else:
+            self.fields[self.part_name] = self.value.decode()
+
+
 class request:
     """HTTP Request class"""
 
-    def __init__(self, _reader):
+    def __init__(self, _reader, max_headers=30):
         self.reader = _reader
+        self.max_headers = max_headers
         self.headers = {}
         self.method = b''
         self.path = b''
         self.query_string = b''
+        self.version = b'HTTP/1.0'
+        # Converted values of URL parameters, in URL order
+        self.url_params = ()
+        # Params of matched route (see webserver.add_route)
+        self.params = None
+        # Position in connection's input stream where this request starts
+        self.rx_start = _reader.consumed() if hasattr(_reader, 'consumed') else 0
+        # Framing related headers are always parsed (regardless of save_headers)
+        # to decide whether connection can be reused for the next request
+        self.connection = b''
+        self.content_length = 0
+        self.body_consumed = False
 
     async def read_request_line(self):
         """Read and parse first line (AKA HTTP Request Line).
@@ -78,16 +542,18 @@ class request:
         Request line is something like:
         GET /something/script?param1=val1 HTTP/1.1
         """
+        reader = self.reader
         while True:
-            rl = await self.reader.readline()
+            if not await reader.readline_inplace():
+                raise ConnectionClosed()
             # skip empty lines
-            if rl == b'\r\n' or rl == b'\n':
-                continue
-            break
-        rl_frags = rl.split()
+            if reader.line_end > reader.line_start:
+                break
+        rl_frags = bytes(reader.mv[reader.line_start:reader.line_end]).split()
         if len(rl_frags) != 3:
             raise HTTPException(400)
         self.method = rl_frags[0]
+        self.version = rl_frags[2]
         url_frags = rl_frags[1].split(b'?', 1)
         self.path = url_frags[0]
         if len(url_frags) > 1:
@@ -97,66 +563,402 @@ class request:
         """Read and parse HTTP headers until \r\n\r\n:
         Optional argument 'save_headers' controls which headers to save.
             This is done mostly to deal with memory constrains.
+            Header names are matched case insensitive and saved
+            under the name given in 'save_headers'.
+        Headers are parsed in place in the reader's line buffer, only values
+        of saved headers are copied.
         Function is generator.
         HTTP headers could be like:
         Host: google.com
         Content-Type: blah
         \r\n
         """
+        reader = self.reader
+        buf = reader.buf
+        count = 0
         while True:
-            gc.collect()
-            line = await self.reader.readline()
-            if line == b'\r\n':
+            if not await reader.readline_inplace():
+                raise HTTPException(400)
+            start = reader.line_start
+            end = reader.line_end
+            if start == end:
                 break
-            frags = line.split(b':', 1)
-            if len(frags) != 2:
+            count += 1
+            if count > self.max_headers:
+                raise HTTPException(431)
+            colon = start
+            while colon < end and buf[colon] != 58:
+                colon += 1
+            if colon == end:
                 raise HTTPException(400)
-            if frags[0] in save_headers:
-                self.headers[frags[0]] = frags[1].strip()
+            # Strip value
+            vs = colon + 1
+            while vs < end and buf[vs] in (32, 9):
+                vs += 1
+            ve = end
+            while ve > vs and buf[ve - 1] in (32, 9):
+                ve -= 1
+            for name in save_headers:
+                if _name_equals(buf, start, colon, name):
+                    self.headers[name] = bytes(reader.mv[vs:ve])
+                    break
+            if _name_equals(buf, start, colon, b'connection'):
+                if _name_equals(buf, vs, ve, b'close'):
+                    self.connection = b'close'
+                elif _name_equals(buf, vs, ve, b'keep-alive'):
+                    self.connection = b'keep-alive'
+            elif _name_equals(buf, start, colon, b'content-length'):
+                if vs == ve:
+                    raise HTTPException(400)
+                length = 0
+                for i in range(vs, ve):
+                    c = buf[i]
+                    if c < 48 or c > 57:
+                        raise HTTPException(400)
+                    length = length * 10 + c - 48
+                self.content_length = length
+            elif _name_equals(buf, start, colon, b'transfer-encoding'):
+                # Chunked request bodies are not supported, never reuse such connection
+                self.content_length = -1
+
+    def keep_alive(self):
+        """Returns True if client asked for (or, for HTTP/1.1, did not refuse)
+        persistent connection"""
+        if self.version == b'HTTP/1.1':
+            return self.connection != b'close'
+        return self.connection == b'keep-alive'
+
+    def body(self, buf_size=512):
+        """Request body as async iterator of chunks (see bodystream).
+        Handler is responsible for limiting body size, if needed.
+        """
+        return bodystream(self, buf_size)
 
     async def read_parse_form_data(self):
         """Read HTTP form data (payload), if any.
         Function is generator.
+        Urlencoded forms are decoded chunk by chunk, JSON is read as whole
+        and limited by max_body_size.
         Returns:
             - dict of key / value pairs
             - None in case of no form data present
         """
-        # TODO: Probably there is better solution how to handle
-        # request body, at least for simple urlencoded forms - by processing
-        # chunks instead of accumulating payload.
-        gc.collect()
+        collect()
         if b'Content-Length' not in self.headers:
             return {}
         # Parse payload depending on content type
         if b'Content-Type' not in self.headers:
             # Unknown content type, return unparsed, raw data
             return {}
+        # Use only string before ';', e.g:
+        # application/x-www-form-urlencoded; charset=UTF-8
+        ct = self.headers[b'Content-Type'].split(b';', 1)[0]
+        if ct == b'application/x-www-form-urlencoded':
+            # Streamed, only the field being decoded is buffered
+            decoder = formdecoder()
+            try:
+                async for chunk in self.body(128):
+                    decoder.feed(chunk)
+                return decoder.close()
+            except ValueError:
+                raise HTTPException(400)
+        # Read as whole, so max_body_size applies
         size = int(self.headers[b'Content-Length'])
         if size > self.params['max_body_size'] or size < 0:
             raise HTTPException(413)
         data = await self.reader.readexactly(size)
-        # Use only string before ';', e.g:
-        # application/x-www-form-urlencoded; charset=UTF-8
-        ct = self.headers[b'Content-Type'].split(b';', 1)[0]
+        self.body_consumed = True
         try:
             if ct == b'application/json':
                 return json.loads(data)
-            elif ct == b'application/x-www-form-urlencoded':
-                return parse_query_string(data.decode())
         except ValueError:
             # Re-generate exception for malformed form data
             raise HTTPException(400)
 
+    async def read_multipart(self, upload_dir, max_size=None, max_field=256, buf_size=512):
+        """Read multipart/form-data body (file upload), see multipartparser.
+        Function is generator.
+        Route must save Content-Type header.
+        Arguments:
+            upload_dir - Directory where files are stored, e.g. '/sd'
+        Keyword arguments:
+            max_size - Max body size, None means unlimited
+            max_field - Max size of non-file field
+            buf_size - Read buffer size
+        Returns dict: part name -> value, for files -> path of saved file
+        Example:
+            @app.route('/upload', methods=['POST'], save_headers=['Content-Type'])
+            async def upload(req, resp):
+                files = await req.read_multipart('/sd')
+        """
+        ct, _, params = self.headers.get(b'Content-Type', b'').partition(b';')
+        if ct.strip() != b'multipart/form-data':
+            raise HTTPException(415)
+        boundary = None
+        for param in params.split(b';'):
+            key, _, val = param.strip().partition(b'=')
+            if key == b'boundary':
+                boundary = val.strip(b'"')
+        if not boundary:
+            raise HTTPException(400)
+        if max_size is not None and self.content_length > max_size:
+            raise HTTPException(413)
+        parser = multipartparser(boundary, upload_dir, max_field)
+        try:
+            async for chunk in self.body(buf_size):
+                parser.feed(chunk)
+            return parser.close()
+        finally:
+            parser.abort()
+
+
+async def _drain(writer, timeout=None):
+    """Wait until data buffered by Stream (out_buf) is sent, at most 'timeout'"""
+    if writer.out_buf:
+        if timeout:
+            await asyncio.wait_for(writer.drain(), timeout)
+        else:
+            await writer.drain()
+
+
+class semaphore:
+    """Counting semaphore (uasyncio has only Lock).
+    Waiters are served in FIFO order, released slot is handed over
+    to the first waiter directly.
+    """
+
+    def __init__(self, value):
+        self.value = value
+        self.waiters = []
+
+    def locked(self):
+        return self.value == 0 or len(self.waiters) > 0
+
+    async def acquire(self):
+        if not self.locked():
+            self.value -= 1
+            return
+        ev = asyncio.Event()
+        self.waiters.append(ev)
+        try:
+            await ev.wait()
+        except asyncio.CancelledError:
+            if ev in self.waiters:
+                self.waiters.remove(ev)
+            else:
+                # Slot has been already handed over, pass it on
+                self.release()
+            raise
+
+    def release(self):
+        if self.waiters:
+            self.waiters.pop(0).set()
+        else:
+            self.value += 1
+
+
+class chunkedwriter:
+    """Writer of chunked transfer encoded response body.
+    Small pieces of data are coalesced in fixed size buffer. Every chunk -
+    size line, payload and CRLF - is sent by single write, the final chunk
+    is sent together with the terminating zero length chunk.
+    Yields to event loop only when socket cannot take more data.
+    Example:
+        resp.add_header('Transfer-Encoding', 'chunked')
+        await resp._send_headers()
+        w = chunkedwriter(resp.writer)
+        await w.write('{"events": [')
+        await w.close()
+    """
+
+    def __init__(self, _writer, size=512, write_timeout=None):
+        self.writer = _writer
+        self.write_timeout = write_timeout
+        # Chunk size is written as 4 hex digits
+        self.size = min(size, 0xffff)
+        # Size line + payload + CRLF + terminating 0\r\n\r\n
+        self.buf = bytearray(6 + self.size + 7)
+        self.buf[4:6] = b'\r\n'
+        self.mv = memoryview(self.buf)
+        self.pos = 6
+        # Total bytes sent, chunk framing included
+        self.sent = 0
+
+    async def write(self, data):
+        """Add str / bytes to response body.
+        This function is generator.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        end = self.size + 6
+        n = len(data)
+        if n <= end - self.pos:
+            self.buf[self.pos:self.pos + n] = data
+            self.pos += n
+            return
+        # Does not fit, copy in pieces
+        data = memoryview(data)
+        off = 0
+        while off < n:
+            if self.pos == end:
+                await self._flush()
+            k = min(end - self.pos, n - off)
+            self.buf[self.pos:self.pos + k] = data[off:off + k]
+            self.pos += k
+            off += k
+
+    async def close(self):
+        """Send buffered data and the last (zero length) chunk.
+        This function is generator.
+        """
+        await self._flush(True)
+
+    async def _flush(self, last=False):
+        buf = self.buf
+        n = self.pos - 6
+        start = 6
+        end = self.pos
+        if n:
+            for i in range(4):
+                buf[3 - i] = b'0123456789abcdef'[(n >> (i * 4)) & 15]
+            buf[end:end + 2] = b'\r\n'
+            start = 0
+            end += 2
+        if last:
+            buf[end:end + 5] = b'0\r\n\r\n'
+            end += 5
+        self.pos = 6
+        if end > start:
+            # Stream keeps whatever socket did not accept in out_buf
+            self.sent += end - start
+            self.writer.write(self.mv[start:end])
+            await _drain(self.writer, self.write_timeout)
+
+
+# Pre-encoded status lines (without protocol version)
+_STATUS_LINES = {
+    200: b' 200 OK\r\n',
+    201: b' 201 Created\r\n',
+    202: b' 202 Accepted\r\n',
+    204: b' 204 No Content\r\n',
+    206: b' 206 Partial Content\r\n',
+    301: b' 301 Moved Permanently\r\n',
+    302: b' 302 Found\r\n',
+    304: b' 304 Not Modified\r\n',
+    400: b' 400 Bad Request\r\n',
+    401: b' 401 Unauthorized\r\n',
+    403: b' 403 Forbidden\r\n',
+    404: b' 404 Not Found\r\n',
+    405: b' 405 Method Not Allowed\r\n',
+    408: b' 408 Request Timeout\r\n',
+    411: b' 411 Length Required\r\n',
+    413: b' 413 Payload Too Large\r\n',
+    415: b' 415 Unsupported Media Type\r\n',
+    416: b' 416 Range Not Satisfiable\r\n',
+    431: b' 431 Request Header Fields Too Large\r\n',
+    500: b' 500 Internal Server Error\r\n',
+    501: b' 501 Not Implemented\r\n',
+    503: b' 503 Service Unavailable\r\n',
+}
+_VERSIONS = {'1.0': b'HTTP/1.0', '1.1': b'HTTP/1.1'}
+# Pre-encoded names of frequently used headers
+_HEADER_NAMES = {
+    'Content-Type': b'Content-Type: ',
+    'Content-Length': b'Content-Length: ',
+    'Content-Encoding': b'Content-Encoding: ',
+    'Transfer-Encoding': b'Transfer-Encoding: ',
+    'Cache-Control': b'Cache-Control: ',
+    'Location': b'Location: ',
+}
+_HDR_CONNECTION_CLOSE = b'Connection: close\r\n'
+_HDR_CONNECTION_KEEP_ALIVE = b'Connection: keep-alive\r\n'
+_HDR_JSON = b'Content-Type: application/json\r\n'
+# Size of per connection buffer used to compose response header
+HEADER_BUF_SIZE = 384
+
+
+def _access_control_block(params):
+    """Pre-encoded Access Control headers of route"""
+    return ('Access-Control-Allow-Origin: {}\r\n'
+            'Access-Control-Allow-Methods: {}\r\n'
+            'Access-Control-Allow-Headers: {}\r\n').format(
+                params['allowed_access_control_origins'],
+                params['allowed_access_control_methods'],
+                params['allowed_access_control_headers']).encode()
+
 
 class response:
     """HTTP Response class"""
 
-    def __init__(self, _writer):
+    def __init__(self, _writer, hbuf=None):
         self.writer = _writer
-        self.send = _writer.awrite
+        # Buffer to compose header in (memoryview), allocated on demand if None
+        self.hbuf = hbuf
         self.code = 200
+        # Max time to wait for socket to accept data, None - forever
+        self.write_timeout = None
+        # Total bytes sent, headers included
+        self.bytes_sent = 0
         self.version = '1.0'
         self.headers = {}
+        # Pre-encoded header lines, see add_header_block()
+        self.blocks = []
+        # Whether connection could be reused after this response.
+        # Set by webserver according to request, cleared if response is not framed
+        self.keep_alive = False
+
+    async def send(self, buf, off=0, sz=-1):
+        """Send data to client.
+        This function is generator.
+        Waits (at most write_timeout) only if socket did not accept everything.
+        """
+        if off or (sz != -1 and sz != len(buf)):
+            if sz == -1:
+                sz = len(buf) - off
+            buf = memoryview(buf)[off:off + sz]
+        self.bytes_sent += len(buf)
+        self.writer.write(buf)
+        await _drain(self.writer, self.write_timeout)
+
+    def _is_framed(self):
+        """Response end can be detected by client only when there is
+        Content-Length or chunked Transfer-Encoding (304 never has a body)"""
+        return ('Content-Length' in self.headers or self.headers.get('Transfer-Encoding') == 'chunked' or
+                self.code == 304)
+
+    def _compose_headers(self):
+        """Compose status line and headers.
+        Pre-encoded parts are copied into header buffer, only values
+        of headers added by add_header() are encoded here.
+        Returns memoryview of complete header.
+        """
+        if self.keep_alive and not self._is_framed():
+            self.keep_alive = False
+        parts = [_VERSIONS[self.version],
+                 _STATUS_LINES.get(self.code) or ' {} \r\n'.format(self.code).encode()]
+        for block in self.blocks:
+            parts.append(block)
+        for k, v in self.headers.items():
+            parts.append(_HEADER_NAMES.get(k) or (k + ': ').encode())
+            parts.append(v if isinstance(v, bytes) else str(v).encode())
+            parts.append(b'\r\n')
+        if self.version == '1.1':
+            if not self.keep_alive:
+                parts.append(_HDR_CONNECTION_CLOSE)
+        elif self.keep_alive:
+            parts.append(_HDR_CONNECTION_KEEP_ALIVE)
+        parts.append(b'\r\n')
+        size = 0
+        for p in parts:
+            size += len(p)
+        buf = self.hbuf
+        if buf is None or size > len(buf):
+            buf = memoryview(bytearray(size))
+        pos = 0
+        for p in parts:
+            buf[pos:pos + len(p)] = p
+            pos += len(p)
+        return buf[:pos]
 
     async def _send_headers(self):
         """Compose and send:
@@ -168,15 +970,7 @@ class response:
         to send them separately - sometimes it could increase latency.
         So combining headers together and send them as single "packet".
         """
-        # Request line
-        hdrs = 'HTTP/{} {} MSG\r\n'.format(self.version, self.code)
-        # Headers
-        for k, v in self.headers.items():
-            hdrs += '{}: {}\r\n'.format(k, v)
-        hdrs += '\r\n'
-        # Collect garbage after small mallocs
-        gc.collect()
-        await self.send(hdrs)
+        await self.send(self._compose_headers())
 
     async def error(self, code, msg=None):
         """Generate HTTP error response
@@ -188,8 +982,9 @@ class response:
             await resp.error(403)
         """
         self.code = code
-        if msg:
-            self.add_header('Content-Length', len(msg))
+        if isinstance(msg, str):
+            msg = msg.encode()
+        self.add_header('Content-Length', len(msg) if msg else 0)
         await self._send_headers()
         if msg:
             await self.send(msg)
@@ -205,8 +1000,9 @@ class response:
         """
         self.code = 302
         self.add_header('Location', location)
-        if msg:
-            self.add_header('Content-Length', len(msg))
+        if isinstance(msg, str):
+            msg = msg.encode()
+        self.add_header('Content-Length', len(msg) if msg else 0)
         await self._send_headers()
         if msg:
             await self.send(msg)
@@ -221,13 +1017,25 @@ class response:
         """
         self.headers[key] = value
 
+    def add_header_block(self, block):
+        """Add pre-encoded HTTP response header(s)
+        Arguments:
+            block - bytes, every header line ends with \r\n
+        Example:
+            NO_CACHE = b'Cache-Control: no-cache\r\n'
+            resp.add_header_block(NO_CACHE)
+        """
+        self.blocks.append(block)
+
     def add_access_control_headers(self):
         """Add Access Control related HTTP response headers.
         This is required when working with RestApi (JSON requests)
+        Headers are encoded once per route, see webserver.add_route()
         """
-        self.add_header('Access-Control-Allow-Origin', self.params['allowed_access_control_origins'])
-        self.add_header('Access-Control-Allow-Methods', self.params['allowed_access_control_methods'])
-        self.add_header('Access-Control-Allow-Headers', self.params['allowed_access_control_headers'])
+        block = self.params.get('_access_control_block')
+        if block is None:
+            block = self.params['_access_control_block'] = _access_control_block(self.params)
+        self.blocks.append(block)
 
     async def start_html(self):
         """Start response with HTML content type.
@@ -239,7 +1047,8 @@ class response:
         self.add_header('Content-Type', 'text/html')
         await self._send_headers()
 
-    async def send_file(self, filename, content_type=None, content_encoding=None, max_age=2592000, buf_size=128):
+    async def send_file(self, filename, content_type=None, content_encoding=None, max_age=2592000,
+                        buf_size=4096, req=None):
         """Send local file as HTTP response.
         This function is generator.
         Arguments:
@@ -249,18 +1058,39 @@ class response:
             max_age - Cache control. How long browser can keep this file on disk.
                       By default - 30 days
                       Set to 0 - to disable caching.
+            buf_size - Max size of read / send buffer. Actual buffer is smaller
+                       if file is smaller or there is not enough free memory.
+            req - Request being answered. When given, these request headers are
+                  honored (route must list them in save_headers):
+                  Range - single byte range, answered with 206
+                  Accept-Encoding - gzip: send precompressed filename.gz if exists
+                  If-Modified-Since - answer 304 if file was not modified since
         Example 1: Default use case:
             await resp.send_file('images/cat.jpg')
         Example 2: Disable caching:
             await resp.send_file('static/index.html', max_age=0)
         Example 3: Override content type:
             await resp.send_file('static/file.bin', content_type='application/octet-stream')
+        Example 4: Partial / precompressed / conditional responses:
+            @app.route('/frame.png', save_headers=['Range', 'Accept-Encoding', 'If-Modified-Since'])
+            async def frame(req, resp):
+                await resp.send_file('/sd/frame.png', content_type='image/png', req=req)
         """
+        headers = req.headers if req else {}
         try:
+            # Precompressed variant, if there is one and client accepts it
+            if req and not content_encoding:
+                try:
+                    os.stat(filename + '.gz')
+                    self.add_header('Vary', 'Accept-Encoding')
+                    if b'gzip' in headers.get(b'Accept-Encoding', b''):
+                        filename += '.gz'
+                        content_encoding = 'gzip'
+                except OSError:
+                    pass
             # Get file size
             stat = os.stat(filename)
-            slen = str(stat[6])
-            self.add_header('Content-Length', slen)
+            size = stat[6]
             # Find content type
             if content_type:
                 self.add_header('Content-Type', content_type)
@@ -271,15 +1101,43 @@ class response:
             # to tell browser to cache it, however, you can always
             # override it by setting max_age to zero
             self.add_header('Cache-Control', 'max-age={}, public'.format(max_age))
-            with open(filename) as f:
+            self.add_header('Last-Modified', http_date(stat[8]))
+            self.add_header('Accept-Ranges', 'bytes')
+            since = headers.get(b'If-Modified-Since')
+            if since:
+                since = parse_http_date(since.decode())
+                if since is not None and stat[8] <= since:
+                    self.code = 304
+                    await self._send_headers()
+                    return
+            first, last = 0, size - 1
+            rng = headers.get(b'Range')
+            if rng and size:
+                try:
+                    rng = parse_range(rng.decode(), size)
+                except HTTPException:
+                    self.add_header('Content-Range', 'bytes */{}'.format(size))
+                    raise
+                if rng:
+                    first, last = rng
+                    self.code = 206
+                    self.add_header('Content-Range', 'bytes {}-{}/{}'.format(first, last, size))
+            remaining = last - first + 1
+            self.add_header('Content-Length', str(remaining))
+            with open(filename, 'rb') as f:
+                if first:
+                    f.seek(first)
                 await self._send_headers()
-                gc.collect()
-                buf = bytearray(min(stat[6], buf_size))
-                while True:
-                    size = f.readinto(buf)
+                collect()
+                # Single buffer for whole file, as large as memory allows:
+                # every send() is a socket write and a trip through event loop
+                buf = memoryview(bytearray(max(min(remaining, buf_size, gc.mem_free() // 4), 128)))
+                while remaining > 0:
+                    size = f.readinto(buf if remaining >= len(buf) else buf[:remaining])
                     if size == 0:
                         break
                     await self.send(buf, sz=size)
+                    remaining -= size
         except OSError as e:
             # special handling for ENOENT / EACCESS
             if e.args[0] in (errno.ENOENT, errno.EACCES):
@@ -288,7 +1146,135 @@ class response:
                 raise
 
 
-async def restful_resource_handler(req, resp, param=None):
+def _int_param(s):
+    # int() also accepts sign and surrounding spaces, allow digits only
+    if not s.isdigit():
+        raise ValueError()
+    return int(s)
+
+
+# Type converters for URL parameters, e.g. /events/<int:idx>
+url_param_converters = {'str': str, 'int': _int_param}
+
+
+class _routenode:
+    """Node of URL routing trie. Every node is one path segment"""
+
+    def __init__(self):
+        # Static segments, bytestring -> _routenode
+        self.children = {}
+        # Parameterized segment: (name, converter, _routenode)
+        self.param = None
+        # HTTP method (bytestring) -> (function, params) for URL ending at this node
+        self.handlers = {}
+
+    def lookup(self, segs, idx, values):
+        """Find node for path segments segs[idx:].
+        Static segments have priority over parameters.
+        Converted parameter values are appended to 'values'.
+        Returns _routenode or None.
+        """
+        if idx == len(segs):
+            return self if self.handlers else None
+        seg = segs[idx]
+        child = self.children.get(seg)
+        if child:
+            node = child.lookup(segs, idx + 1, values)
+            if node:
+                return node
+        if self.param and seg:
+            try:
+                value = self.param[1](seg.decode())
+            except ValueError:
+                return None
+            values.append(value)
+            node = self.param[2].lookup(segs, idx + 1, values)
+            if node:
+                return node
+            values.pop()
+        return None
+
+
+class responsecache:
+    """Cache of serialized GET responses of RESTful resources.
+    Keyed by path and query string. Entry is invalidated when its TTL
+    expires or when version key of route changes. Total size of entries
+    is kept under max_bytes by evicting least recently used ones.
+    """
+
+    # Approximate heap overhead of one entry (list, key, etag)
+    ENTRY_OVERHEAD = 64
+
+    def __init__(self, max_bytes=4096):
+        self.max_bytes = max_bytes
+        self.size = 0
+        # key -> [body, etag, expires (ticks_ms or None), version]
+        self.entries = {}
+        # Keys, least recently used first
+        self.lru = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version=None):
+        """Returns entry [body, etag, expires, version] or None"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if ((entry[2] is not None and time.ticks_diff(entry[2], time.ticks_ms()) <= 0) or
+                    entry[3] != version):
+                self.remove(key)
+            else:
+                self.hits += 1
+                if self.lru[-1] != key:
+                    self.lru.remove(key)
+                    self.lru.append(key)
+                return entry
+        self.misses += 1
+        return None
+
+    def put(self, key, body, ttl=None, version=None):
+        """Store body, returns its ETag"""
+        etag = b'"' + binascii.hexlify(hashlib.sha256(body).digest()[:8]) + b'"'
+        self.remove(key)
+        need = len(body) + len(key) + self.ENTRY_OVERHEAD
+        if need > self.max_bytes:
+            return etag
+        while self.size + need > self.max_bytes:
+            self.remove(self.lru[0])
+            self.evictions += 1
+        expires = time.ticks_add(time.ticks_ms(), int(ttl * 1000)) if ttl else None
+        self.entries[key] = [body, etag, expires, version]
+        self.lru.append(key)
+        self.size += need
+        return etag
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.lru.remove(key)
+            self.size -= len(entry[0]) + len(key) + self.ENTRY_OVERHEAD
+
+    def clear(self):
+        self.entries = {}
+        self.lru = []
+        self.size = 0
+
+
+async def _send_cached(req, resp, body, etag):
+    """Send cached / cacheable body, or 304 if client has it already"""
+    resp.add_header('ETag', etag)
+    resp.add_access_control_headers()
+    if req.headers.get(b'If-None-Match') == etag:
+        resp.code = 304
+        await resp._send_headers()
+        return
+    resp.add_header_block(_HDR_JSON)
+    resp.add_header('Content-Length', len(body))
+    await resp._send_headers()
+    await resp.send(body)
+
+
+async def restful_resource_handler(req, resp, *param):
     """Handler for RESTful API endpoins"""
     # Gather data - query string, JSON in request body...
     data = await req.read_parse_form_data()
@@ -296,15 +1282,23 @@ async def restful_resource_handler(req, resp, param=None):
     # This one is actually for simply development of RestAPI
     if req.query_string != b'':
         data.update(parse_query_string(req.query_string.decode()))
+    # Cached response, if route has cache enabled
+    cache = req.params.get('_cache') if req.method == b'GET' else None
+    if cache:
+        store, ttl, version = cache
+        if version:
+            version = version()
+        key = req.path + b'?' + req.query_string
+        entry = store.get(key, version)
+        if entry:
+            await _send_cached(req, resp, entry[0], entry[1])
+            return
     # Call actual handler
     _handler, _kwargs = req.params['_callmap'][req.method]
     # Collect garbage before / after handler execution
-    gc.collect()
-    if param:
-        res = _handler(data, param, **_kwargs)
-    else:
-        res = _handler(data, **_kwargs)
-    gc.collect()
+    collect()
+    res = _handler(data, *param, **_kwargs)
+    collect()
     # Handler result could be:
     # 1. generator - in case of large payload
     # 2. string - just string :)
@@ -312,24 +1306,27 @@ async def restful_resource_handler(req, resp, param=None):
     # it can also return error code together with str / dict
     # res = {'blah': 'blah'}
     # res = {'blah': 'blah'}, 201
-    if isinstance(res, type_gen):
-        # Result is generator, use chunked response
+    if isinstance(res, type_gen) or hasattr(res, '__aiter__'):
+        # Result is generator (sync or async), use chunked response
         # NOTICE: HTTP 1.0 by itself does not support chunked responses, so, making workaround:
         # Response is HTTP/1.1 with Connection: close
-        resp.version = '1.1'
-        resp.add_header('Connection', 'close')
-        resp.add_header('Content-Type', 'application/json')
+        if resp.version != '1.1':
+            resp.version = '1.1'
+            resp.keep_alive = False
+        resp.add_header_block(_HDR_JSON)
         resp.add_header('Transfer-Encoding', 'chunked')
         resp.add_access_control_headers()
         await resp._send_headers()
         # Drain generator
-        for chunk in res:
-            chunk_len = len(chunk.encode('utf-8'))
-            await resp.send('{:x}\r\n'.format(chunk_len))
-            await resp.send(chunk)
-            await resp.send('\r\n')
-            gc.collect()
-        await resp.send('0\r\n\r\n')
+        w = chunkedwriter(resp.writer, write_timeout=resp.write_timeout)
+        if isinstance(res, type_gen):
+            for chunk in res:
+                await w.write(chunk)
+        else:
+            async for chunk in res:
+                await w.write(chunk)
+        await w.close()
+        resp.bytes_sent += w.sent
     else:
         if type(res) is tuple:
             resp.code = res[1]
@@ -338,22 +1335,53 @@ async def restful_resource_handler(req, resp, param=None):
             raise Exception('Result expected')
         # Send response
         if type(res) is dict:
-            res_str = json.dumps(res)
-        else:
-            res_str = res
-        resp.add_header('Content-Type', 'application/json')
-        resp.add_header('Content-Length', str(len(res_str)))
+            res = json.dumps(res)
+        # Content-Length counts bytes, not characters
+        body = res.encode() if isinstance(res, str) else res
+        if cache and resp.code == 200:
+            await _send_cached(req, resp, body, store.put(key, body, ttl, version))
+            return
+        resp.add_header_block(_HDR_JSON)
+        resp.add_header('Content-Length', len(body))
         resp.add_access_control_headers()
         await resp._send_headers()
-        await resp.send(res_str)
+        await resp.send(body)
+
+
+class middleware:
+    """Base class of request hooks, see webserver.add_middleware().
+    Hooks are called in order of installation, must not block.
+    req.params is None until URL handler was found (and for unknown URLs).
+    """
+
+    def request_start(self, req, resp):
+        """Called before request is read / parsed"""
+        pass
+
+    def handler_start(self, req, resp):
+        """Called right before URL handler"""
+        pass
+
+    def handler_end(self, req, resp):
+        """Called after URL handler returned or raised"""
+        pass
+
+    def request_end(self, req, resp):
+        """Called when request processing is finished, even on error"""
+        pass
 
 
 class webserver:
 
-    def __init__(self, request_timeout=3, max_concurrency=3, backlog=16, debug=False):
+    def __init__(self, request_timeout=3, max_concurrency=3, backlog=16, debug=False,
+                 keep_alive_timeout=5, max_keep_alive_requests=20, max_idle_connections=2,
+                 max_line_size=512, max_headers=30,
+                 max_queue=4, queue_timeout=2, handler_timeout=None, read_timeout=5,
+                 write_timeout=5, cache_size=4096):
         """Tiny Web Server class.
         Keyword arguments:
             request_timeout - Time for client to send complete request
+                              (request line and headers)
                               after that connection will be closed.
             max_concurrency - How many connections can be processed concurrently.
                               It is very important to limit this number because of
@@ -361,37 +1389,129 @@ class webserver:
                               Default value depends on platform
             backlog         - Parameter to socket.listen() function. Defines size of
                               pending to be accepted connections queue.
-                              Must be greater than max_concurrency
+            max_queue       - How many accepted connections can wait for one of
+                              max_concurrency slots. When queue is full new
+                              connections are rejected with HTTP 503 at once.
+            queue_timeout   - Max time connection waits in queue, HTTP 503 after that.
+            handler_timeout - Max total time of URL handler execution, None - unlimited.
+                              Covers streaming (send_file(), read_multipart())
+                              as well, so it is better left unlimited when
+                              handlers move big bodies: read_timeout and
+                              write_timeout already stop clients that stall.
+            read_timeout    - Max time to wait for next part of request
+                              body, None - unlimited.
+            write_timeout   - Max time to wait for client to accept (part of)
+                              response, None - unlimited.
+            cache_size      - Byte budget of cache of RESTful GET responses,
+                              allocated only if some resource enables caching.
             debug           - Whether send exception info (text + backtrace)
                               to client together with HTTP 500 or not.
+            keep_alive_timeout - How long an idle persistent connection waits
+                              for the next request before it is closed.
+                              While idle it does not hold one of max_concurrency
+                              slots, the next request is admitted like a new
+                              connection. Set to 0 to disable keep-alive.
+            max_keep_alive_requests - Max number of requests served by one
+                              connection, so a single client cannot hold
+                              one of max_concurrency slots forever.
+            max_idle_connections - How many persistent connections may wait
+                              idle for the next request. Each keeps its line
+                              and header buffers (max_line_size + HEADER_BUF_SIZE
+                              bytes), so beyond that responses close the connection.
+            max_line_size   - Size of per connection buffer used to read request
+                              line and headers, longer lines are rejected
+                              with HTTP 431.
+            max_headers     - Max number of request headers, HTTP 431 if exceeded.
         """
         self.loop = asyncio.get_event_loop()
         self.request_timeout = request_timeout
         self.max_concurrency = max_concurrency
         self.backlog = backlog
         self.debug = debug
-        self.explicit_url_map = {}
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_keep_alive_requests = max_keep_alive_requests
+        self.max_idle_connections = max_idle_connections
+        self.max_line_size = max_line_size
+        self.max_headers = max_headers
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.handler_timeout = handler_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        # Admission control
+        self.slots = semaphore(max_concurrency)
+        # Instrumentation hooks (middleware instances)
+        self.middleware = []
+        # Response cache (responsecache), see add_resource()
+        self.cache_size = cache_size
+        self.cache = None
+        # Routing trie, root node matches '/'
+        self.url_tree = _routenode()
         self.catch_all_handler = None
-        self.parameterized_url_map = {}
-        # Currently opened connections
+        # Currently opened connections: socket id -> task
         self.conns = {}
         # Statistics
         self.processed_connections = 0
+        self.processed_requests = 0
+        self.queued = 0
+        self.idle = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # Last HANDLER_TIME_SAMPLES handler times (ms), ring buffer
+        self.handler_times = []
+        self._handler_time_idx = 0
+
+    HANDLER_TIME_SAMPLES = 64
+
+    def add_middleware(self, mw):
+        """Install request hooks (instance of middleware subclass)"""
+        self.middleware.append(mw)
+
+    def stats(self):
+        """Returns dict of server counters.
+        p50 / p99 are percentiles of recent handler times, in ms.
+        """
+        times = sorted(self.handler_times)
+        n = len(times)
+        return {'connections': self.processed_connections,
+                'requests': self.processed_requests,
+                'active': self.max_concurrency - self.slots.value,
+                'queued': self.queued,
+                'idle': self.idle,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'handler_ms_p50': times[n // 2] if n else 0,
+                'handler_ms_p99': times[n * 99 // 100] if n else 0,
+                'cache_hits': self.cache.hits if self.cache else 0,
+                'cache_misses': self.cache.misses if self.cache else 0,
+                'cache_bytes': self.cache.size if self.cache else 0,
+                }
+
+    def _record_handler_time(self, ms):
+        if len(self.handler_times) < self.HANDLER_TIME_SAMPLES:
+            self.handler_times.append(ms)
+        else:
+            self.handler_times[self._handler_time_idx] = ms
+            self._handler_time_idx = (self._handler_time_idx + 1) % self.HANDLER_TIME_SAMPLES
 
     def _find_url_handler(self, req):
         """Helper to find URL handler.
-        Returns tuple of (function, opts, param) or (None, None) if not found.
-        """
-        # First try - lookup in explicit (non parameterized URLs)
-        if req.path in self.explicit_url_map:
-            return self.explicit_url_map[req.path]
-        # Second try - strip last path segment and lookup in another map
-        idx = req.path.rfind(b'/') + 1
-        path2 = req.path[:idx]
-        if len(path2) > 0 and path2 in self.parameterized_url_map:
-            # Save parameter into request
-            req._param = req.path[idx:].decode()
-            return self.parameterized_url_map[path2]
+        Cost depends on path depth, not on number of routes.
+        Values of URL parameters are saved into req.url_params.
+        Returns tuple of (function, opts) or (None, None) if not found.
+        """
+        if req.path[:1] == b'/':
+            values = []
+            node = self.url_tree.lookup(req.path[1:].split(b'/'), 0, values)
+            if node:
+                req.url_params = values
+                if req.method in node.handlers:
+                    return node.handlers[req.method]
+                # Path exists, but method is not allowed (or OPTIONS):
+                # any handler will do, every route of path allows the same
+                # methods, see add_route()
+                for h in node.handlers.values():
+                    return h
 
         if self.catch_all_handler:
             return self.catch_all_handler
@@ -400,7 +1520,8 @@ class webserver:
         return (None, None)
 
     async def _handle_request(self, req, resp):
-        await req.read_request_line()
+        if not req.method:
+            await req.read_request_line()
         # Find URL handler
         req.handler, req.params = self._find_url_handler(req)
         if not req.handler:
@@ -412,16 +1533,141 @@ class webserver:
         resp.params = req.params
         # Read / parse headers
         await req.read_headers(req.params['save_headers'])
+        if req.version == b'HTTP/1.1':
+            resp.version = '1.1'
+        resp.keep_alive = (self.keep_alive_timeout > 0 and self.idle < self.max_idle_connections and
+                           req.keep_alive())
 
     async def _handler(self, reader, writer):
         """Handler for TCP connection with
-        HTTP/1.0 protocol implementation
+        HTTP/1.0 and HTTP/1.1 (persistent connections) protocol implementation.
+        Called holding one of max_concurrency slots, releases it when done.
         """
-        gc.collect()
+        held = True
+        try:
+            # Line buffer is shared by all requests of connection, since it may
+            # already contain beginning of the next (pipelined) request
+            reader = bufreader(reader, self.max_line_size)
+            reader.read_timeout = self.read_timeout
+            hbuf = memoryview(bytearray(HEADER_BUF_SIZE))
+            served = 0
+            while True:
+                # Header parsing does not allocate per line, so single
+                # collection per request is enough
+                collect()
+                req = request(reader, self.max_headers)
+                resp = response(writer, hbuf)
+                resp.write_timeout = self.write_timeout
+                if served > 0:
+                    # Others may have gone idle since the response was sent
+                    if self.idle >= self.max_idle_connections:
+                        break
+                    # Wait for next request on persistent connection. Idle connection
+                    # gives its slot up, so it does not keep others in queue
+                    self.slots.release()
+                    held = False
+                    self.idle += 1
+                    try:
+                        await asyncio.wait_for(req.read_request_line(),
+                                               self.keep_alive_timeout)
+                    except (ConnectionClosed, HTTPException, asyncio.TimeoutError, OSError):
+                        break
+                    finally:
+                        self.idle -= 1
+                    if not await self._admit():
+                        self.rejected += 1
+                        await self._reject(reader, writer)
+                        break
+                    held = True
+                if not await self._handle_one(req, resp):
+                    break
+                served += 1
+                # Request body left unread by handler would be parsed
+                # as the next request
+                if req.content_length and not req.body_consumed:
+                    break
+                if served >= self.max_keep_alive_requests:
+                    break
+        finally:
+            if held:
+                self.slots.release()
+            await writer.aclose()
 
+    async def _admit(self):
+        """Wait for one of max_concurrency slots, in queue (FIFO) if none is free.
+        Returns False if queue is full or slot was not freed within queue_timeout.
+        """
+        if not self.slots.locked():
+            await self.slots.acquire()
+            return True
+        if self.queued >= self.max_queue:
+            return False
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.queued -= 1
+
+    async def _accept(self, reader, writer):
+        """Admission control for accepted connection.
+        Connection is served when one of max_concurrency slots is free,
+        otherwise waits in queue (FIFO). If queue is full or slot was not
+        freed within queue_timeout - connection is rejected with HTTP 503.
+        The slot is held by _handler() while it serves requests.
+        """
+        self.processed_connections += 1
+        if not await self._admit():
+            self.rejected += 1
+            try:
+                await self._reject(reader, writer)
+            finally:
+                await writer.aclose()
+            return
+        # Keep task in the map - to be able to shutdown gracefully
+        hid = id(writer.s)
+        self.conns[hid] = asyncio.current_task()
+        try:
+            await self._handler(reader, writer)
+        finally:
+            del self.conns[hid]
+
+    async def _reject(self, reader, writer):
+        """Send HTTP 503 without parsing (rest of) request"""
+        try:
+            writer.write(b'HTTP/1.0 503 Service Unavailable\r\nContent-Length: 0\r\nRetry-After: 1\r\n\r\n')
+            await _drain(writer, self.write_timeout)
+            # Closing socket with unread data makes TCP stack reset
+            # connection, and client may not get the response
+            await asyncio.wait_for(reader.read(self.max_line_size), 0.1)
+        except Exception:
+            pass
+
+    async def _handle_one(self, req, resp):
+        """Process one HTTP request.
+        Returns True if connection can be used for the next request.
+        """
+        if not self.middleware:
+            return await self._process(req, resp)
+        for mw in self.middleware:
+            mw.request_start(req, resp)
+        try:
+            return await self._process(req, resp)
+        finally:
+            for mw in self.middleware:
+                mw.request_end(req, resp)
+
+    async def _call_handler(self, req, resp):
+        if self.handler_timeout:
+            await asyncio.wait_for(req.handler(req, resp, *req.url_params),
+                                   self.handler_timeout)
+        else:
+            await req.handler(req, resp, *req.url_params)
+
+    async def _process(self, req, resp):
         try:
-            req = request(reader)
-            resp = response(writer)
             # Read HTTP Request with timeout
             await asyncio.wait_for(self._handle_request(req, resp),
                                    self.request_timeout)
@@ -429,37 +1675,53 @@ class webserver:
             # OPTIONS method is handled automatically
             if req.method == b'OPTIONS':
                 resp.add_access_control_headers()
-                # Since we support only HTTP 1.0 - it is important
-                # to tell browser that there is no payload expected
+                # It is important to tell browser that there is no payload expected
                 # otherwise some webkit based browsers (Chrome)
                 # treat this behavior as an error
                 resp.add_header('Content-Length', '0')
                 await resp._send_headers()
-                return
+                return resp.keep_alive
 
             # Ensure that HTTP method is allowed for this path
             if req.method not in req.params['methods']:
+                # Methods of all routes of path, see add_route()
+                resp.add_header('Allow', req.params['allowed_access_control_methods'])
                 raise HTTPException(405)
 
             # Handle URL
-            gc.collect()
-            if hasattr(req, '_param'):
-                await req.handler(req, resp, req._param)
+            collect()
+            started = time.ticks_ms()
+            if self.middleware:
+                for mw in self.middleware:
+                    mw.handler_start(req, resp)
+                try:
+                    await self._call_handler(req, resp)
+                finally:
+                    for mw in self.middleware:
+                        mw.handler_end(req, resp)
             else:
-                await req.handler(req, resp)
+                await self._call_handler(req, resp)
+            self._record_handler_time(time.ticks_diff(time.ticks_ms(), started))
+            self.processed_requests += 1
             # Done here
-        except (asyncio.CancelledError, asyncio.TimeoutError):
+            return resp.keep_alive
+        except asyncio.TimeoutError:
+            # Read / handler / write deadline exceeded
+            self.timed_out += 1
+        except (asyncio.CancelledError, ConnectionClosed):
             pass
         except OSError as e:
             # Do not send response for connection related errors - too late :)
             # P.S. code 32 - is possible BROKEN PIPE error (TODO: is it true?)
             if e.args[0] not in (errno.ECONNABORTED, errno.ECONNRESET, 32):
                 try:
+                    resp.keep_alive = False
                     await resp.error(500)
                 except Exception as e:
                     log.exc(e, "")
         except HTTPException as e:
             try:
+                resp.keep_alive = False
                 await resp.error(e.code)
             except Exception as e:
                 log.exc(e)
@@ -468,30 +1730,27 @@ class webserver:
             log.error(req.path.decode())
             log.exc(e, "")
             try:
+                resp.keep_alive = False
                 await resp.error(500)
                 # Send exception info if desired
                 if self.debug:
                     sys.print_exception(e, resp.writer.s)
             except Exception:
                 pass
-        finally:
-            await writer.aclose()
-            # Max concurrency support -
-            # if queue is full schedule resume of TCP server task
-            if len(self.conns) == self.max_concurrency:
-                self.loop.create_task(self._server_coro)
-            # Delete connection, using socket as a key
-            del self.conns[id(writer.s)]
+        return False
 
     def add_route(self, url, f, **kwargs):
         """Add URL to function mapping.
         Arguments:
-            url - url to map function with
+            url - url to map function with. Path segments like <name> or
+                  <int:idx> are parameters, passed to function as positional
+                  arguments in order of appearance. Converters: str (default), int.
+                  The same url can be added several times with different methods.
             f - function to map
         Keyword arguments:
-            methods - list of allowed methods. Defaults to ['GET', 'POST']
-            save_headers - contains list of HTTP headers to be saved. Case sensitive. Default - empty.
-            max_body_size - Max HTTP body size (e.g. POST form data). Defaults to 1024
+            methods - list of allowed methods. Defaults to ['GET']
+            save_headers - contains list of HTTP headers to be saved. Case insensitive. Default - empty.
+            max_body_size - Max HTTP body read as whole (e.g. JSON form data). Defaults to 1024
             allowed_access_control_headers - Default value for the same name header. Defaults to *
             allowed_access_control_origins - Default value for the same name header. Defaults to *
         """
@@ -505,30 +1764,61 @@ class webserver:
                   'allowed_access_control_origins': '*',
                   }
         params.update(kwargs)
-        params['allowed_access_control_methods'] = ', '.join(params['methods'])
+        params['url'] = url
         # Convert methods/headers to bytestring
         params['methods'] = [x.encode() for x in params['methods']]
         params['save_headers'] = [x.encode() for x in params['save_headers']]
-        # If URL has a parameter
-        if url.endswith('>'):
-            idx = url.rfind('<')
-            path = url[:idx]
-            idx += 1
-            param = url[idx:-1]
-            if path.encode() in self.parameterized_url_map:
+        # Build trie path for URL, like /calendars/<name>/events/<int:idx>
+        node = self.url_tree
+        for seg in url.lstrip('/').split('/'):
+            if seg.startswith('<') and seg.endswith('>'):
+                name = seg[1:-1]
+                conv = 'str'
+                if ':' in name:
+                    conv, name = name.split(':', 1)
+                if conv not in url_param_converters:
+                    raise ValueError('Unknown converter ' + conv)
+                if node.param is None:
+                    node.param = (name, url_param_converters[conv], _routenode())
+                elif node.param[1] is not url_param_converters[conv]:
+                    raise ValueError('Conflicting URL parameter')
+                node = node.param[2]
+            else:
+                seg = seg.encode()
+                if seg not in node.children:
+                    node.children[seg] = _routenode()
+                node = node.children[seg]
+        for m in params['methods']:
+            if m in node.handlers:
                 raise ValueError('URL exists')
-            params['_param_name'] = param
-            self.parameterized_url_map[path.encode()] = (f, params)
+        for m in params['methods']:
+            node.handlers[m] = (f, params)
+        # Preflight (OPTIONS) is answered from params of any route of path,
+        # so each of them allows methods of all routes of path
+        allowed = ', '.join(m.decode() for m in node.handlers)
+        for _, p in node.handlers.values():
+            p['allowed_access_control_methods'] = allowed
+            p['_access_control_block'] = _access_control_block(p)
 
-        if url.encode() in self.explicit_url_map:
-            raise ValueError('URL exists')
-        self.explicit_url_map[url.encode()] = (f, params)
+    def _resource_cache(self, cache_ttl, cache_version):
+        """Route cache settings for add_route(_cache=...), None if disabled"""
+        if cache_ttl is None and cache_version is None:
+            return None
+        if self.cache is None:
+            self.cache = responsecache(self.cache_size)
+        return (self.cache, cache_ttl, cache_version)
 
-    def add_resource(self, cls, url, **kwargs):
+    def add_resource(self, cls, url, cache_ttl=None, cache_version=None, **kwargs):
         """Map resource (RestAPI) to URL
         Arguments:
             cls - Resource class to map to
             url - url to map to class
+            cache_ttl - Cache serialized GET responses for that many seconds.
+            cache_version - Cache GET responses while this function returns
+                            the same value (e.g. time of last data update).
+                            With both set whichever invalidates first wins.
+                            Cached responses carry ETag, If-None-Match gets 304.
+                            Responses of generators are never cached.
             kwargs - User defined key args to pass to the handler.
         Example:
             class myres():
@@ -551,8 +1841,9 @@ class webserver:
                 callmap[m.encode()] = (getattr(obj, fn), kwargs)
         self.add_route(url, restful_resource_handler,
                        methods=methods,
-                       save_headers=['Content-Length', 'Content-Type'],
-                       _callmap=callmap)
+                       save_headers=['Content-Length', 'Content-Type', 'If-None-Match'],
+                       _callmap=callmap,
+                       _cache=self._resource_cache(cache_ttl, cache_version))
 
     def catchall(self):
         """Decorator for catchall()
@@ -563,7 +1854,7 @@ class webserver:
                 await response.start_html()
                 await response.send('<html><body><h1>My custom 404!</h1></html>\n')
         """
-        params = {'methods': [b'GET'], 'save_headers': [], 'max_body_size': 1024, 'allowed_access_control_headers': '*', 'allowed_access_control_origins': '*'}
+        params = {'methods': [b'GET'], 'save_headers': [], 'max_body_size': 1024, 'allowed_access_control_headers': '*', 'allowed_access_control_origins': '*', 'url': '*'}
 
         def _route(f):
             self.catch_all_handler = (f, params)
@@ -583,7 +1874,7 @@ class webserver:
             return f
         return _route
 
-    def resource(self, url, method='GET', **kwargs):
+    def resource(self, url, method='GET', cache_ttl=None, cache_version=None, **kwargs):
         """Decorator for add_resource() method
         Examples:
             @app.resource('/users')
@@ -595,53 +1886,25 @@ class webserver:
                 yield '"topic_id": "{}",'.format(topic_id)
                 yield '"message": "test",'
                 yield '}'
+            @app.resource('/status', cache_version=lambda: app_state.last_update)
+            def status(data):
+                return {'events': events}
         """
         def _resource(f):
             self.add_route(url, restful_resource_handler,
                            methods=[method],
-                           save_headers=['Content-Length', 'Content-Type'],
-                           _callmap={method.encode(): (f, kwargs)})
+                           save_headers=['Content-Length', 'Content-Type', 'If-None-Match'],
+                           _callmap={method.encode(): (f, kwargs)},
+                           _cache=self._resource_cache(cache_ttl, cache_version))
             return f
         return _resource
 
     async def _tcp_server(self, host, port, backlog):
         """TCP Server implementation.
-        Opens socket for accepting connection and
-        creates task for every new accepted connection
-        """
-        addr = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][-1]
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.setblocking(False)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock.bind(addr)
-        sock.listen(backlog)
-        try:
-            while True:
-                if IS_UASYNCIO_V3:
-                    yield uasyncio.core._io_queue.queue_read(sock)
-                else:
-                    yield asyncio.IORead(sock)
-                csock, caddr = sock.accept()
-                csock.setblocking(False)
-                # Start handler / keep it in the map - to be able to
-                # shutdown gracefully - by close all connections
-                self.processed_connections += 1
-                hid = id(csock)
-                handler = self._handler(asyncio.StreamReader(csock),
-                                        asyncio.StreamWriter(csock, {}))
-                self.conns[hid] = handler
-                self.loop.create_task(handler)
-                # In case of max concurrency reached - temporary pause server:
-                # 1. backlog must be greater than max_concurrency, otherwise
-                #    client will got "Connection Reset"
-                # 2. Server task will be resumed whenever one active connection finished
-                if len(self.conns) == self.max_concurrency:
-                    # Pause
-                    yield False
-        except asyncio.CancelledError:
-            return
-        finally:
-            sock.close()
+        Opens socket for accepting connection, every accepted
+        connection goes through admission control (see _accept)
+        """
+        self._server = await asyncio.start_server(self._accept, host, port, backlog)
 
     def run(self, host="127.0.0.1", port=8081, loop_forever=True):
         """Run Web Server. By default it runs forever.
@@ -657,6 +1920,6 @@ class webserver:
 
     def shutdown(self):
         """Gracefully shutdown Web Server"""
-        asyncio.cancel(self._server_coro)
-        for hid, coro in self.conns.items():
-            asyncio.cancel(coro)
+        self._server.close()
+        for task in self.conns.values():
+            task.cancel()
@@ -3,9 +3,17 @@ import time
 from machine import reset
 import inky_helper as ih
 import sys
+import phase_timer
+import event_log
 from picographics import PicoGraphics, DISPLAY_INKY_FRAME_7 as DISPLAY  # 7.3"
 
 
+# Times the stages of this wake; the boot phase runs from power on until the first start()
+phases = phase_timer.PhaseTimer()
+# Buffered in RAM and written out once per wake, or right away for errors
+log = event_log.EventLog()
+log.info(event_log.CODE_BOOT)
+
 # A short delay to give USB chance to initialise
 time.sleep(1)
 
@@ -19,7 +27,8 @@ running_app = None
 # Setup for SD card
 sd_card = None
 sd_card_mount_point = "/sdcard"
-logfile = "/sdcard/execution-log.log"
+# Set once the SD card is mounted, until then the phase record is parked on flash
+phase_log = None
 
 
 def launcher():
@@ -86,6 +95,25 @@ def launcher():
         #     time.sleep(0.5)
         #     reset()
 
+
+def sleep_until_next_wake():
+    phases.start(phase_timer.PHASE_SLEEP)
+    gc.collect()
+    ih.clear_all_leds()
+    time.sleep(1)    
+    log.info(event_log.CODE_SLEEP, 30)
+    log.flush()
+    phases.save(phase_log)
+    ih.inky_frame.sleep_for(30)
+    reset()
+
+
+def reset_after_error(code, e):
+    log.error(code, event_log.error_arg(e), str(e))
+    phases.fail()
+    phases.save(phase_log)
+    reset()
+
 # Turn any LEDs off that may still be on from last run.
 ih.clear_button_leds()
 ih.led_busy.off()
@@ -105,12 +133,37 @@ else:
     print("No state.json file found, launching the launcher")
     launcher()
 
+# Fast path: when the cached events are still within the app's update interval,
+# redraw from the cache without mounting the SD card or turning the radio on.
+# The RTC has to be trusted as well, otherwise the radio is needed for the time sync anyway.
+try:
+    phases.start(phase_timer.PHASE_CACHE)
+    cached = running_app.load_cache()
+    ih.load_time_from_rtc()
+    if cached and running_app.is_cache_fresh() and not ih.time_sync_due():
+        print("Cached calendar data is fresh, skipping WiFi")
+        log.info(event_log.CODE_FAST_PATH)
+        phases.flags |= phase_timer.FLAG_FAST_PATH
+        ih.progress_bar_fill("e")
+        phases.start(phase_timer.PHASE_DRAW)
+        running_app.draw(display)
+        sleep_until_next_wake()
+except Exception as e:
+    print("Fast path failed, falling back to a full update:", e)
+    log.warning(event_log.CODE_FAST_PATH, event_log.error_arg(e), str(e))
+    phases.end(phase_timer.STATUS_FAILED)
+    phases.flags &= ~phase_timer.FLAG_FAST_PATH
+    ih.progress_bar_clear()
+
 try:
+    phases.start(phase_timer.PHASE_MOUNT)
     sd_card = ih.init_sd_card()
     ih.mount_sd_card(sd_card, sd_card_mount_point)
+    phase_log = sd_card_mount_point + "/wake-phases.bin"
+    log.path = sd_card_mount_point + "/events"
 except Exception as e:
     ih.show_error(display,"Could not mount the SD card: " + str(e)) 
-    reset()
+    reset_after_error(event_log.CODE_SD_MOUNT, e)
 
 if not sd_card_mount_point in sys.path:
     print("Adding SD card mount point to sys.path")
@@ -118,13 +171,7 @@ if not sd_card_mount_point in sys.path:
     print("SD card mount point added to sys.path, sys.path is now:", sys.path)
 
 try:
-    print("Getting secrets for the app")
-    from secrets import API_AUTH_HEADER, API_AUTH_KEY, API_URL
-    running_app.set_api_info(API_AUTH_HEADER, API_AUTH_KEY, API_URL)
-except ImportError as e:
-    ih.show_error(display,"Could not get api info from "+sd_card_mount_point+"/"+"secrets.py: "+str(e))
-    reset()
-try:
+    phases.start(phase_timer.PHASE_SECRETS)
     ih.progress_bar_fill("a")
     print("Getting WiFi credentials")
     from secrets import WIFI_SSID, WIFI_PASSWORD
@@ -132,51 +179,71 @@ try:
 except ImportError as e:
     ih.progress_bar_clear()
     ih.show_error(display,"Could not get wifi info from "+sd_card_mount_point+"/"+"secrets.py: "+str(e))
-    reset()
+    reset_after_error(event_log.CODE_SECRETS, e)
+
+# Start the association right away; the rest of the secrets are loaded while the radio connects
+try: 
+    phases.start(phase_timer.PHASE_WIFI)
+    ih.progress_bar_fill("b")
+    wlan = ih.network_begin(WIFI_SSID, WIFI_PASSWORD)
+except Exception as e:
+    ih.progress_bar_clear()
+    reset_after_error(event_log.CODE_WIFI, e)
+
+try:
+    print("Getting secrets for the app")
+    from secrets import API_AUTH_HEADER, API_AUTH_KEY, API_URL
+    running_app.set_api_info(API_AUTH_HEADER, API_AUTH_KEY, API_URL)
+except ImportError as e:
+    ih.progress_bar_clear()
+    ih.show_error(display,"Could not get api info from "+sd_card_mount_point+"/"+"secrets.py: "+str(e))
+    reset_after_error(event_log.CODE_SECRETS, e)
 
 gc.collect()
 
 try: 
-    ih.progress_bar_fill("b")
-    ih.network_connect(WIFI_SSID, WIFI_PASSWORD)
+    ih.network_wait(wlan, WIFI_SSID, WIFI_PASSWORD)
 except Exception as e:
     ih.progress_bar_clear()
-    reset()
+    reset_after_error(event_log.CODE_WIFI, e)
 
 
-# Syncs the time
+# Syncs the time, unless the RTC can still be trusted
 try:
+    phases.start(phase_timer.PHASE_TIME)
     ih.progress_bar_fill("c")
-    ih.sync_time()
+    if ih.time_sync_due():
+        ih.sync_time()
+    else:
+        print("RTC is within the drift bound, skipping the time sync")
 except Exception as e:
     ih.progress_bar_clear()
-    reset()
+    reset_after_error(event_log.CODE_TIME_SYNC, e)
 gc.collect()
 
 
 # Gets the data to draw on the screen
 try:
+    phases.start(phase_timer.PHASE_UPDATE)
     ih.progress_bar_fill("d")
     running_app.update()
 except Exception as e:
     ih.progress_bar_clear()
-    reset()
+    reset_after_error(event_log.CODE_UPDATE, e)
 gc.collect()
 
 
 # Draws the data on the screen
 try:
+    phases.start(phase_timer.PHASE_DRAW)
     ih.progress_bar_fill("e")
     running_app.draw(display)
 except Exception as e:
     ih.progress_bar_clear
-    reset()
+    reset_after_error(event_log.CODE_DRAW, e)
 else:
+    phases.start(phase_timer.PHASE_LEDS)
     ih.illuminate_button_leds(10)
 
 
-gc.collect()
-ih.clear_all_leds()
-time.sleep(1)    
-ih.inky_frame.sleep_for(30)
-reset()
\ No newline at end of file
+sleep_until_next_wake()
@@ -0,0 +1,41 @@
+"""Records parked on flash while the SD card is not mounted.
+
+The cached fast path does not mount the SD card, so event_log and
+phase_timer park their records in a pending file on flash with park();
+the next append() to the SD card writes them out first and removes the
+pending file. Records that do not fit in MAX_SIZE are dropped rather than
+filling the flash.
+"""
+import uos
+
+MAX_SIZE = 1024
+
+
+def file_size(path):
+    """Size of the file in bytes, 0 if it does not exist."""
+    try:
+        return uos.stat(path)[6]
+    except OSError:
+        return 0
+
+
+def park(pending, data, max_size=MAX_SIZE):
+    """Appends data to the pending file, returns False when it did not fit and was dropped."""
+    if file_size(pending) + len(data) > max_size:
+        return False
+    with open(pending, "ab") as f:
+        f.write(data)
+    return True
+
+
+def append(path, data, pending):
+    """Appends the records parked in the pending file, then data, to path."""
+    parked = b""
+    if file_size(pending):
+        with open(pending, "rb") as f:
+            parked = f.read()
+    with open(path, "ab") as f:
+        f.write(parked)
+        f.write(data)
+    if parked:
+        uos.remove(pending)
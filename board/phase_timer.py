@@ -0,0 +1,108 @@
+"""Timing of the phases of a wake, kept as compact binary records on the SD card.
+
+PhaseTimer measures each stage of main.py with utime.ticks_ms() and takes a
+heap snapshot (gc.mem_alloc(), gc.mem_free()) when the stage ends. save()
+appends one record per wake, all little-endian:
+    header: version, number of phases (B, B), flags (H), wake time (I, seconds), total ms (I)
+    phase:  phase id, status (B, B), ms (I), heap allocated, heap free (H, H, in 16 byte units)
+The boot phase runs from power on (ticks 0) until the first start().
+
+The cached fast path does not mount the SD card, so its record is parked in
+PENDING_FILE on flash, and moved to the SD card by the next wake that mounts it,
+see pending_records.
+"""
+import gc
+import struct
+import utime
+import pending_records
+
+VERSION = 1
+HEADER = "<BBHII"
+PHASE = "<BBIHH"
+HEADER_SIZE = struct.calcsize(HEADER)
+PHASE_SIZE = struct.calcsize(PHASE)
+
+PHASE_BOOT, PHASE_CACHE, PHASE_MOUNT, PHASE_SECRETS, PHASE_WIFI, PHASE_TIME, PHASE_UPDATE, PHASE_DRAW, PHASE_LEDS, PHASE_SLEEP = range(10)
+PHASE_NAMES = ("boot", "cache", "mount", "secrets", "wifi", "time", "update", "draw", "leds", "sleep")
+
+STATUS_OK = 0
+STATUS_FAILED = 1
+
+# Header flags
+FLAG_FAST_PATH = 1  # drawn from the cache, without the radio
+FLAG_FAILED = 2     # the wake ended with a reset after an error
+
+PENDING_FILE = "/phases-pending.bin"
+
+
+def _heap_units(n):
+    return min(n >> 4, 0xFFFF)
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.phases = []
+        self.flags = 0
+        self.current = PHASE_BOOT
+        self.started = 0
+
+    def start(self, phase):
+        """Ends the current phase and starts the next one."""
+        self.end()
+        self.current = phase
+        self.started = utime.ticks_ms()
+
+    def end(self, status=STATUS_OK):
+        if self.current is None:
+            return
+        ms = utime.ticks_diff(utime.ticks_ms(), self.started)
+        self.phases.append((self.current, status, ms, _heap_units(gc.mem_alloc()), _heap_units(gc.mem_free())))
+        self.current = None
+
+    def fail(self):
+        """Ends the current phase as failed, and marks the wake as failed."""
+        self.end(STATUS_FAILED)
+        self.flags |= FLAG_FAILED
+
+    def encode(self):
+        total = utime.ticks_ms()
+        record = bytearray(HEADER_SIZE + PHASE_SIZE * len(self.phases))
+        struct.pack_into(HEADER, record, 0, VERSION, len(self.phases), self.flags,
+                         max(0, utime.time() - total // 1000), total)
+        offset = HEADER_SIZE
+        for phase in self.phases:
+            struct.pack_into(PHASE, record, offset, *phase)
+            offset += PHASE_SIZE
+        return record
+
+    def save(self, path=None):
+        """Ends the current phase and appends the record of this wake to path.
+        With path None (SD card not mounted) the record is parked in PENDING_FILE.
+        """
+        self.end()
+        record = self.encode()
+        try:
+            if path is None:
+                pending_records.park(PENDING_FILE, record)
+            else:
+                pending_records.append(path, record, PENDING_FILE)
+        except OSError as e:
+            print("Failed to save the phase timings", e)
+
+
+def decode(data):
+    """Yields (wake_time, total_ms, flags, phases) for the records in data,
+    phases being (phase, status, ms, heap allocated, heap free) tuples with the heap in bytes.
+    """
+    offset = 0
+    while offset + HEADER_SIZE <= len(data):
+        version, count, flags, wake_time, total = struct.unpack_from(HEADER, data, offset)
+        if version != VERSION:
+            raise ValueError("Unsupported phase record version", version)
+        offset += HEADER_SIZE
+        phases = []
+        for _ in range(count):
+            phase, status, ms, alloc, free = struct.unpack_from(PHASE, data, offset)
+            phases.append((phase, status, ms, alloc << 4, free << 4))
+            offset += PHASE_SIZE
+        yield wake_time, total, flags, phases
@@ -0,0 +1,64 @@
+"""Peak allocation of decoding the calendar response on the host.
+
+Compares what InkyApp.update used to do (buffer the body, json.loads it)
+with the streaming EventStreamDecoder, for payloads of 5, 50 and 500 events.
+The streamed events are checked against what json.loads gives, cut to the
+decoder's limits.
+Run from the repository root:
+    python host/benchmarks/bench_calendar_decode.py
+"""
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "board"))
+
+from calendar_decoder import EventStreamDecoder  # noqa: E402
+
+SUMMARY = "Quarterly planning with the extended team, room 4.12 (bring laptops) "
+
+
+def make_payload(num_events):
+    events = [{"dateTime": "{:02d}.Jan.{:02d}:30".format(i % 28 + 1, i % 24), "summary": SUMMARY * 2}
+              for i in range(num_events)]
+    return json.dumps(events).encode()
+
+
+def decode_json(payload):
+    return json.loads(io.BytesIO(payload).read())
+
+
+def decode_stream(payload):
+    return EventStreamDecoder(max_events=20, max_summary_len=64).decode(io.BytesIO(payload))
+
+
+def measure(fn, payload, repeat=20):
+    tracemalloc.start()
+    fn(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(payload)
+    return peak, (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    print("{:>7} {:>9} {:>14} {:>10} {:>14} {:>10}".format(
+        "events", "payload", "json peak", "json ms", "stream peak", "stream ms"))
+    for num_events in (5, 50, 500):
+        payload = make_payload(num_events)
+        expected = [(int(e["dateTime"][:2]), 1, int(e["dateTime"][7:9]), 30, 0, e["summary"][:64])
+                    for e in decode_json(payload)[:20]]
+        assert decode_stream(payload) == expected
+        json_peak, json_ms = measure(decode_json, payload)
+        stream_peak, stream_ms = measure(decode_stream, payload)
+        print("{:>7} {:>9} {:>14} {:>10.2f} {:>14} {:>10.2f}".format(
+            num_events, len(payload), json_peak, json_ms, stream_peak, stream_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Cost of drawing the calendar screen on the host.
+
+Compares the old InkyApp.draw body (float geometry, nine localtime calls,
+no wrapping) with CalendarLayout + render() on the fake PicoGraphics, for
+short and long summaries, and the comparison that finds the one row changed in
+the next frame. Reports time per frame, drawing and measure_text calls and
+the digest of the drawing calls, which doubles as a golden frame: it only
+changes when the rendered screen does. The layout frames are checked against
+GOLDEN and warm frames against cold ones; the script exits with 1 when a
+check fails. Update GOLDEN when a change to the screen is intended.
+Run from the repository root:
+    python host/benchmarks/bench_calendar_layout.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import inkysim  # noqa: E402
+
+inkysim.install()
+
+import utime  # noqa: E402
+from picographics import PicoGraphics, DISPLAY_INKY_FRAME_7  # noqa: E402
+from calendar_decoder import format_date_time, MONTH_NAMES, DAY, MONTH, SUMMARY  # noqa: E402
+from calendar_layout import DrawingSettings, TextMeasurer, CalendarLayout, render, signatures, dirty_regions  # noqa: E402
+
+# 2026-10-18 09:30 UTC
+NOW = 1792315800
+LAST_UPDATED = "Last updated: 18 Oct, 09:00"
+SHORT = "Dentist"
+# Digests of the drawing calls of the layout frames
+GOLDEN = {"short": "6a7f42300e4166ce", "long": "6e4f822c30c5800e"}
+LONG = "Quarterly planning with the extended team, room 4.12 (bring laptops and the printed roadmap)"
+
+
+def make_events(summary, num_events=8):
+    return [(18 + i // 3, 10, 9 + i, 30, 0, summary) for i in range(num_events)]
+
+
+class CountingDisplay(PicoGraphics):
+    def __init__(self):
+        super().__init__(DISPLAY_INKY_FRAME_7)
+        self.measured = 0
+
+    def measure_text(self, text, scale=2, spacing=1):
+        self.measured += 1
+        return super().measure_text(text, scale, spacing)
+
+
+def legacy_draw(display, events, current_time):
+    """The draw pass InkyApp.draw used before CalendarLayout."""
+    display.set_pen(1)
+    display.clear()
+    display.set_font("sans")
+    WIDTH, HEIGHT = display.get_bounds()
+    display.set_pen(DrawingSettings.TITLE_BACKGROUND_COLOR)
+    display.rectangle(0, 0, WIDTH, DrawingSettings.TITLE_RECTANGLE_HEIGHT)
+    display.set_pen(DrawingSettings.TITLE_FONT_COLOR)
+    display.set_thickness(DrawingSettings.TITLE_FONT_THICKNESS)
+    display.text("Upcoming Events", 0, int(DrawingSettings.TITLE_RECTANGLE_HEIGHT / 2), WIDTH, DrawingSettings.TITLE_FONT_SCALE)
+    today = "{:02d} {}".format(utime.localtime(current_time)[2], MONTH_NAMES[utime.localtime(current_time)[1]])
+    text_len = display.measure_text(today, DrawingSettings.TITLE_FONT_SCALE)
+    display.set_pen(DrawingSettings.DATE_BACKGROUND_COLOR)
+    display.rectangle(int(WIDTH - DrawingSettings.DATE_BACKGROUND_WIDTH), 0, int(DrawingSettings.DATE_BACKGROUND_WIDTH), DrawingSettings.TITLE_RECTANGLE_HEIGHT)
+    display.set_pen(DrawingSettings.TITLE_FONT_COLOR)
+    display.text(today, int(WIDTH - DrawingSettings.DATE_BACKGROUND_WIDTH + (DrawingSettings.DATE_BACKGROUND_WIDTH - text_len) / 2), int(DrawingSettings.TITLE_RECTANGLE_HEIGHT / 2), WIDTH, DrawingSettings.TITLE_FONT_SCALE)
+    display.set_pen(DrawingSettings.TITLE_FONT_COLOR)
+    display.rectangle(0, DrawingSettings.TITLE_RECTANGLE_HEIGHT, WIDTH, HEIGHT)
+    today_day, today_month = utime.localtime(current_time)[2], utime.localtime(current_time)[1]
+    line_num = 1
+    display.set_thickness(DrawingSettings.EVENTS_FONT_THICKNESS)
+    for event in events:
+        event_text = format_date_time(event) + " " + event[SUMMARY]
+        y = int(DrawingSettings.EVENTS_BASE_SPACING * line_num + DrawingSettings.TITLE_RECTANGLE_HEIGHT)
+        if event[DAY] == today_day and event[MONTH] == today_month:
+            display.set_pen(DrawingSettings.EVENT_HIGHLIGHT_COLOR_TODAY)
+            display.rectangle(0, int(y - 2 * DrawingSettings.EVENTS_FONT_BASELINE), WIDTH, int(2 * DrawingSettings.EVENTS_FONT_DESCENDERS))
+            display.set_pen(DrawingSettings.EVENT_FONT_COLOR_TODAY)
+        else:
+            display.set_pen(DrawingSettings.EVENT_FONT_COLOR_DEFAULT)
+        display.text(event_text, 0, y, WIDTH, DrawingSettings.EVENTS_FONT_SCALE)
+        line_num += 1
+    display.set_font("bitmap8")
+    display.set_pen(DrawingSettings.EVENT_FONT_COLOR_DEFAULT)
+    last_updated_len = display.measure_text(LAST_UPDATED, 2)
+    display.text(LAST_UPDATED, WIDTH - last_updated_len, HEIGHT - 16, scale=2)
+
+
+def layout_draw(display, events, current_time, layout=None):
+    if layout is None:
+        WIDTH, HEIGHT = display.get_bounds()
+        layout = CalendarLayout(TextMeasurer(display), WIDTH, HEIGHT)
+    render(display, layout.layout(events, utime.localtime(current_time), LAST_UPDATED))
+    return layout
+
+
+def compare(layout, last, events, current_time):
+    """Lays out the next frame and returns the keys of the regions that differ from signatures last."""
+    regions = layout.layout(events, utime.localtime(current_time), LAST_UPDATED)
+    return dirty_regions(last, signatures(regions))[0]
+
+
+def overflowing(display):
+    """Text ops whose last character is drawn right of the panel edge."""
+    width = display.width
+    n = 0
+    font = None
+    for call in display.calls:
+        if call[0] == "set_font":
+            font = call[1]
+        elif call[0] == "text":
+            display.font = font
+            if call[2] + PicoGraphics.measure_text(display, call[1], call[5]) > width:
+                n += 1
+    return n
+
+
+def measure(fn, repeat=200):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    failures = []
+
+    def check(ok, msg):
+        if not ok:
+            print("FAIL", msg)
+            failures.append(msg)
+
+    print("{:>8} {:>14} {:>9} {:>9} {:>9} {:>9} {:>18}".format(
+        "summary", "draw", "ms", "calls", "measures", "overflow", "golden"))
+    for name, summary in (("short", SHORT), ("long", LONG)):
+        events = make_events(summary)
+        rows = (
+            ("legacy", lambda d: legacy_draw(d, events, NOW)),
+            ("layout", lambda d: layout_draw(d, events, NOW)),
+        )
+        for label, draw in rows:
+            display = CountingDisplay()
+            draw(display)
+            ms = measure(lambda: draw(PicoGraphics(DISPLAY_INKY_FRAME_7)))
+            print("{:>8} {:>14} {:>9.3f} {:>9} {:>9} {:>9} {:>18}".format(
+                name, label, ms, len(display.calls), display.measured, overflowing(display), display.digest()))
+            if label == "layout":
+                check(display.digest() == GOLDEN[name], "{} layout frame differs from GOLDEN".format(name))
+                check(overflowing(display) == 0, "{} layout frame has text off the panel".format(name))
+        # Later frames of the same process reuse the measure_text cache
+        display = CountingDisplay()
+        layout = layout_draw(display, events, NOW)
+        display.calls = []
+        display.measured = 0
+        layout_draw(display, events, NOW, layout)
+        calls, measured, overflow, digest = len(display.calls), display.measured, overflowing(display), display.digest()
+        ms = measure(lambda: layout_draw(PicoGraphics(DISPLAY_INKY_FRAME_7), events, NOW, layout))
+        print("{:>8} {:>14} {:>9.3f} {:>9} {:>9} {:>9} {:>18}".format(
+            name, "layout, warm", ms, calls, measured, overflow, digest))
+        check(digest == GOLDEN[name], "{} warm frame differs from the cold one".format(name))
+        check(measured == 0, "{} warm frame measured text again".format(name))
+        # The next frame differs in one row only
+        last = signatures(layout.layout(events, utime.localtime(NOW), LAST_UPDATED))
+        changed = list(events)
+        changed[1] = changed[1][:5] + ("Moved to the afternoon",)
+        display.measured = 0
+        keys = compare(layout, last, changed, NOW)
+        ms = measure(lambda: compare(layout, last, changed, NOW))
+        print("{:>8} {:>14} {:>9.3f} {:>9} {:>9} {:>9} {:>18}".format(
+            name, "compare, 1 row", ms, 0, display.measured, "-", "-"))
+        check(keys, "{} comparison missed the changed row".format(name))
+    return not failures
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,129 @@
+"""Time and transient allocation of parsing one browser request in tinyweb.
+
+Compares the old readline() / split() parser, which also ran gc.collect()
+for every header line, with the in-place parser working on the connection's
+line buffer. The request has 15 headers, two of them saved.
+CPython frees temporaries by reference counting, so the peak understates
+what MicroPython accumulates between collections; the number of
+collections is what costs time on the board.
+Run from the repository root:
+    python host/benchmarks/bench_tinyweb_headers.py [requests]
+"""
+import asyncio
+import gc
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import inkysim  # noqa: E402
+
+inkysim.install()
+
+from tinyweb.server import bufreader, request  # noqa: E402
+
+REQUEST = (b"POST /api/settings HTTP/1.1\r\n"
+           b"Host: 192.168.1.42\r\n"
+           b"Connection: keep-alive\r\n"
+           b"Content-Length: 2\r\n"
+           b"Cache-Control: max-age=0\r\n"
+           b"Upgrade-Insecure-Requests: 1\r\n"
+           b"Origin: http://192.168.1.42\r\n"
+           b"Content-Type: application/json\r\n"
+           b"User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+           b"(KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36\r\n"
+           b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,"
+           b"image/avif,image/webp,*/*;q=0.8\r\n"
+           b"Referer: http://192.168.1.42/\r\n"
+           b"Accept-Encoding: gzip, deflate\r\n"
+           b"Accept-Language: en-GB,en;q=0.9\r\n"
+           b"DNT: 1\r\n"
+           b"Sec-GPC: 1\r\n"
+           b"Pragma: no-cache\r\n"
+           b"\r\n{}")
+SAVE_HEADERS = [b"Content-Length", b"Content-Type"]
+
+
+class BytesStream:
+    """Minimal uasyncio Stream over a bytes object"""
+
+    def __init__(self, data):
+        self.f = io.BytesIO(data)
+
+    async def readline(self):
+        return self.f.readline()
+
+    async def readinto(self, buf):
+        return self.f.readinto(buf)
+
+    async def readexactly(self, n):
+        return self.f.read(n)
+
+
+async def parse_legacy(stream):
+    """tinyweb's parser before the line buffer"""
+    rl = await stream.readline()
+    method, path, version = rl.split()
+    headers = {}
+    while True:
+        gc.collect()
+        line = await stream.readline()
+        if line == b"\r\n":
+            break
+        frags = line.split(b":", 1)
+        if frags[0] in SAVE_HEADERS:
+            headers[frags[0]] = frags[1].strip()
+    return headers
+
+
+async def parse_inplace(stream):
+    req = request(stream)
+    await req.read_request_line()
+    await req.read_headers(SAVE_HEADERS)
+    return req.headers
+
+
+def legacy_stream():
+    return BytesStream(REQUEST)
+
+
+def inplace_stream():
+    # The line buffer is allocated once per connection, not per request
+    return bufreader(BytesStream(REQUEST))
+
+
+async def measure(parse, make_stream, num_requests):
+    await parse(make_stream())
+    collections = []
+
+    def on_gc(phase, info):
+        if phase == "start":
+            collections.append(info["generation"])
+    # Transient allocation of a single request, input excluded
+    stream = make_stream()
+    gc.callbacks.append(on_gc)
+    tracemalloc.start()
+    await parse(stream)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    gc.callbacks.remove(on_gc)
+    started = time.perf_counter()
+    for _ in range(num_requests):
+        await parse(make_stream())
+    return len(collections), peak, current, (time.perf_counter() - started) / num_requests * 1e6
+
+
+async def main(num_requests):
+    print("{:<10} {:>12} {:>12} {:>14} {:>12}".format(
+        "parser", "collections", "peak bytes", "retained bytes", "us/request"))
+    for name, parse, make_stream in (("legacy", parse_legacy, legacy_stream),
+                                     ("in place", parse_inplace, inplace_stream)):
+        collections, peak, current, us = await measure(parse, make_stream, num_requests)
+        print("{:<10} {:>12} {:>12} {:>14} {:>12.1f}".format(name, collections, peak, current, us))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
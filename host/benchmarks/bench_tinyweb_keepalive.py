@@ -0,0 +1,145 @@
+"""tinyweb throughput with and without HTTP keep-alive on the loopback.
+
+The server runs under CPython with the uasyncio stand-in from host/inkysim.
+Each mode runs `repeat` times with automatic garbage collection off, after
+a collection outside the timed run. tinyweb itself still calls gc.collect()
+for every request (MicroPython keeps the heap small that way), which on
+CPython's much larger heap takes most of the time of a request and hides the
+difference between the modes: the requests/s including it are within
+run-to-run noise of each other. So the time the server spent in collect()
+(tinyweb.server.gc_time_us) is reported and taken out as well, and the setup
+cost per connection is the difference of the two modes' remaining times
+over the difference of the connections the server accepted.
+Run from the repository root:
+    python host/benchmarks/bench_tinyweb_keepalive.py [requests] [repeat]
+"""
+import asyncio
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import inkysim  # noqa: E402
+
+inkysim.install()
+
+from tinyweb import server  # noqa: E402
+from tinyweb.server import webserver  # noqa: E402
+
+REQUEST = b"GET /api/status HTTP/1.1\r\nHost: frame\r\nUser-Agent: bench\r\n\r\n"
+REQUEST_CLOSE = b"GET /api/status HTTP/1.1\r\nHost: frame\r\nConnection: close\r\n\r\n"
+
+
+class Status:
+    def get(self, data):
+        return {"calendar": "Personal", "events": 5, "battery": 3.9}
+
+
+async def read_response(reader):
+    """Reads one Content-Length framed response, fails unless it is a 200."""
+    status = await reader.readline()
+    if status.split()[1] != b"200":
+        raise RuntimeError("Unexpected response " + repr(status))
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, value = line.split(b":", 1)
+        if name.lower() == b"content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_close(port, num_requests):
+    for _ in range(num_requests):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(REQUEST_CLOSE)
+        await read_response(reader)
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_keep_alive(port, num_requests, per_connection):
+    done = 0
+    while done < num_requests:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        batch = min(per_connection, num_requests - done)
+        for _ in range(batch):
+            writer.write(REQUEST)
+            await read_response(reader)
+        done += batch
+        writer.close()
+        await writer.wait_closed()
+
+
+async def run_pipelined(port, num_requests, per_connection):
+    done = 0
+    while done < num_requests:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        batch = min(per_connection, num_requests - done)
+        writer.write(REQUEST * batch)
+        for _ in range(batch):
+            await read_response(reader)
+        done += batch
+        writer.close()
+        await writer.wait_closed()
+
+
+async def timed(app, run, repeat):
+    """Best (time, time without the server's collect() calls) of repeat runs of run(),
+    and the connections the server accepted for one run.
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        accepted = app.processed_connections
+        gc_us = server.gc_time_us
+        started = time.perf_counter()
+        try:
+            await run()
+        finally:
+            elapsed = time.perf_counter() - started
+            gc.enable()
+        net = elapsed - (server.gc_time_us - gc_us) / 1e6
+        if best is None or net < best[1]:
+            best = (elapsed, net)
+        accepted = app.processed_connections - accepted
+    return best, accepted
+
+
+async def main(num_requests, repeat):
+    app = webserver(max_concurrency=16)
+    app.add_resource(Status, "/api/status")
+
+    await app._tcp_server("127.0.0.1", 0, app.backlog)
+    port = app._server.sockets[0].getsockname()[1]
+    per_connection = app.max_keep_alive_requests
+    # Warm up: first connections pay for imports and caches
+    await run_close(port, 10)
+    results = {}
+    print("{:<24} {:>10} {:>12} {:>10}".format("mode", "requests/s", "without gc/s", "accepted"))
+    for name, run, connections in (
+            ("connection per request", lambda: run_close(port, num_requests), num_requests),
+            ("keep-alive", lambda: run_keep_alive(port, num_requests, per_connection),
+             -(-num_requests // per_connection)),
+            ("keep-alive, pipelined", lambda: run_pipelined(port, num_requests, per_connection),
+             -(-num_requests // per_connection))):
+        (elapsed, net), accepted = await timed(app, run, repeat)
+        if accepted != connections:
+            raise RuntimeError("{}: expected {} connections, server accepted {}".format(name, connections, accepted))
+        results[name] = (net, accepted)
+        print("{:<24} {:>10.0f} {:>12.0f} {:>10}".format(name, num_requests / elapsed, num_requests / net, accepted))
+    (close_s, close_n), (keep_s, keep_n) = results["connection per request"], results["keep-alive"]
+    print("setup cost per connection: {:.3f} ms".format((close_s - keep_s) / (close_n - keep_n) * 1000))
+    app.shutdown()
+    await app._server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300,
+                     int(sys.argv[2]) if len(sys.argv) > 2 else 3))
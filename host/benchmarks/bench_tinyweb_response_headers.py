@@ -0,0 +1,87 @@
+"""Allocation and time of composing one JSON resource response header.
+
+Compares the old str.format / += composition of _send_headers with the
+pre-encoded header blocks copied into the connection's header buffer.
+The response is what a RESTful resource sends: JSON content type,
+Content-Length, Access Control headers and Connection: close.
+Run from the repository root:
+    python host/benchmarks/bench_tinyweb_response_headers.py [responses]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import inkysim  # noqa: E402
+
+inkysim.install()
+
+from tinyweb.server import HEADER_BUF_SIZE, response, webserver  # noqa: E402
+
+
+def legacy_response(params, length):
+    """Response prepared the way tinyweb did before the header blocks"""
+    resp = response(None)
+    resp.version = '1.1'
+    resp.add_header('Content-Type', 'application/json')
+    resp.add_header('Content-Length', str(length))
+    resp.add_header('Access-Control-Allow-Origin', params['allowed_access_control_origins'])
+    resp.add_header('Access-Control-Allow-Methods', params['allowed_access_control_methods'])
+    resp.add_header('Access-Control-Allow-Headers', params['allowed_access_control_headers'])
+    return resp
+
+
+def legacy_compose(resp):
+    """_send_headers before the header blocks (minus gc.collect)"""
+    resp.headers['Connection'] = 'close'
+    hdrs = 'HTTP/{} {} MSG\r\n'.format(resp.version, resp.code)
+    for k, v in resp.headers.items():
+        hdrs += '{}: {}\r\n'.format(k, v)
+    hdrs += '\r\n'
+    return hdrs
+
+
+def block_response(params, length, hbuf):
+    resp = response(None, hbuf)
+    resp.params = params
+    resp.version = '1.1'
+    resp.add_header_block(b'Content-Type: application/json\r\n')
+    resp.add_header('Content-Length', length)
+    resp.add_access_control_headers()
+    return resp
+
+
+def measure(make, compose, num_responses):
+    """Allocation of composing the header of a prepared response"""
+    resp = make()
+    tracemalloc.start()
+    compose(resp)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    responses = [make() for _ in range(num_responses)]
+    started = time.perf_counter()
+    for resp in responses:
+        compose(resp)
+    return peak, (time.perf_counter() - started) / num_responses * 1e6
+
+
+def main(num_responses):
+    app = webserver()
+    app.add_route('/api/status', None, methods=['GET', 'POST'])
+    params = app.url_tree.children[b'api'].children[b'status'].handlers[b'GET'][1]
+    hbuf = memoryview(bytearray(HEADER_BUF_SIZE))
+    # Same headers, blocks come first
+    legacy = legacy_compose(legacy_response(params, 53)).encode()
+    blocks = bytes(block_response(params, 53, hbuf)._compose_headers())
+    assert sorted(blocks.split(b"\r\n")) == sorted(legacy.replace(b"MSG", b"OK").split(b"\r\n"))
+    print("{:<10} {:>12} {:>12}".format("header", "peak bytes", "us/response"))
+    for name, make, compose in (
+            ("legacy", lambda: legacy_response(params, 53), legacy_compose),
+            ("blocks", lambda: block_response(params, 53, hbuf), response._compose_headers)):
+        peak, us = measure(make, compose, num_responses)
+        print("{:<10} {:>12} {:>12.2f}".format(name, peak, us))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
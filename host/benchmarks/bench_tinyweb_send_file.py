@@ -0,0 +1,94 @@
+"""tinyweb send_file throughput on the loopback.
+
+Serves a 60 KB file (the size of a rendered frame image) with the old
+128 byte buffer and with the default buffer, then fetches the same file
+in 8 KB Range requests over one keep-alive connection.
+Run from the repository root:
+    python host/benchmarks/bench_tinyweb_send_file.py [requests]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import inkysim  # noqa: E402
+
+inkysim.install()
+
+from tinyweb.server import webserver  # noqa: E402
+
+FILE_SIZE = 60 * 1024
+RANGE_SIZE = 8 * 1024
+
+
+async def read_response(reader):
+    """Reads one Content-Length framed response, returns its body length."""
+    await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, value = line.split(b":", 1)
+        if name.lower() == b"content-length":
+            length = int(value)
+    return len(await reader.readexactly(length))
+
+
+async def fetch(port, path, num_requests, ranges=False):
+    """Fetches path num_requests times over keep-alive connections, returns bytes received."""
+    received = 0
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for i in range(num_requests):
+        if ranges:
+            first = i * RANGE_SIZE % FILE_SIZE
+            extra = "Range: bytes={}-{}\r\n".format(first, first + RANGE_SIZE - 1)
+        else:
+            extra = ""
+        writer.write("GET {} HTTP/1.1\r\nHost: frame\r\n{}\r\n".format(path, extra).encode())
+        received += await read_response(reader)
+        if (i + 1) % 20 == 0:
+            # max_keep_alive_requests reached, server closes connection
+            writer.close()
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.close()
+    return received
+
+
+async def main(num_requests):
+    tmp = tempfile.mkdtemp()
+    filename = os.path.join(tmp, "frame.png")
+    with open(filename, "wb") as f:
+        f.write(os.urandom(FILE_SIZE))
+
+    app = webserver()
+
+    @app.route("/small", save_headers=["Range"])
+    async def small(req, resp):
+        await resp.send_file(filename, content_type="image/png", buf_size=128, req=req)
+
+    @app.route("/frame.png", save_headers=["Range"])
+    async def frame(req, resp):
+        await resp.send_file(filename, content_type="image/png", req=req)
+
+    await app._tcp_server("127.0.0.1", 0, app.backlog)
+    port = app._server.sockets[0].getsockname()[1]
+    for name, path, ranges in (("128 byte buffer", "/small", False),
+                               ("default buffer", "/frame.png", False),
+                               ("8 KB ranges", "/frame.png", True)):
+        started = time.perf_counter()
+        received = await fetch(port, path, num_requests, ranges)
+        elapsed = time.perf_counter() - started
+        print("{:<16} {:>8.1f} requests/s {:>8.2f} MB/s".format(
+            name, num_requests / elapsed, received / elapsed / 1e6))
+    app.shutdown()
+    await app._server.wait_closed()
+    os.remove(filename)
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100))
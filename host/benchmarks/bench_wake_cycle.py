@@ -0,0 +1,167 @@
+"""Time, heap and battery charge of a wake, per phase of main.py.
+
+Runs board/main.py on the simulated Inky Frame for a few scenarios (first
+boot, fast path from the cache, revalidation answered 304, changed events,
+a failed WiFi join) and decodes the phase records main.py leaves on the SD
+card and flash. Reports virtual milliseconds per phase and in total, peak heap
+(host allocations, see Simulator trace_heap) and mAh per wake from
+inkysim.energy.EnergyModel. Virtual time only counts simulated sleeps unless
+--cpu-scale charges host CPU time as well.
+
+--save writes the results as JSON; --compare checks them against such a file
+and exits with 1 when a figure grew by more than --tolerance, so a change to
+the boot pipeline can be checked for regressions. Run from the repository root:
+    python host/benchmarks/bench_wake_cycle.py --save wake.json
+    python host/benchmarks/bench_wake_cycle.py --compare wake.json
+"""
+import argparse
+import compileall
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from inkysim.simulator import Simulator, BOARD_DIR, STAT_CONNECT_FAIL  # noqa: E402
+from inkysim.energy import EnergyModel  # noqa: E402
+
+import phase_timer  # noqa: E402
+
+EVENTS = [
+    (18, 10, 9, 30, 0, "Dentist"),
+    (18, 10, 0, 0, 1, "Anna's birthday"),
+    (19, 10, 14, 0, 0, "Quarterly planning with the extended team, room 4.12 (bring laptops)"),
+    (21, 10, 18, 15, 0, "Football practice"),
+    (24, 10, 0, 0, 1, "Half term"),
+]
+
+
+def stale_cache(sim):
+    """Makes the next wake come after the update interval."""
+    sim.wake_at = sim.clock.now() + 301 * 60
+
+
+def cold(sim):
+    return sim.wake()
+
+
+def fast_path(sim):
+    sim.wake()
+    return sim.wake()
+
+
+def revalidate(sim):
+    sim.wake()
+    stale_cache(sim)
+    return sim.wake()
+
+
+def changed(sim):
+    sim.wake()
+    stale_cache(sim)
+    sim.api.events[1] = sim.api.events[1][:5] + ("Moved to the afternoon",)
+    return sim.wake()
+
+
+def wifi_retry(sim):
+    sim.wifi_failures = [STAT_CONNECT_FAIL]
+    return sim.wake()
+
+
+SCENARIOS = (
+    ("cold", cold),
+    ("fast path", fast_path),
+    ("revalidate", revalidate),
+    ("changed", changed),
+    ("wifi retry", wifi_retry),
+)
+
+
+def phase_records(sim):
+    """The decoded phase records of every wake, oldest first."""
+    data = b""
+    for path in (os.path.join(sim.sd_dir, "wake-phases.bin"),
+                 os.path.join(sim.flash_dir, phase_timer.PENDING_FILE.lstrip("/"))):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data += f.read()
+    return list(phase_timer.decode(data))
+
+
+def run(scenario, cpu_scale, model):
+    with Simulator(cpu_scale=cpu_scale, trace_heap=True) as sim:
+        sim.api.events = list(EVENTS)
+        wake = scenario(sim)
+        if wake.error is not None:
+            raise wake.error
+        records = phase_records(sim)
+        if len(records) != len(sim.wakes):
+            raise RuntimeError("Expected a phase record per wake, got {} for {}".format(len(records), len(sim.wakes)))
+        _, total, flags, phases = records[-1]
+        ms = {name: 0 for name in phase_timer.PHASE_NAMES}
+        for phase, status, phase_ms, alloc, free in phases:
+            ms[phase_timer.PHASE_NAMES[phase]] += phase_ms
+        return {
+            "outcome": wake.outcome,
+            "ms": wake.ms,
+            "phases": ms,
+            "failed": bool(flags & phase_timer.FLAG_FAILED),
+            "peak_heap": wake.peak_heap,
+            "mah": model.wake(sim, wake),
+        }
+
+
+def regressions(results, baseline, tolerance):
+    """(scenario, figure, was, now) for the figures that grew by more than tolerance."""
+    found = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        figures = (("ms", old["ms"], result["ms"]),
+                   ("peak heap", old["peak_heap"], result["peak_heap"]),
+                   ("mAh", old["mah"]["total"], result["mah"]["total"]))
+        for figure, was, now in figures:
+            if now > was * (1 + tolerance) and now - was > 1e-9:
+                found.append((name, figure, was, now))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cpu-scale", type=float, default=0, help="charge host CPU time times this (0 - sleeps only)")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file written by --save")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed growth over the baseline (0.1 - 10%%)")
+    args = parser.parse_args()
+
+    model = EnergyModel()
+    # Keep host-side compiling out of peak heap: board modules load from fresh bytecode, and
+    # the first wake of the process, which pays for host imports and caches, is not counted
+    compileall.compile_dir(BOARD_DIR, quiet=1)
+    run(cold, args.cpu_scale, model)
+    results = {}
+    names = phase_timer.PHASE_NAMES
+    print("{:>11} {:>9} {:>8} ".format("scenario", "outcome", "ms") + " ".join("{:>7}".format(n) for n in names)
+          + " {:>10} {:>9} {:>9} {:>9}".format("peak heap", "mAh", "radio", "refresh"))
+    for name, scenario in SCENARIOS:
+        result = results[name] = run(scenario, args.cpu_scale, model)
+        print("{:>11} {:>9} {:>8} ".format(name, result["outcome"], result["ms"])
+              + " ".join("{:>7}".format(result["phases"][n]) for n in names)
+              + " {:>10} {:>9.4f} {:>9.4f} {:>9.4f}".format(
+                  result["peak_heap"], result["mah"]["total"], result["mah"]["radio"], result["mah"]["refresh"]))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for name, figure, was, now in found:
+            print("Regression: {} {} {:.4g} -> {:.4g}".format(name, figure, was, now))
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
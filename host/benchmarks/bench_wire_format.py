@@ -0,0 +1,75 @@
+"""Size and decode time of the JSON and the compact binary calendar formats.
+
+encode_binary() is a Python reference encoder of the format produced by the
+calendar Lambda (encodeEventsBinary in calendar-backend/main.go); the board's
+decoders from calendar_decoder.py are used for decoding.
+Run from the repository root:
+    python host/benchmarks/bench_wire_format.py
+"""
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "board"))
+
+from calendar_decoder import (  # noqa: E402
+    BINARY_VERSION, FLAG_ALL_DAY,
+    BinaryEventDecoder, EventStreamDecoder, format_date_time, utf8_trim,
+)
+
+SUMMARIES = ("Dentist", "Weekly sync with the platform team", "Café with Zoë", "Flight to Lisbon ✈")
+
+
+def make_events(num_events):
+    events = []
+    for i in range(num_events):
+        flags = FLAG_ALL_DAY if i % 5 == 0 else 0
+        events.append((i % 28 + 1, i % 12 + 1, 0 if flags else i % 24, 0 if flags else (i * 7) % 60,
+                       flags, SUMMARIES[i % len(SUMMARIES)]))
+    return events
+
+
+def encode_json(events):
+    return json.dumps([{"dateTime": format_date_time(e), "summary": e[5]} for e in events]).encode()
+
+
+def encode_binary(events):
+    events = events[:255]
+    out = bytearray((BINARY_VERSION, len(events)))
+    for day, month, hour, minute, flags, summary in events:
+        raw = summary.encode()
+        raw = raw[:utf8_trim(raw, min(len(raw), 255))]
+        out += bytes((day, month, hour, minute, flags, len(raw)))
+        out += raw
+    return bytes(out)
+
+
+def timed(fn, payload, repeat=200):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(payload)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    json_stream = EventStreamDecoder(max_events=255, max_summary_len=255)
+    binary = BinaryEventDecoder(max_events=255, max_summary_len=255)
+    print("{:>7} {:>10} {:>10} {:>14} {:>14} {:>14}".format(
+        "events", "json B", "binary B", "json.loads ms", "json strm ms", "binary ms"))
+    for num_events in (5, 20, 100):
+        events = make_events(num_events)
+        json_payload = encode_json(events)
+        binary_payload = encode_binary(events)
+        assert json_stream.decode(io.BytesIO(json_payload)) == events
+        assert binary.decode(io.BytesIO(binary_payload)) == events
+        print("{:>7} {:>10} {:>10} {:>14.3f} {:>14.3f} {:>14.3f}".format(
+            num_events, len(json_payload), len(binary_payload),
+            timed(lambda p: json.loads(p), json_payload),
+            timed(lambda p: json_stream.decode(io.BytesIO(p)), json_payload),
+            timed(lambda p: binary.decode(io.BytesIO(p)), binary_payload)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Stress tinyweb's admission control on the loopback and check its invariants.
+
+- a burst of clients against a slow handler: every client gets 200 or 503,
+  queued clients are served in arrival order (FIFO)
+- idle clients that never send a request and a handler that overruns
+  handler_timeout are counted as timed out
+- afterwards no slot, queue entry or connection is leaked
+Run from the repository root:
+    python host/benchmarks/stress_tinyweb_admission.py [clients]
+Exits with status 1 if a check fails.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import inkysim  # noqa: E402
+
+inkysim.install()
+
+from tinyweb.server import webserver  # noqa: E402
+
+MAX_CONCURRENCY = 3
+MAX_QUEUE = 4
+HANDLER_DELAY = 0.05
+
+
+async def request(port, path):
+    """Returns HTTP status code, 0 if connection was closed without response"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write("GET {} HTTP/1.0\r\n\r\n".format(path).encode())
+    try:
+        status = await reader.readline()
+        await reader.read()
+    except ConnectionResetError:
+        status = b""
+    writer.close()
+    return int(status.split()[1]) if status else 0
+
+
+async def idle_client(port, hold):
+    """Connects and sends nothing"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    await asyncio.sleep(hold)
+    writer.close()
+
+
+async def main(num_clients):
+    app = webserver(max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE,
+                    request_timeout=0.5, queue_timeout=2, handler_timeout=0.5)
+    served = []
+
+    @app.route("/slow/<int:client>")
+    async def slow(req, resp, client):
+        served.append(client)
+        await asyncio.sleep(HANDLER_DELAY)
+        await resp.start_html()
+        await resp.send("ok")
+
+    @app.route("/stuck")
+    async def stuck(req, resp):
+        await asyncio.sleep(5)
+
+    await app._tcp_server("127.0.0.1", 0, 64)
+    port = app._server.sockets[0].getsockname()[1]
+    failures = []
+
+    def check(ok, msg):
+        print("{:<4} {}".format("ok" if ok else "FAIL", msg))
+        if not ok:
+            failures.append(msg)
+
+    # Burst: clients arrive 1 ms apart
+    started = time.perf_counter()
+    tasks = []
+    for i in range(num_clients):
+        tasks.append(asyncio.create_task(request(port, "/slow/{}".format(i))))
+        await asyncio.sleep(0.001)
+    statuses = await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    ok = statuses.count(200)
+    busy = statuses.count(503)
+    print("burst: {} clients, {} served, {} rejected in {:.2f}s".format(num_clients, ok, busy, elapsed))
+    check(ok + busy == num_clients, "every client got 200 or 503")
+    check(ok >= MAX_CONCURRENCY + MAX_QUEUE, "running and queued clients were served")
+    check(served == sorted(served), "queued clients served in arrival order")
+
+    # Idle connections and a handler overrunning its deadline
+    timed_out = app.timed_out
+    await asyncio.gather(*[idle_client(port, 1) for _ in range(MAX_CONCURRENCY)],
+                         request(port, "/stuck"))
+    check(app.timed_out - timed_out == MAX_CONCURRENCY + 1, "idle clients and stuck handler timed out")
+    check(await request(port, "/slow/{}".format(num_clients)) == 200, "server responsive after timeouts")
+
+    await asyncio.sleep(0.1)
+    stats = app.stats()
+    print(stats)
+    check(app.slots.value == MAX_CONCURRENCY, "no leaked slots")
+    check(not app.slots.waiters and app.queued == 0, "queue empty")
+    check(not app.conns, "no leaked connections")
+    check(stats["handler_ms_p50"] >= HANDLER_DELAY * 1000, "handler time percentiles recorded")
+
+    app.shutdown()
+    await app._server.wait_closed()
+    return not failures
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 40)) else 1)
@@ -0,0 +1,46 @@
+"""Host-side stand-ins for the MicroPython modules the board code imports.
+
+install() puts the stand-in modules on sys.path and adds the bits of the
+MicroPython API that CPython's own modules lack, so the code in board/ can
+be imported and exercised under CPython.
+
+The hardware modules (machine, inky_frame, network, picographics, sdcard,
+pcf85063a, requests) are backed by inkysim.simulator.Simulator, which runs
+board/main.py end to end on a virtual clock:
+    python -m inkysim --wakes 3 --png frame.png
+inkysim.energy turns its event trace into battery charge per wake.
+"""
+import gc
+import logging
+import os
+import sys
+import traceback
+
+# What gc.mem_free() reports: roughly a Pico W with WiFi up and tinyweb loaded
+HEAP_FREE = 120 * 1024
+
+MODULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "modules")
+BOARD_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "board"))
+
+
+def _logger_exc(self, e, msg="", *args):
+    self.error(msg, *args, exc_info=e)
+
+
+def _print_exception(e, file=sys.stdout):
+    traceback.print_exception(type(e), e, e.__traceback__, file=file)
+
+
+def install():
+    """Makes the board code importable: stand-in modules first, then board/ and board/lib/."""
+    for path in (os.path.join(BOARD_DIR, "lib"), BOARD_DIR, MODULES_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    # MicroPython's logging has Logger.exc(), CPython's has exception()
+    if not hasattr(logging.Logger, "exc"):
+        logging.Logger.exc = _logger_exc
+    if not hasattr(sys, "print_exception"):
+        sys.print_exception = _print_exception
+    if not hasattr(gc, "mem_free"):
+        gc.mem_free = lambda: HEAP_FREE
+        gc.mem_alloc = lambda: 0
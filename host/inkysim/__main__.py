@@ -0,0 +1,44 @@
+"""Runs board/main.py on a simulated Inky Frame.
+From the host directory:
+    python -m inkysim --wakes 3 --png frame.png
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inkysim.simulator import Simulator  # noqa: E402
+
+SAMPLE_EVENTS = [
+    (18, 10, 9, 30, 0, "Dentist"),
+    (18, 10, 0, 0, 1, "Anna's birthday"),
+    (19, 10, 14, 0, 0, "Quarterly planning with the extended team, room 4.12 (bring laptops)"),
+    (21, 10, 18, 15, 0, "Football practice"),
+    (24, 10, 0, 0, 1, "Half term"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--wakes", type=int, default=3, help="number of wakes to run")
+    parser.add_argument("--power", choices=("battery", "usb"), default="battery")
+    parser.add_argument("--png", help="write the final panel image here")
+    parser.add_argument("--verbose", action="store_true", help="show what the board code prints")
+    args = parser.parse_args()
+
+    with Simulator(power=args.power, quiet=not args.verbose) as sim:
+        sim.api.events = list(SAMPLE_EVENTS)
+        print("{:>4} {:>10} {:>12} {:>10} {:>9} {:>9}".format(
+            "wake", "outcome", "virtual ms", "host ms", "requests", "refreshes"))
+        for wake in sim.run(args.wakes):
+            print("{:>4} {:>10} {:>12} {:>10.1f} {:>9} {:>9}".format(
+                wake.number, wake.outcome, wake.ms, wake.host_ms, wake.requests, wake.refreshes))
+            if wake.error is not None:
+                print("     error:", repr(wake.error))
+        if args.png:
+            sim.save_png(args.png)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Virtual time of a simulated board.
+
+Sleeps advance the clock instantly. With cpu_scale set, the host CPU time
+spent between two readings is charged as well, scaled to what the RP2040
+would need (MicroPython on the RP2040 is some 50-100 times slower than
+CPython); the default of 0 keeps runs deterministic.
+"""
+import time
+
+
+class VirtualClock:
+    def __init__(self, epoch, cpu_scale=0):
+        # UTC seconds at tick 0
+        self.epoch = epoch
+        self.ns = 0
+        self.cpu_scale = cpu_scale
+        self._perf = None
+
+    def resume(self):
+        """Starts charging host CPU time (if cpu_scale is set)."""
+        self._perf = time.perf_counter_ns()
+
+    def pause(self):
+        self._charge()
+        self._perf = None
+
+    def _charge(self):
+        if self._perf is not None and self.cpu_scale:
+            perf = time.perf_counter_ns()
+            self.ns += int((perf - self._perf) * self.cpu_scale)
+            self._perf = perf
+
+    def ticks_ns(self):
+        self._charge()
+        return self.ns
+
+    def ms(self):
+        return self.ticks_ns() // 1000000
+
+    def now(self):
+        """True UTC time in seconds."""
+        return self.epoch + self.ticks_ns() / 1e9
+
+    def advance(self, secs):
+        self._charge()
+        self.ns += int(secs * 1e9)
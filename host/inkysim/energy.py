@@ -0,0 +1,51 @@
+"""Battery charge of a simulated wake, from the Simulator's event trace.
+
+A per-component model: the board draws cpu_ma while it is awake (boot to
+power off), plus radio_ma while the WiFi chip is active and refresh_ma
+while the panel refreshes. Between wakes only off_ma flows (RTC and
+leakage). The currents are rough figures for an Inky Frame 7.3" on a LiPo;
+replace them with measurements when there are some. They are good enough to
+see which component a change of the boot pipeline saves or costs.
+"""
+
+MS_PER_HOUR = 3600000
+
+
+class EnergyModel:
+    def __init__(self, cpu_ma=25.0, radio_ma=50.0, refresh_ma=30.0, off_ma=0.02):
+        self.cpu_ma = cpu_ma
+        self.radio_ma = radio_ma
+        self.refresh_ma = refresh_ma
+        self.off_ma = off_ma
+
+    def durations(self, events, start_ms, end_ms):
+        """Milliseconds awake, with the radio on and refreshing between start_ms and end_ms."""
+        on = {"radio": None, "refresh": None}
+        total = {"radio": 0, "refresh": 0}
+        for ms, what, detail in events:
+            if ms < start_ms or ms > end_ms or what not in on:
+                continue
+            if detail and on[what] is None:
+                on[what] = ms
+            elif not detail and on[what] is not None:
+                total[what] += ms - on[what]
+                on[what] = None
+        for what, since in on.items():
+            if since is not None:
+                total[what] += end_ms - since
+        return {"cpu": end_ms - start_ms, "radio": total["radio"], "refresh": total["refresh"]}
+
+    def wake(self, sim, wake):
+        """mAh per component ("cpu", "radio", "refresh") and "total" for a Wake of sim."""
+        ms = self.durations(sim.events, wake.started // 1000000, wake.ended // 1000000)
+        mah = {
+            "cpu": self.cpu_ma * ms["cpu"] / MS_PER_HOUR,
+            "radio": self.radio_ma * ms["radio"] / MS_PER_HOUR,
+            "refresh": self.refresh_ma * ms["refresh"] / MS_PER_HOUR,
+        }
+        mah["total"] = sum(mah.values())
+        return mah
+
+    def off(self, secs):
+        """mAh while powered down for secs."""
+        return self.off_ma * secs * 1000 / MS_PER_HOUR
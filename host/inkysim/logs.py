@@ -0,0 +1,79 @@
+"""Prints the binary logs the board leaves on the SD card and flash as text.
+
+Reads the event log segments (event_log, oldest first) and the wake phase
+records (phase_timer) from a copy of the SD card or the flash filesystem,
+including the records parked on flash while the SD card was not mounted.
+From the host directory:
+    python -m inkysim.logs /media/sdcard [/path/to/flash/copy]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from inkysim import install  # noqa: E402
+
+install()
+
+import event_log  # noqa: E402
+import phase_timer  # noqa: E402
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return b""
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _format_time(secs):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(secs))
+
+
+def event_lines(data):
+    for secs, level, code, arg, payload in event_log.decode(data):
+        name = event_log.CODE_NAMES[code] if code < len(event_log.CODE_NAMES) else "code {}".format(code)
+        line = "{} {:<7} {}".format(_format_time(secs), event_log.LEVEL_NAMES.get(level, level), name)
+        if arg:
+            line += " {}".format(arg)
+        if payload:
+            line += " {!r}".format(payload.decode("utf-8", "replace"))
+        yield line
+
+
+def phase_lines(data):
+    for wake_time, total, flags, phases in phase_timer.decode(data):
+        tags = [tag for flag, tag in ((phase_timer.FLAG_FAST_PATH, " fast path"), (phase_timer.FLAG_FAILED, " FAILED"))
+                if flags & flag]
+        yield "{} wake {} ms{}".format(_format_time(wake_time), total, "".join(tags))
+        for phase, status, ms, alloc, free in phases:
+            yield "    {:<8} {:>7} ms  heap {:>7} used {:>7} free{}".format(
+                phase_timer.PHASE_NAMES[phase], ms, alloc, free, " FAILED" if status else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sd", help="directory holding the SD card files")
+    parser.add_argument("flash", nargs="?", help="directory holding the flash files, for the parked records")
+    parser.add_argument("--prefix", default="events", help="event log segment prefix")
+    parser.add_argument("--segments", type=int, default=4)
+    args = parser.parse_args()
+
+    events = b"".join(_read(os.path.join(args.sd, "{}.{}.bin".format(args.prefix, n)))
+                      for n in range(args.segments - 1, -1, -1))
+    phases = _read(os.path.join(args.sd, "wake-phases.bin"))
+    if args.flash:
+        events += _read(os.path.join(args.flash, event_log.PENDING_FILE.lstrip("/")))
+        phases += _read(os.path.join(args.flash, phase_timer.PENDING_FILE.lstrip("/")))
+    print("Events:")
+    for line in event_lines(events):
+        print(line)
+    print("Wakes:")
+    for line in phase_lines(phases):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
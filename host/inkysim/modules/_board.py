@@ -0,0 +1,9 @@
+"""Access to the simulated board for the hardware stand-in modules."""
+
+
+def board():
+    """The Simulator running the current wake."""
+    from inkysim import simulator
+    if simulator.current is None:
+        raise RuntimeError("no simulated board is running, see inkysim.simulator.Simulator")
+    return simulator.current
@@ -0,0 +1,95 @@
+"""CPython stand-in for Pimoroni's inky_frame module on the simulated board."""
+import machine
+from _board import board
+from pcf85063a import PCF85063A
+from pimoroni_i2c import PimoroniI2C
+
+SHIFT_STATE = 0
+
+i2c = PimoroniI2C(4, 5, 100000)
+rtc = PCF85063A(i2c)
+
+
+class LED:
+    def __init__(self, name):
+        self.name = name
+        self.brightness_ = 0
+
+    def on(self):
+        self.brightness(100)
+
+    def off(self):
+        self.brightness(0)
+
+    def brightness(self, brightness):
+        self.brightness_ = brightness
+
+
+class Button:
+    def __init__(self, name):
+        self.name = name
+        self.led = LED("button " + name)
+
+    def read(self):
+        sim = board()
+        sim.button_polls += 1
+        if sim.button_polls > sim.max_button_polls:
+            from inkysim.simulator import SimulationError
+            raise SimulationError("the board keeps waiting for a button press")
+        return self.name in sim.buttons_held
+
+    def raw(self):
+        return self.read()
+
+    def led_on(self):
+        self.led.on()
+
+    def led_off(self):
+        self.led.off()
+
+    def led_brightness(self, brightness):
+        self.led.brightness(brightness)
+
+    def led_toggle(self):
+        self.led.brightness(0 if self.led.brightness_ else 100)
+
+
+led_busy = LED("busy")
+led_wifi = LED("wifi")
+button_a = Button("a")
+button_b = Button("b")
+button_c = Button("c")
+button_d = Button("d")
+button_e = Button("e")
+
+
+def woken_by_rtc():
+    return board().wakes[-1].number > 0
+
+
+def woken_by_button():
+    return False
+
+
+def pcf_to_pico_rtc():
+    t = rtc.datetime()
+    machine.RTC().datetime((t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0))
+
+
+def pico_rtc_to_pcf():
+    year, month, day, weekday, hour, minute, second, _ = machine.RTC().datetime()
+    rtc.datetime((year, month, day, hour, minute, second, weekday))
+
+
+def set_time():
+    board().ntp_sync()
+
+
+def sleep_for(minutes):
+    board().sleep_for(minutes)
+
+
+def turn_off():
+    from inkysim.simulator import PowerOff
+    if board().power == "battery":
+        raise PowerOff()
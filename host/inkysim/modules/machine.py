@@ -0,0 +1,116 @@
+"""CPython stand-in for MicroPython's machine module on the simulated board."""
+import utime
+from _board import board
+
+PWRON_RESET = 1
+WDT_RESET = 3
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+
+    def init(self, mode=-1, pull=-1, value=None):
+        self.mode = mode
+        if value is not None:
+            self._value = value
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = 1 if value else 0
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+    def on(self):
+        self._value = 1
+
+    def off(self):
+        self._value = 0
+
+    def irq(self, handler=None, trigger=None):
+        pass
+
+
+class SPI:
+    def __init__(self, id, baudrate=1000000, **kwargs):
+        self.id = id
+        self.baudrate = baudrate
+
+    def init(self, baudrate=1000000, **kwargs):
+        self.baudrate = baudrate
+
+
+class PWM:
+    def __init__(self, pin):
+        self.pin = pin
+        self._freq = 0
+        self._duty = 0
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        self._duty = 0
+
+
+class RTC:
+    """The Pico's own RTC, reset on every boot."""
+
+    def datetime(self, t=None):
+        if t is None:
+            lt = utime.localtime(board().time())
+            return (lt[0], lt[1], lt[2], lt[6], lt[3], lt[4], lt[5], 0)
+        year, month, day, weekday, hour, minute, second = t[:7]
+        board().set_pico_time(utime.mktime((year, month, day, hour, minute, second)))
+
+
+def reset():
+    from inkysim.simulator import Reset
+    raise Reset()
+
+
+soft_reset = reset
+
+
+def reset_cause():
+    return PWRON_RESET
+
+
+def lightsleep(ms=None):
+    utime.sleep_ms(ms or 0)
+
+
+def deepsleep(ms=None):
+    lightsleep(ms)
+    reset()
+
+
+def freq(hz=None):
+    return 125000000
+
+
+def unique_id():
+    return b"\xe6\x61\x41\x04\x03\x5b\x2a\x2f"
+
+
+def idle():
+    pass
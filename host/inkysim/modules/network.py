@@ -0,0 +1,120 @@
+"""CPython stand-in for MicroPython's network module: the simulated board's CYW43 radio.
+
+A join takes Simulator.wifi_scan_ms (skipped when the BSSID is given),
+wifi_auth_ms, and wifi_dhcp_ms (skipped with a static ifconfig) of virtual
+time. Simulator.wifi_failures lists the statuses the next attempts fail with.
+"""
+from _board import board
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_CONNECT_FAIL = -1
+STAT_NO_AP_FOUND = -2
+STAT_WRONG_PASSWORD = -3
+STAT_GOT_IP = 3
+
+
+class _Radio:
+    """Radio state of one wake, shared by all WLAN(STA_IF) objects like the single CYW43 chip."""
+
+    def __init__(self, sim):
+        self.sim = sim
+        self.active = False
+        self.static = None
+        self.ap = None
+        self.done_at = None
+        self.outcome = STAT_IDLE
+        self.config = {"pm": 0xa11142}
+
+    def connected(self):
+        return self.status() == STAT_GOT_IP
+
+    def status(self):
+        if not self.active or self.done_at is None:
+            return STAT_IDLE
+        if self.sim.clock.ms() < self.done_at:
+            return STAT_CONNECTING
+        return self.outcome
+
+    def connect(self, ssid, key, bssid=None):
+        sim = self.sim
+        ap = sim.access_points.get(ssid)
+        ms = sim.wifi_auth_ms
+        if bssid is None:
+            ms += sim.wifi_scan_ms
+        if ap is None or (bssid is not None and bssid != ap.bssid):
+            outcome = STAT_NO_AP_FOUND
+        elif key != ap.password:
+            outcome = STAT_WRONG_PASSWORD
+        elif sim.wifi_failures:
+            outcome = sim.wifi_failures.pop(0)
+        else:
+            outcome = STAT_GOT_IP
+            if self.static is None:
+                ms += sim.wifi_dhcp_ms
+        self.ap = ap
+        self.outcome = outcome
+        self.done_at = sim.clock.ms() + ms
+        sim.trace("wifi connect", ssid)
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        sim = board()
+        if sim.radio is None:
+            sim.radio = _Radio(sim)
+        self._radio = sim.radio
+
+    def active(self, is_active=None):
+        r = self._radio
+        if is_active is None:
+            return r.active
+        if bool(is_active) != r.active:
+            r.sim.trace("radio", bool(is_active))
+        r.active = bool(is_active)
+        if not r.active:
+            r.done_at = None
+
+    def config(self, *args, **kwargs):
+        if args:
+            if args[0] == "mac":
+                return b"\x28\xcd\xc1\x00\x00\x01"
+            return self._radio.config.get(args[0])
+        self._radio.config.update(kwargs)
+
+    def connect(self, ssid=None, key=None, bssid=None):
+        if not self._radio.active:
+            raise OSError("WLAN not active")
+        self._radio.connect(ssid, key, bssid)
+
+    def disconnect(self):
+        self._radio.done_at = None
+
+    def status(self, param=None):
+        if param == "rssi":
+            return self._radio.ap.rssi if self._radio.ap else 0
+        return self._radio.status()
+
+    def isconnected(self):
+        return self._radio.connected()
+
+    def ifconfig(self, config=None):
+        r = self._radio
+        if config is None:
+            if r.static is not None:
+                return r.static
+            if r.connected():
+                return r.ap.ifconfig
+            return ("0.0.0.0", "0.0.0.0", "0.0.0.0", "0.0.0.0")
+        r.static = None if config == "dhcp" else tuple(config)
+
+    def scan(self):
+        r = self._radio
+        if not r.active:
+            raise OSError("WLAN not active")
+        r.sim.sleep(r.sim.wifi_scan_ms / 1000)
+        return [(ap.ssid.encode(), ap.bssid, ap.channel, ap.rssi, 3, False)
+                for ap in r.sim.access_points.values()]
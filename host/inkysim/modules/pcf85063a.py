@@ -0,0 +1,57 @@
+"""CPython stand-in for Pimoroni's pcf85063a module: the simulated board's RTC chip."""
+import utime
+from _board import board
+
+TIMER_TICK_4096HZ = 0b00000000
+TIMER_TICK_64HZ = 0b00001000
+TIMER_TICK_1HZ = 0b00010000
+TIMER_TICK_1_OVER_60HZ = 0b00011000
+
+
+class PCF85063A:
+    def __init__(self, i2c, interrupt=None):
+        self.i2c = i2c
+        self.timer = None
+
+    def reset(self):
+        pass
+
+    def datetime(self, t=None):
+        """(year, month, day, hour, minute, second, weekday)"""
+        if t is None:
+            lt = utime.localtime(board().rtc_time())
+            return (lt[0], lt[1], lt[2], lt[3], lt[4], lt[5], lt[6])
+        board().set_rtc_time(utime.mktime(t[:6]))
+
+    def set_timer(self, ticks, ttp=TIMER_TICK_1HZ):
+        self.timer = (ticks, ttp)
+
+    def enable_timer_interrupt(self, enable, flag_only=False):
+        pass
+
+    def read_timer_flag(self):
+        return False
+
+    def clear_timer_flag(self):
+        pass
+
+    def set_alarm(self, second=None, minute=None, hour=None, day=None):
+        pass
+
+    def set_weekday_alarm(self, second=None, minute=None, hour=None, day=None):
+        pass
+
+    def enable_alarm_interrupt(self, enable):
+        pass
+
+    def read_alarm_flag(self):
+        return False
+
+    def clear_alarm_flag(self):
+        pass
+
+    def unset_alarm(self):
+        pass
+
+    def set_clock_output(self, co):
+        pass
@@ -0,0 +1,197 @@
+"""CPython stand-in for Pimoroni's picographics module.
+
+PicoGraphics draws into an 8-colour framebuffer (one palette index per
+byte) that save_png() exports, and records every drawing call in `calls`,
+so a frame can be compared against a golden call log (digest()) or image.
+Text is rasterized as one block per glyph: the real bitmap and Hershey
+fonts are not available, but widths follow measure_text(), which
+approximates them closely enough for layout decisions.
+
+update() hands the framebuffer to the simulated panel when a
+inkysim.simulator.Simulator is running, which also accounts for the
+refresh time.
+"""
+import hashlib
+
+DISPLAY_INKY_FRAME = 0
+DISPLAY_INKY_FRAME_4 = 1
+DISPLAY_INKY_FRAME_7 = 2
+
+PEN_P4 = 5
+PEN_3BIT = 9
+
+BLACK, WHITE, GREEN, BLUE, RED, YELLOW, ORANGE, TAUPE = range(8)
+
+_BOUNDS = {
+    DISPLAY_INKY_FRAME: (600, 448),
+    DISPLAY_INKY_FRAME_4: (640, 400),
+    DISPLAY_INKY_FRAME_7: (800, 480),
+}
+
+PALETTE = ((0, 0, 0), (255, 255, 255), (0, 160, 0), (0, 0, 255),
+           (255, 0, 0), (255, 255, 0), (255, 128, 0), (200, 170, 150))
+
+# Advance width and height of a character at scale 1
+_BITMAP_FONTS = {"bitmap6": (5, 6), "bitmap8": (6, 8), "bitmap14_outline": (10, 14)}
+# Hershey glyphs are drawn around y, this tall at scale 1
+_VECTOR_HEIGHT = 20
+_NARROW = "il.,:;'|!1 "
+_WIDE = "mwMW@"
+
+
+def _vector_width(c):
+    if c in _NARROW:
+        return 9
+    if c in _WIDE:
+        return 24
+    if c.isupper() or c.isdigit():
+        return 20
+    return 17
+
+
+class PicoGraphics:
+    def __init__(self, display=DISPLAY_INKY_FRAME_7, pen_type=PEN_3BIT, **kwargs):
+        self.width, self.height = _BOUNDS.get(display, _BOUNDS[DISPLAY_INKY_FRAME_7])
+        self.font = "bitmap8"
+        self.pen = 0
+        self.thickness = 1
+        self.clip = (0, 0, self.width, self.height)
+        self.pixels = bytearray(self.width * self.height)
+        self.calls = []
+        self.updates = 0
+
+    def get_bounds(self):
+        return self.width, self.height
+
+    def set_font(self, font):
+        self.font = font
+        self.calls.append(("set_font", font))
+
+    def set_pen(self, pen):
+        self.pen = pen & 7
+        self.calls.append(("set_pen", pen))
+
+    def create_pen(self, r, g, b):
+        """The closest of the 8 panel colours."""
+        best = 0
+        for i, (pr, pg, pb) in enumerate(PALETTE):
+            d = (pr - r) ** 2 + (pg - g) ** 2 + (pb - b) ** 2
+            if i == 0 or d < best_d:
+                best, best_d = i, d
+        return best
+
+    def set_thickness(self, thickness):
+        self.thickness = thickness
+        self.calls.append(("set_thickness", thickness))
+
+    def set_clip(self, x, y, w, h):
+        self.clip = (max(0, x), max(0, y), min(self.width, x + w), min(self.height, y + h))
+
+    def remove_clip(self):
+        self.clip = (0, 0, self.width, self.height)
+
+    def _fill(self, x, y, w, h):
+        cx0, cy0, cx1, cy1 = self.clip
+        x0, y0 = max(x, cx0), max(y, cy0)
+        x1, y1 = min(x + w, cx1), min(y + h, cy1)
+        if x0 >= x1 or y0 >= y1:
+            return
+        span = bytes([self.pen]) * (x1 - x0)
+        width = self.width
+        for row in range(y0, y1):
+            self.pixels[row * width + x0:row * width + x1] = span
+
+    def clear(self):
+        self.calls.append(("clear",))
+        self._fill(0, 0, self.width, self.height)
+
+    def pixel(self, x, y):
+        self.calls.append(("pixel", x, y))
+        self._fill(x, y, 1, 1)
+
+    def pixel_span(self, x, y, length):
+        self.calls.append(("pixel_span", x, y, length))
+        self._fill(x, y, length, 1)
+
+    def rectangle(self, x, y, w, h):
+        self.calls.append(("rectangle", x, y, w, h))
+        self._fill(x, y, w, h)
+
+    def line(self, x1, y1, x2, y2, thickness=1):
+        self.calls.append(("line", x1, y1, x2, y2))
+        dx, dy = abs(x2 - x1), -abs(y2 - y1)
+        sx, sy = (1 if x1 < x2 else -1), (1 if y1 < y2 else -1)
+        err = dx + dy
+        while True:
+            self._fill(x1, y1, thickness, thickness)
+            if x1 == x2 and y1 == y2:
+                break
+            e2 = 2 * err
+            if e2 >= dy:
+                err += dy
+                x1 += sx
+            if e2 <= dx:
+                err += dx
+                y1 += sy
+
+    def circle(self, x, y, r):
+        self.calls.append(("circle", x, y, r))
+        for dy in range(-r, r + 1):
+            dx = int((r * r - dy * dy) ** 0.5)
+            self._fill(x - dx, y + dy, 2 * dx + 1, 1)
+
+    def _char_width(self, c, scale):
+        if self.font in _BITMAP_FONTS:
+            return _BITMAP_FONTS[self.font][0] * int(scale)
+        return int(_vector_width(c) * scale)
+
+    def text(self, text, x, y, wordwrap=None, scale=2, angle=0, spacing=1):
+        self.calls.append(("text", text, x, y, wordwrap, scale))
+        bitmap = self.font in _BITMAP_FONTS
+        if bitmap:
+            height = _BITMAP_FONTS[self.font][1] * int(scale)
+            line_height = height + int(scale)
+            top = 0
+        else:
+            height = int(_VECTOR_HEIGHT * scale)
+            line_height = int(_VECTOR_HEIGHT * 1.6 * scale)
+            top = -height // 2
+        gap = max(1, int(scale)) if bitmap else max(1, self.thickness)
+        cx, cy = x, y
+        for word in text.split(" "):
+            width = sum(self._char_width(c, scale) for c in word)
+            if wordwrap is not None and cx > x and cx + width - x > wordwrap:
+                cx, cy = x, cy + line_height
+            for c in word:
+                w = self._char_width(c, scale)
+                self._fill(cx, cy + top, w - gap, height)
+                cx += w
+            cx += self._char_width(" ", scale)
+
+    def measure_text(self, text, scale=2, spacing=1):
+        if self.font in _BITMAP_FONTS:
+            return len(text) * _BITMAP_FONTS[self.font][0] * int(scale)
+        return int(sum(_vector_width(c) for c in text) * scale)
+
+    def update(self):
+        self.updates += 1
+        self.calls.append(("update",))
+        from inkysim import simulator
+        if simulator.current is not None:
+            simulator.current.panel_update(self.pixels)
+
+    def partial_update(self, x, y, w, h):
+        """Does nothing, like the Inky Frame drivers: they inherit the base driver's no-op."""
+        self.calls.append(("partial_update", x, y, w, h))
+
+    def digest(self):
+        """Hash of the recorded calls, for golden-frame comparisons."""
+        return hashlib.sha256(repr(self.calls).encode()).hexdigest()[:16]
+
+    def image_digest(self):
+        """Hash of the framebuffer, for golden-image comparisons."""
+        return hashlib.sha256(self.pixels).hexdigest()[:16]
+
+    def save_png(self, path):
+        from inkysim import png
+        png.write(path, self.width, self.height, self.pixels, PALETTE)
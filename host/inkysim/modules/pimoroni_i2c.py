@@ -0,0 +1,8 @@
+"""CPython stand-in for Pimoroni's pimoroni_i2c module."""
+
+
+class PimoroniI2C:
+    def __init__(self, sda, scl, baudrate=400000):
+        self.sda = sda
+        self.scl = scl
+        self.baudrate = baudrate
@@ -0,0 +1,58 @@
+"""CPython stand-in for MicroPython's requests, talking to the simulated board's API."""
+import io
+import ujson
+from _board import board
+
+
+class Response:
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.reason = b""
+        self.headers = headers
+        self.raw = io.BytesIO(body)
+        self._content = None
+
+    def close(self):
+        self.raw.close()
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = self.raw.read()
+        return self._content
+
+    @property
+    def text(self):
+        return str(self.content, "utf-8")
+
+    def json(self):
+        return ujson.loads(self.content)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code:
+            raise OSError("HTTP error {}".format(self.status_code))
+
+
+def request(method, url, data=None, json=None, headers=None, stream=None, timeout=None):
+    status, response_headers, body = board().http(method, url, headers or {})
+    return Response(status, response_headers, body)
+
+
+def head(url, **kw):
+    return request("HEAD", url, **kw)
+
+
+def get(url, **kw):
+    return request("GET", url, **kw)
+
+
+def post(url, **kw):
+    return request("POST", url, **kw)
+
+
+def put(url, **kw):
+    return request("PUT", url, **kw)
+
+
+def delete(url, **kw):
+    return request("DELETE", url, **kw)
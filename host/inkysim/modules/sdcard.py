@@ -0,0 +1,14 @@
+"""CPython stand-in for the sdcard driver: a temp directory of the simulated board."""
+import errno
+from _board import board
+
+
+class SDCard:
+    def __init__(self, spi, cs, baudrate=1320000):
+        sim = board()
+        if not sim.sd_present:
+            raise OSError(errno.ENODEV, "no SD card")
+        self.root = sim.sd_dir
+
+    def mount(self, mount_point, readonly):
+        board().trace("sd mount", mount_point)
@@ -0,0 +1,91 @@
+"""CPython stand-in for MicroPython's uasyncio (v3 API) on top of asyncio."""
+import asyncio as _asyncio
+from asyncio import *  # noqa: F401,F403
+
+__version__ = (3, 0, 0)
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+class Stream:
+    """uasyncio's Stream: one object for both reading and writing a socket."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self.s = writer.get_extra_info("socket")
+        self.e = {}
+
+    @property
+    def out_buf(self):
+        # Data the socket did not take yet, like uasyncio's Stream.out_buf
+        return self._writer.transport.get_write_buffer_size()
+
+    def get_extra_info(self, v):
+        return self._writer.get_extra_info(v)
+
+    async def read(self, n=-1):
+        return await self._reader.read(n)
+
+    async def readinto(self, buf):
+        data = await self._reader.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    async def readexactly(self, n):
+        try:
+            return await self._reader.readexactly(n)
+        except _asyncio.IncompleteReadError:
+            raise EOFError
+
+    async def readline(self):
+        return await self._reader.readline()
+
+    def write(self, buf):
+        if isinstance(buf, str):
+            buf = buf.encode()
+        self._writer.write(bytes(buf))
+
+    async def drain(self):
+        await self._writer.drain()
+
+    async def awrite(self, buf, off=0, sz=-1):
+        if sz == -1:
+            sz = len(buf) - off
+        self.write(buf[off:off + sz])
+        await self.drain()
+
+    async def awritestr(self, s):
+        await self.awrite(s)
+
+    def close(self):
+        self._writer.close()
+
+    async def wait_closed(self):
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+
+    async def aclose(self):
+        self.close()
+        await self.wait_closed()
+
+
+StreamReader = Stream
+StreamWriter = Stream
+
+
+async def open_connection(host, port):
+    reader, writer = await _asyncio.open_connection(host, port)
+    s = Stream(reader, writer)
+    return s, s
+
+
+async def start_server(cb, host, port, backlog=5):
+    async def _cb(reader, writer):
+        s = Stream(reader, writer)
+        await cb(s, s)
+    return await _asyncio.start_server(_cb, host, port, backlog=backlog)
@@ -0,0 +1,2 @@
+"""CPython stand-in for uasyncio.core; the v3 I/O queue internals have no equivalent."""
+from asyncio import CancelledError, TimeoutError  # noqa: F401
@@ -0,0 +1,2 @@
+"""CPython stand-in for MicroPython's uerrno."""
+from errno import *  # noqa: F401,F403
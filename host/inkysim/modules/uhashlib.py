@@ -0,0 +1,2 @@
+"""CPython stand-in for MicroPython's uhashlib."""
+from hashlib import *  # noqa: F401,F403
@@ -0,0 +1,14 @@
+"""CPython stand-in for MicroPython's ujson.
+
+MicroPython's dumps() writes non-ASCII characters as they are, not as \\u escapes.
+"""
+import json as _json
+from json import *  # noqa: F401,F403
+
+
+def dumps(obj, separators=None):
+    return _json.dumps(obj, separators=separators, ensure_ascii=False)
+
+
+def dump(obj, stream, separators=None):
+    stream.write(dumps(obj, separators))
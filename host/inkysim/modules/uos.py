@@ -0,0 +1,83 @@
+"""CPython stand-in for MicroPython's uos.
+
+Paths are host paths unless a simulated board has set `flash`: then the
+MicroPython filesystem is rooted in that host directory, relative paths
+start at "/", and mount() attaches block devices (the sdcard stand-in)
+under their mount points.
+"""
+import builtins as _builtins
+import errno as _errno
+import os as _os
+from os import *  # noqa: F401,F403
+
+# Host directory holding the internal flash filesystem, None - no translation
+flash = None
+# Mount point -> host directory
+mounts = {}
+
+
+def host_path(path):
+    """Translates a MicroPython path into the host path backing it."""
+    if flash is None:
+        return path
+    if not path.startswith("/"):
+        path = "/" + path
+    for point, root in mounts.items():
+        if path == point or path.startswith(point + "/"):
+            return root + path[len(point):]
+    return flash + path
+
+
+def open(path, *args, **kwargs):
+    return _builtins.open(host_path(path), *args, **kwargs)
+
+
+def stat(path):
+    return _os.stat(host_path(path))
+
+
+def listdir(path="/"):
+    return _os.listdir(host_path(path))
+
+
+def ilistdir(path="/"):
+    for entry in _os.scandir(host_path(path)):
+        yield entry.name, 0x4000 if entry.is_dir() else 0x8000, entry.inode(), entry.stat().st_size
+
+
+def mkdir(path):
+    _os.mkdir(host_path(path))
+
+
+def rmdir(path):
+    _os.rmdir(host_path(path))
+
+
+def remove(path):
+    _os.remove(host_path(path))
+
+
+def rename(old, new):
+    _os.rename(host_path(old), host_path(new))
+
+
+def statvfs(path):
+    st = _os.statvfs(host_path(path))
+    return (st.f_bsize, st.f_frsize, st.f_blocks, st.f_bfree, st.f_bavail, st.f_files, st.f_ffree, st.f_favail, 0, st.f_namemax)
+
+
+def sync():
+    pass
+
+
+def mount(device, mount_point, readonly=False):
+    if mount_point in mounts:
+        raise OSError(_errno.EPERM, "mount point in use")
+    device.mount(mount_point, readonly)
+    mounts[mount_point] = device.root
+
+
+def umount(mount_point):
+    if mount_point not in mounts:
+        raise OSError(_errno.EINVAL, "not mounted")
+    del mounts[mount_point]
@@ -0,0 +1,71 @@
+"""CPython stand-in for MicroPython's utime.
+
+MicroPython has no time zones: localtime() and mktime() work in UTC like
+gmtime(), and ticks_*() are the millisecond/microsecond counters.
+
+Everything reads `clock`, the host's clocks by default. A simulated board
+(inkysim.simulator.Simulator) replaces it with its virtual clock, so that
+sleeps return instantly and only advance the simulated time.
+"""
+import calendar as _calendar
+import time as _time
+from time import *  # noqa: F401,F403
+
+
+class HostClock:
+    def time(self):
+        return _time.time()
+
+    def ticks_ns(self):
+        return _time.monotonic_ns()
+
+    def sleep(self, secs):
+        _time.sleep(secs)
+
+
+clock = HostClock()
+
+
+def time():
+    """Whole seconds, like MicroPython."""
+    return int(clock.time())
+
+
+def localtime(secs=None):
+    """(year, month, mday, hour, minute, second, weekday, yearday), like MicroPython."""
+    return tuple(_time.gmtime(clock.time() if secs is None else secs))[:8]
+
+
+gmtime = localtime
+
+
+def mktime(t):
+    return _calendar.timegm(tuple(t[:6]) + (0, 0, 0))
+
+
+def ticks_ms():
+    return clock.ticks_ns() // 1000000
+
+
+def ticks_us():
+    return clock.ticks_ns() // 1000
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def ticks_diff(ticks1, ticks2):
+    return ticks1 - ticks2
+
+
+def sleep(secs):
+    clock.sleep(secs)
+
+
+def sleep_ms(ms):
+    clock.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    clock.sleep(us / 1000000)
@@ -0,0 +1,27 @@
+"""Minimal PNG writer for palette images, zlib is all it needs."""
+import struct
+import zlib
+
+
+def _chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def encode(width, height, pixels, palette):
+    """PNG of a width x height image given as one palette index per byte."""
+    raw = bytearray()
+    for y in range(height):
+        raw.append(0)  # filter type: none
+        raw += pixels[y * width:(y + 1) * width]
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)),
+        _chunk(b"PLTE", b"".join(bytes(rgb) for rgb in palette)),
+        _chunk(b"IDAT", zlib.compress(bytes(raw), 6)),
+        _chunk(b"IEND", b""),
+    ))
+
+
+def write(path, width, height, pixels, palette):
+    with open(path, "wb") as f:
+        f.write(encode(width, height, pixels, palette))
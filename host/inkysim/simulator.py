@@ -0,0 +1,483 @@
+"""Simulated Inky Frame 7.3" that runs board/main.py under CPython.
+
+A Simulator is the hardware that outlives a wake: the virtual clock, the
+PCF85063A RTC, the internal flash and the SD card (temp directories), the
+panel image, the WiFi access points and the calendar API. wake() boots
+the board code on it - main.py and every board module imported afresh,
+like after a power cycle - and returns when the code resets the board,
+turns the power off or exits. Sleeps only advance the virtual clock, so
+a boot/fetch/draw/sleep cycle takes milliseconds.
+
+The stand-in modules (machine, inky_frame, network, picographics, ...)
+reach the hardware through `current`. Board code gets the MicroPython
+view of the host: `time` is utime, `os` is uos and open() goes through the
+simulated filesystems.
+
+Example:
+    with Simulator() as sim:
+        sim.api.events = [(18, 10, 9, 30, 0, "Dentist")]
+        wake = sim.wake()
+        print(wake.outcome, wake.ms)
+        sim.save_png("frame.png")
+"""
+import builtins
+import contextlib
+import gc
+import importlib.machinery
+import importlib.util
+import io
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+
+from . import install, png
+from .clock import VirtualClock
+
+install()
+
+import uos  # noqa: E402
+import utime  # noqa: E402
+from picographics import PALETTE  # noqa: E402
+
+BOARD_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "board"))
+BOARD_LIB_DIR = os.path.join(BOARD_DIR, "lib")
+
+# The simulator the stand-in modules talk to, set while a wake runs
+current = None
+
+# MicroPython time (1 Jan 2021) the Pico RTC starts from after a reset
+PICO_RTC_RESET_TIME = 1609459200
+
+# WLAN.status() codes, as in the rp2 port
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_CONNECT_FAIL = -1
+STAT_NO_AP_FOUND = -2
+STAT_WRONG_PASSWORD = -3
+STAT_GOT_IP = 3
+
+# Names the board code imports that are u-modules on MicroPython
+_ALIASES = {
+    "time": "utime", "os": "uos", "json": "ujson", "errno": "uerrno", "socket": "usocket",
+    "binascii": "ubinascii", "hashlib": "uhashlib", "asyncio": "uasyncio",
+}
+
+
+class SimulationError(Exception):
+    """The simulated board did something the simulator cannot go along with."""
+
+
+class Reset(BaseException):
+    """machine.reset(): ends the wake. A BaseException, so board code cannot swallow it."""
+
+
+class PowerOff(BaseException):
+    """The board cut its own power (battery) until the RTC alarm."""
+
+
+class AccessPoint:
+    def __init__(self, ssid, password, bssid=b"\x02\x00\x00\x00\x00\x01", channel=6, rssi=-55,
+                 ip="192.168.1.50", netmask="255.255.255.0", gateway="192.168.1.1", dns="192.168.1.1"):
+        self.ssid = ssid
+        self.password = password
+        self.bssid = bssid
+        self.channel = channel
+        self.rssi = rssi
+        self.ifconfig = (ip, netmask, gateway, dns)
+
+
+class Wake:
+    """What happened during one wake."""
+
+    def __init__(self, number, started):
+        self.number = number
+        self.started = started
+        self.ended = started
+        # "reset", "power off", "exit" or "error"
+        self.outcome = None
+        self.error = None
+        self.refreshes = 0
+        self.requests = 0
+        self.output = ""
+        self.host_ms = 0
+        # Peak bytes the wake allocated on the host, with trace_heap
+        self.peak_heap = 0
+
+    @property
+    def ms(self):
+        """Virtual milliseconds from boot to the end of the wake."""
+        return (self.ended - self.started) // 1000000
+
+    def __repr__(self):
+        return "<Wake {} {} {} ms, {} refreshes, {} requests>".format(
+            self.number, self.outcome, self.ms, self.refreshes, self.requests)
+
+
+_MONTHS = ("", "Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _format_date_time(event):
+    day, month, hour, minute, flags = event[:5]
+    if flags & 1:
+        return "{:02d}.{}".format(day, _MONTHS[month])
+    return "{:02d}.{}.{:02d}:{:02d}".format(day, _MONTHS[month], hour, minute)
+
+
+class CalendarAPI:
+    """Stand-in for the calendar backend: GET /calendars/<name>?num-events=N.
+    Serves `events`, (day, month, hour, minute, flags, summary) tuples, as JSON or in the
+    binary format depending on Accept, with ETag revalidation like the real API.
+    """
+
+    BINARY_CONTENT_TYPE = "application/vnd.inkyframe.events"
+
+    def __init__(self, auth_header="x-api-key", auth_key="simulated-key", events=None):
+        self.auth_header = auth_header
+        self.auth_key = auth_key
+        self.events = events if events is not None else []
+        # Milliseconds one request takes
+        self.latency_ms = 400
+        self.requests = 0
+        # Status to answer with instead, e.g. 500
+        self.fail_status = None
+
+    def handle(self, method, url, headers):
+        """Returns (status, headers, body)."""
+        self.requests += 1
+        headers = {k.lower(): v for k, v in headers.items()}
+        if headers.get(self.auth_header.lower()) != self.auth_key:
+            return 401, {}, b'{"message":"Unauthorized"}'
+        if self.fail_status:
+            return self.fail_status, {}, b""
+        query = url.partition("?")[2]
+        count = len(self.events)
+        for param in query.split("&"):
+            if param.startswith("num-events="):
+                count = int(param[11:])
+        events = self.events[:count]
+        if self.BINARY_CONTENT_TYPE in headers.get("accept", ""):
+            content_type = self.BINARY_CONTENT_TYPE
+            body = struct.pack("BB", 1, len(events)) + b"".join(
+                struct.pack("BBBBBB", *e[:5], len(e[5].encode())) + e[5].encode() for e in events)
+        else:
+            content_type = "application/json"
+            body = json.dumps([{"dateTime": _format_date_time(e), "summary": e[5]} for e in events]).encode()
+        etag = '"{:08x}"'.format(zlib.crc32(body))
+        if headers.get("if-none-match") == etag:
+            return 304, {"ETag": etag, "Vary": "Accept"}, b""
+        return 200, {"Content-Type": content_type, "ETag": etag, "Vary": "Accept"}, body
+
+
+class _BoardLoader(importlib.machinery.SourceFileLoader):
+    """Executes a board module with the MicroPython flavoured builtins."""
+
+    def __init__(self, fullname, path, env):
+        super().__init__(fullname, path)
+        self.env = env
+
+    def exec_module(self, module):
+        module.__builtins__ = self.env
+        super().exec_module(module)
+
+
+class _BoardFinder:
+    """Finds top-level modules in board/, board/lib/ and the directories board code added to sys.path."""
+
+    def __init__(self, env, sys_path):
+        self.env = env
+        self.sys_path = sys_path
+
+    def dirs(self):
+        yield BOARD_DIR
+        yield BOARD_LIB_DIR
+        for entry in sys.path:
+            if entry not in self.sys_path and entry.startswith("/"):
+                yield uos.host_path(entry)
+
+    def find_spec(self, name, path=None, target=None):
+        if path is not None:
+            return None
+        for d in self.dirs():
+            filename = os.path.join(d, name + ".py")
+            if os.path.isfile(filename):
+                return importlib.util.spec_from_file_location(
+                    name, filename, loader=_BoardLoader(name, filename, self.env))
+            filename = os.path.join(d, name, "__init__.py")
+            if os.path.isfile(filename):
+                return importlib.util.spec_from_file_location(
+                    name, filename, loader=_BoardLoader(name, filename, self.env),
+                    submodule_search_locations=[os.path.join(d, name)])
+        return None
+
+
+def _board_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level == 0:
+        name = _ALIASES.get(name, name)
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+class Simulator:
+    """Hardware state of a simulated Inky Frame, see the module docstring.
+    Arguments:
+        start - UTC time of the first boot, in seconds
+        power - "battery": sleep_for() cuts the power; "usb": it waits and returns
+        cpu_scale - charge host CPU time times this to the virtual clock (0 - sleeps only)
+        provision - write state.json and secrets.py for the calendar app
+        quiet - capture what the board code prints in Wake.output instead of printing it
+        trace_heap - gc.mem_alloc() follows what the wake allocates on the host (tracemalloc,
+            slower), and Wake.peak_heap records its peak. CPython objects are bigger than
+            MicroPython's, so compare the figures across runs, not with the board.
+    """
+
+    WIFI_SSID = "inkysim"
+    WIFI_PASSWORD = "inkysim-password"
+    API_URL = "https://calendar.inkysim.invalid"
+
+    def __init__(self, start=1792306800, power="battery", cpu_scale=0, provision=True, quiet=True,
+                 trace_heap=False):
+        self.clock = VirtualClock(start, cpu_scale)
+        self.power = power
+        self.quiet = quiet
+        self.trace_heap = trace_heap
+        # Tick (ns) of the last boot: ticks_ms() restarts at 0 on every power cycle
+        self.boot_ns = 0
+        self.flash_dir = tempfile.mkdtemp(prefix="inkysim-flash-")
+        self.sd_dir = tempfile.mkdtemp(prefix="inkysim-sd-")
+        self.sd_present = True
+
+        # PCF85063A: its time is the true time plus offset, drifting by drift_ppm since it was set
+        self.rtc_offset = 0.0
+        self.rtc_drift_ppm = 0.0
+        self.rtc_set_at = start
+        # Pico RTC: offset from the true time, lost on every reset
+        self.pico_offset = 0.0
+
+        # WiFi: stages of a join, in milliseconds
+        self.access_points = {}
+        self.wifi_scan_ms = 1200
+        self.wifi_auth_ms = 800
+        self.wifi_dhcp_ms = 1500
+        # Statuses the next connect attempts end with instead of success, e.g. [STAT_CONNECT_FAIL]
+        self.wifi_failures = []
+        self.radio = None
+        self.ntp_ms = 150
+
+        self.api = CalendarAPI()
+        self.buttons_held = set()
+        self.max_button_polls = 10000
+
+        # The panel keeps the last refreshed image, also through power off
+        self.width, self.height = 800, 480
+        self.panel = bytearray([1]) * (self.width * self.height)
+        self.refresh_ms = 30000
+        self.refreshes = 0
+
+        # (tick ms, what, detail) of everything that matters for power, see trace()
+        self.events = []
+        self.wakes = []
+        self.wake_at = None
+        self._wake = None
+
+        if provision:
+            self.provision()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        shutil.rmtree(self.flash_dir, ignore_errors=True)
+        shutil.rmtree(self.sd_dir, ignore_errors=True)
+
+    def provision(self):
+        """Sets the board up for the calendar app: state.json on flash, secrets.py on the SD card."""
+        self.write_flash("state.json", json.dumps({"run": "calendar_usb_power"}))
+        self.write_sd("secrets.py", "".join("{} = {!r}\n".format(k, v) for k, v in (
+            ("WIFI_SSID", self.WIFI_SSID),
+            ("WIFI_PASSWORD", self.WIFI_PASSWORD),
+            ("API_AUTH_HEADER", self.api.auth_header),
+            ("API_AUTH_KEY", self.api.auth_key),
+            ("API_URL", self.API_URL),
+        )))
+        self.access_points[self.WIFI_SSID] = AccessPoint(self.WIFI_SSID, self.WIFI_PASSWORD)
+
+    def write_flash(self, name, data):
+        with open(os.path.join(self.flash_dir, name), "w" if isinstance(data, str) else "wb") as f:
+            f.write(data)
+
+    def write_sd(self, name, data):
+        with open(os.path.join(self.sd_dir, name), "w" if isinstance(data, str) else "wb") as f:
+            f.write(data)
+
+    # utime clock interface: time() is what the Pico RTC says
+
+    def time(self):
+        return int(self.clock.now() + self.pico_offset)
+
+    def ticks_ns(self):
+        return self.clock.ticks_ns() - self.boot_ns
+
+    def sleep(self, secs):
+        self.clock.advance(secs)
+
+    # Hardware
+
+    def trace(self, what, detail=None):
+        """Records a power relevant event: radio on/off, panel refresh, sleep..."""
+        self.events.append((self.clock.ms(), what, detail))
+
+    def rtc_time(self):
+        now = self.clock.now()
+        return int(now + self.rtc_offset + (now - self.rtc_set_at) * self.rtc_drift_ppm / 1000000)
+
+    def set_rtc_time(self, secs):
+        now = self.clock.now()
+        self.rtc_offset = secs - now
+        self.rtc_set_at = now
+
+    def set_pico_time(self, secs):
+        self.pico_offset = secs - self.clock.now()
+
+    def ntp_sync(self):
+        """inky_frame.set_time(): sets the Pico RTC and the PCF85063A to the true time."""
+        if self.radio is None or not self.radio.connected():
+            raise OSError(-2, "NTP server unreachable")
+        self.sleep(self.ntp_ms / 1000)
+        self.set_pico_time(int(self.clock.now()))
+        self.set_rtc_time(int(self.clock.now()))
+
+    def http(self, method, url, headers):
+        if self.radio is None or not self.radio.connected():
+            raise OSError(-2, "host unreachable")
+        if not url.startswith(self.API_URL):
+            raise OSError(-2, "unknown host")
+        self.trace("http", url)
+        self.sleep(self.api.latency_ms / 1000)
+        if self._wake is not None:
+            self._wake.requests += 1
+        return self.api.handle(method, url[len(self.API_URL):], headers)
+
+    def panel_update(self, pixels):
+        """display.update(): the panel takes the framebuffer, refreshing blocks for refresh_ms."""
+        self.trace("refresh", True)
+        self.panel[:] = pixels
+        self.sleep(self.refresh_ms / 1000)
+        self.refreshes += 1
+        if self._wake is not None:
+            self._wake.refreshes += 1
+        self.trace("refresh", False)
+
+    def sleep_for(self, minutes):
+        """inky_frame.sleep_for(): on battery the board is off until the RTC timer fires."""
+        self.trace("sleep", minutes)
+        if self.power == "battery":
+            self.wake_at = self.clock.now() + minutes * 60
+            raise PowerOff()
+        self.sleep(minutes * 60)
+
+    def save_png(self, path):
+        """Writes the panel image as a PNG."""
+        png.write(path, self.width, self.height, self.panel, PALETTE)
+
+    # Running the board code
+
+    def wake(self, main=os.path.join(BOARD_DIR, "main.py")):
+        """Boots the board and runs main until it resets, powers off or exits. Returns a Wake."""
+        global current
+        if self.wake_at is not None:
+            self.clock.advance(max(0, self.wake_at - self.clock.now()))
+            self.wake_at = None
+        self.boot_ns = self.clock.ticks_ns()
+        wake = Wake(len(self.wakes), self.boot_ns)
+        self.wakes.append(wake)
+        self._wake = wake
+        self.trace("boot")
+
+        # Power cycle: the Pico RTC restarts, the radio is off, nothing is mounted
+        self.set_pico_time(PICO_RTC_RESET_TIME)
+        self.radio = None
+        self.button_polls = 0
+
+        env = dict(builtins.__dict__)
+        env["open"] = uos.open
+        env["__import__"] = _board_import
+        saved_path = list(sys.path)
+        saved_modules = self._take_board_modules()
+        finder = _BoardFinder(env, saved_path)
+        saved_clock, saved_flash, saved_mounts = utime.clock, uos.flash, uos.mounts
+        saved_alloc = gc.mem_alloc
+        if self.trace_heap:
+            tracemalloc.start()
+            base = tracemalloc.get_traced_memory()[0]
+            gc.mem_alloc = lambda: max(0, tracemalloc.get_traced_memory()[0] - base)
+        out = io.StringIO()
+        started = time.perf_counter()
+        current = self
+        utime.clock = self
+        uos.flash = self.flash_dir
+        uos.mounts = {}
+        sys.meta_path.insert(0, finder)
+        self.clock.resume()
+        try:
+            with open(main) as f:
+                code = compile(f.read(), main, "exec")
+            with contextlib.redirect_stdout(out) if self.quiet else contextlib.nullcontext():
+                exec(code, {"__name__": "__main__", "__file__": main, "__builtins__": env})
+            wake.outcome = "exit"
+        except Reset:
+            wake.outcome = "reset"
+        except PowerOff:
+            wake.outcome = "power off"
+        except SystemExit:
+            wake.outcome = "exit"
+        except Exception as e:
+            wake.outcome = "error"
+            wake.error = e
+        finally:
+            self.clock.pause()
+            sys.meta_path.remove(finder)
+            sys.path[:] = saved_path
+            self._take_board_modules()
+            sys.modules.update(saved_modules)
+            utime.clock, uos.flash, uos.mounts = saved_clock, saved_flash, saved_mounts
+            if self.trace_heap:
+                wake.peak_heap = max(0, tracemalloc.get_traced_memory()[1] - base)
+                tracemalloc.stop()
+            gc.mem_alloc = saved_alloc
+            current = None
+            self._wake = None
+            if self.radio is not None and self.radio.active:
+                self.trace("radio", False)
+            self.radio = None
+        wake.ended = self.clock.ticks_ns()
+        wake.host_ms = (time.perf_counter() - started) * 1000
+        wake.output = out.getvalue()
+        self.trace("off")
+        return wake
+
+    def run(self, wakes):
+        """Runs that many wakes back to back, returns their Wake records."""
+        return [self.wake() for _ in range(wakes)]
+
+    def _take_board_modules(self):
+        """Removes board modules from sys.modules, and those shadowed by files on flash or the SD card."""
+        names = set()
+        for d in (self.flash_dir, self.sd_dir):
+            for entry in os.listdir(d):
+                if entry.endswith(".py"):
+                    names.add(entry[:-3])
+        taken = {}
+        for name, module in list(sys.modules.items()):
+            filename = getattr(module, "__file__", None) or ""
+            if name in names or filename.startswith(BOARD_DIR + os.sep) or isinstance(
+                    getattr(module, "__loader__", None), _BoardLoader):
+                taken[name] = sys.modules.pop(name)
+        return taken
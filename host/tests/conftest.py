@@ -0,0 +1,12 @@
+"""Host tests: the board code runs under CPython on the inkysim stand-ins.
+From the repository root:
+    python -m pytest host/tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import inkysim  # noqa: E402
+
+inkysim.install()
@@ -0,0 +1,87 @@
+import io
+
+from calendar_decoder import EventStreamDecoder, BinaryEventDecoder, BINARY_CONTENT_TYPE
+from inkysim.simulator import CalendarAPI
+
+EVENTS = [
+    (18, 10, 9, 30, 0, "Dentist"),
+    (18, 10, 0, 0, 1, "Anna's birthday"),
+    (19, 10, 14, 0, 0, 'Planning "Q4" \\ room 4.12'),
+    (21, 10, 18, 15, 0, "Fußball – Training"),
+    (24, 10, 0, 0, 1, "Half term"),
+]
+# EVENTS cut to 4 events and 3 bytes of summary. The 2 bytes of "ß" do not fit,
+# it is dropped rather than cut in half
+CUT = [
+    (18, 10, 9, 30, 0, "Den"),
+    (18, 10, 0, 0, 1, "Ann"),
+    (19, 10, 14, 0, 0, "Pla"),
+    (21, 10, 18, 15, 0, "Fu"),
+]
+
+
+def fetch(api, accept=None, etag=None, count=None):
+    headers = {api.auth_header: api.auth_key}
+    if accept:
+        headers["Accept"] = accept
+    if etag:
+        headers["If-None-Match"] = etag
+    url = "https://calendar.inkysim.invalid/calendars/home"
+    if count is not None:
+        url += "?num-events={}".format(count)
+    return api.handle("GET", url, headers)
+
+
+def decode_json(body, **kwargs):
+    return EventStreamDecoder(**kwargs).decode(io.BytesIO(body))
+
+
+def decode_binary(body, **kwargs):
+    return BinaryEventDecoder(**kwargs).decode(io.BytesIO(body))
+
+
+def test_json_response_decodes_to_the_served_events():
+    status, headers, body = fetch(CalendarAPI(events=EVENTS))
+    assert status == 200
+    assert headers["Content-Type"] == "application/json"
+    assert decode_json(body) == EVENTS
+    # Buffer refills in the middle of keys, strings and escapes
+    assert decode_json(body, buf_size=7) == EVENTS
+
+
+def test_json_decoder_cuts_events_and_summaries():
+    body = fetch(CalendarAPI(events=EVENTS))[2]
+    assert decode_json(body, max_events=4, max_summary_len=3) == CUT
+
+
+def test_num_events_limits_the_json_response():
+    assert decode_json(fetch(CalendarAPI(events=EVENTS), count=2)[2]) == EVENTS[:2]
+
+
+def test_binary_response_decodes_to_the_served_events():
+    status, headers, body = fetch(CalendarAPI(events=EVENTS), accept=BINARY_CONTENT_TYPE)
+    assert status == 200
+    assert headers["Content-Type"] == BINARY_CONTENT_TYPE
+    assert decode_binary(body) == EVENTS
+
+
+def test_binary_decoder_cuts_like_the_json_decoder():
+    body = fetch(CalendarAPI(events=EVENTS), accept=BINARY_CONTENT_TYPE)[2]
+    assert decode_binary(body, max_events=4, max_summary_len=3) == CUT
+
+
+def test_num_events_limits_the_binary_response():
+    body = fetch(CalendarAPI(events=EVENTS), accept=BINARY_CONTENT_TYPE, count=2)[2]
+    assert decode_binary(body) == EVENTS[:2]
+
+
+def test_matching_etag_is_answered_with_an_empty_304():
+    api = CalendarAPI(events=EVENTS)
+    _, json_headers, _ = fetch(api)
+    _, binary_headers, _ = fetch(api, accept=BINARY_CONTENT_TYPE)
+    assert json_headers["ETag"] != binary_headers["ETag"]
+    assert fetch(api, etag=json_headers["ETag"]) == (304, {"ETag": json_headers["ETag"], "Vary": "Accept"}, b"")
+    api.events = EVENTS[1:]
+    status, _, body = fetch(api, etag=json_headers["ETag"])
+    assert status == 200
+    assert decode_json(body) == EVENTS[1:]
@@ -0,0 +1,42 @@
+from inkysim.simulator import Simulator
+
+EVENTS = [
+    (18, 10, 9, 30, 0, "Dentist"),
+    (18, 10, 0, 0, 1, "Anna's birthday"),
+    (19, 10, 14, 0, 0, "Quarterly planning"),
+    (21, 10, 18, 15, 0, "Football practice"),
+]
+CHANGED = [EVENTS[0], (18, 10, 15, 0, 0, "Moved to the afternoon")] + EVENTS[2:]
+
+
+def boot(sim, events):
+    sim.api.events = list(events)
+    wake = sim.wake()
+    assert wake.error is None, wake.output
+    return wake
+
+
+def test_changed_events_reach_the_panel():
+    with Simulator() as sim:
+        boot(sim, EVENTS)
+        before = bytes(sim.panel)
+        # After the update interval, with a row changed on the server
+        sim.wake_at = sim.clock.now() + 301 * 60
+        started = sim.wake_at
+        wake = boot(sim, CHANGED)
+        assert wake.refreshes == 1
+        assert bytes(sim.panel) != before
+        after = bytes(sim.panel)
+    # The same frame as a board that never saw the old events
+    with Simulator(start=int(started)) as fresh:
+        boot(fresh, CHANGED)
+        assert bytes(fresh.panel) == after
+
+
+def test_unchanged_events_skip_the_refresh():
+    with Simulator() as sim:
+        boot(sim, EVENTS)
+        sim.wake_at = sim.clock.now() + 301 * 60
+        wake = boot(sim, EVENTS)
+        assert wake.requests == 1
+        assert wake.refreshes == 0
@@ -0,0 +1,108 @@
+from picographics import PicoGraphics, DISPLAY_INKY_FRAME_7
+from calendar_layout import TextMeasurer, CalendarLayout, signatures, dirty_regions, OP_PEN, OP_FONT, OP_THICKNESS, OP_RECT, OP_TEXT
+
+NOW = (2026, 10, 18, 9, 30, 0, 6, 291)
+FOOTER = "Last updated: 18 Oct, 09:00"
+LONG = "Quarterly planning with the extended team, room 4.12 (bring laptops and the printed roadmap)"
+EVENTS = [
+    (18, 10, 9, 30, 0, "Dentist"),
+    (19, 10, 0, 0, 1, LONG),
+    (21, 10, 18, 15, 0, "Football practice"),
+    (22, 10, 8, 0, 0, "A"),
+    (23, 10, 8, 0, 0, "B"),
+    (24, 10, 8, 0, 0, "C"),
+]
+
+
+def make_layout():
+    return CalendarLayout(TextMeasurer(PicoGraphics(DISPLAY_INKY_FRAME_7)), 800, 480)
+
+
+def boxes(regions):
+    return [region[:5] for region in regions]
+
+
+def test_regions_tile_the_panel():
+    layout = make_layout()
+    regions = layout.layout(EVENTS, NOW, FOOTER)
+    assert boxes(regions) == [
+        ("title", 0, 0, 612, 75),
+        ("date", 612, 0, 188, 75),
+        ("row0", 0, 121, 800, 70),
+        ("row1", 0, 191, 800, 110),
+        ("row2", 0, 301, 800, 70),
+        ("row3", 0, 371, 800, 70),
+        ("footer", 0, 464, 800, 16),
+    ]
+    # The last two events do not fit above the footer
+    assert layout.hidden == 2
+
+
+def test_ops_of_a_row_of_today():
+    regions = make_layout().layout(EVENTS, NOW, FOOTER)
+    assert regions[2][5] == [
+        (OP_FONT, "sans"),
+        (OP_THICKNESS, 3),
+        (OP_PEN, 4),
+        (OP_RECT, 0, 121, 800, 48),
+        (OP_PEN, 1),
+        (OP_TEXT, "18.Oct.09:30 ", 0, 145, 800, 1.2),
+        (OP_TEXT, "Dentist", 238, 145, 562, 1.2),
+    ]
+
+
+def test_long_summary_is_wrapped_and_ellipsized():
+    regions = make_layout().layout(EVENTS, NOW, FOOTER)
+    assert regions[3][5] == [
+        (OP_FONT, "sans"),
+        (OP_THICKNESS, 3),
+        (OP_PEN, 0),
+        (OP_TEXT, "19.Oct ", 0, 215, 800, 1.2),
+        (OP_TEXT, "Quarterly planning with the extended", 121, 215, 679, 1.2),
+        (OP_TEXT, "team, room 4.12 (bring laptops and...", 121, 255, 679, 1.2),
+    ]
+
+
+def test_title_date_and_footer_ops():
+    regions = make_layout().layout(EVENTS, NOW, FOOTER)
+    assert regions[1][5] == (
+        (OP_FONT, "sans"),
+        (OP_THICKNESS, 4),
+        (OP_PEN, 4),
+        (OP_RECT, 612, 0, 188, 75),
+        (OP_PEN, 1),
+        (OP_TEXT, "18 Oct", 642, 37, 800, 1.4),
+    )
+    assert regions[-1][5] == (
+        (OP_FONT, "bitmap8"),
+        (OP_PEN, 0),
+        (OP_TEXT, FOOTER, 476, 464, 800, 2),
+    )
+
+
+def test_changed_summary_dirties_its_row_only():
+    layout = make_layout()
+    before = signatures(layout.layout(EVENTS, NOW, FOOTER))
+    changed = list(EVENTS)
+    changed[2] = (21, 10, 18, 15, 0, "Football match")
+    keys, rects = dirty_regions(before, signatures(layout.layout(changed, NOW, FOOTER)))
+    assert keys == ["row2"]
+    assert rects == [[0, 301, 800, 70]]
+
+
+def test_removed_event_dirties_the_rows_below_it():
+    layout = make_layout()
+    before = signatures(layout.layout(EVENTS, NOW, FOOTER))
+    keys, rects = dirty_regions(before, signatures(layout.layout(EVENTS[:1] + EVENTS[2:], NOW, FOOTER)))
+    assert sorted(keys) == ["row1", "row2", "row3", "row4"]
+    # New row boxes, and the old ones they no longer cover
+    assert sorted(rects) == [
+        [0, 191, 800, 70], [0, 191, 800, 110], [0, 261, 800, 70], [0, 301, 800, 70],
+        [0, 331, 800, 70], [0, 371, 800, 70], [0, 401, 800, 63],
+    ]
+
+
+def test_unchanged_events_dirty_nothing():
+    layout = make_layout()
+    before = signatures(layout.layout(EVENTS, NOW, FOOTER))
+    assert dirty_regions(before, signatures(layout.layout(list(EVENTS), NOW, FOOTER))) == ([], [])
@@ -0,0 +1,74 @@
+import utime
+from inkysim.clock import VirtualClock
+
+import event_log
+
+START = 1792306800
+
+
+class Clock(VirtualClock):
+    """The utime clock interface on a virtual clock, see utime.clock."""
+
+    def time(self):
+        return self.now()
+
+    def sleep(self, secs):
+        self.advance(secs)
+
+
+def read_log(log):
+    with open(log.segment(0), "rb") as f:
+        return [(secs - START, level, code, arg) for secs, level, code, arg, payload in event_log.decode(f.read())]
+
+
+def test_overflow_marker_comes_before_the_records_kept(tmp_path, monkeypatch):
+    clock = Clock(START)
+    monkeypatch.setattr(utime, "clock", clock)
+    log = event_log.EventLog(str(tmp_path / "events"), capacity=4)
+    for n in range(7):
+        log.info(event_log.CODE_WIFI, n)
+        clock.advance(10)
+    log.flush()
+    assert read_log(log) == [
+        # Records 0 to 2 were dropped, before the oldest one kept
+        (30, event_log.WARNING, event_log.CODE_DROPPED, 3),
+        (30, event_log.INFO, event_log.CODE_WIFI, 3),
+        (40, event_log.INFO, event_log.CODE_WIFI, 4),
+        (50, event_log.INFO, event_log.CODE_WIFI, 5),
+        (60, event_log.INFO, event_log.CODE_WIFI, 6),
+    ]
+
+
+def test_no_marker_without_overflow(tmp_path, monkeypatch):
+    clock = Clock(START)
+    monkeypatch.setattr(utime, "clock", clock)
+    log = event_log.EventLog(str(tmp_path / "events"), capacity=4)
+    for n in range(4):
+        log.info(event_log.CODE_WIFI, n)
+    log.flush()
+    log.info(event_log.CODE_SLEEP)
+    log.flush()
+    assert [code for _, _, code, _ in read_log(log)] == [event_log.CODE_WIFI] * 4 + [event_log.CODE_SLEEP]
+
+
+def test_records_parked_on_flash_move_to_the_sd_card(tmp_path, monkeypatch):
+    clock = Clock(START)
+    monkeypatch.setattr(utime, "clock", clock)
+    pending = tmp_path / "events-pending.bin"
+    monkeypatch.setattr(event_log, "PENDING_FILE", str(pending))
+    log = event_log.EventLog(capacity=4)
+    # The SD card is not mounted
+    log.info(event_log.CODE_FAST_PATH)
+    log.flush()
+    # Only as many records as fit in pending_records.MAX_SIZE are kept
+    for _ in range(event_log.pending_records.MAX_SIZE // event_log.RECORD_SIZE):
+        log.info(event_log.CODE_SLEEP)
+        log.flush()
+    assert pending.stat().st_size == event_log.pending_records.MAX_SIZE
+    log.path = str(tmp_path / "events")
+    log.info(event_log.CODE_SD_MOUNT)
+    log.flush()
+    codes = [code for _, _, code, _ in read_log(log)]
+    assert codes[0] == event_log.CODE_FAST_PATH and codes[-1] == event_log.CODE_SD_MOUNT
+    assert len(codes) == event_log.pending_records.MAX_SIZE // event_log.RECORD_SIZE + 1
+    assert not pending.exists()
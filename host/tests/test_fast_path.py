@@ -0,0 +1,43 @@
+from inkysim.simulator import Simulator
+
+EVENTS = [
+    (18, 10, 9, 30, 0, "Dentist"),
+    (18, 10, 0, 0, 1, "Anna's birthday"),
+    (19, 10, 14, 0, 0, "Quarterly planning"),
+]
+# What a wake must not do while the cached events are fresh
+NETWORK_AND_DISPLAY = ("wifi connect", "http", "sd mount", "refresh")
+
+
+def wake_traced(sim):
+    """Runs one wake, returns it together with what it did."""
+    mark = len(sim.events)
+    wake = sim.wake()
+    assert wake.error is None, wake.output
+    return wake, [(what, detail) for _, what, detail in sim.events[mark:]]
+
+
+def test_wake_within_the_update_interval_stays_offline():
+    with Simulator() as sim:
+        sim.api.events = list(EVENTS)
+        wake_traced(sim)
+        # Late in the freshness window, with the RTC trusted
+        sim.wake_at = sim.clock.now() + 299 * 60
+        wake, trace = wake_traced(sim)
+    assert "skipping WiFi" in wake.output
+    assert [what for what, _ in trace if what in NETWORK_AND_DISPLAY] == []
+    assert ("radio", True) not in trace
+    assert wake.requests == 0
+    assert wake.refreshes == 0
+    assert wake.outcome == "power off"
+
+
+def test_wake_after_the_update_interval_goes_online():
+    with Simulator() as sim:
+        sim.api.events = list(EVENTS)
+        wake_traced(sim)
+        sim.wake_at = sim.clock.now() + 301 * 60
+        wake, trace = wake_traced(sim)
+    assert "skipping WiFi" not in wake.output
+    assert ("radio", True) in trace
+    assert wake.requests == 1
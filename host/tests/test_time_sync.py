@@ -0,0 +1,46 @@
+import json
+import os
+
+import inky_frame
+from inkysim.simulator import Simulator
+
+EVENTS = [(18, 10, 9, 30, 0, "Dentist")]
+
+
+def resync_after(sim, hours):
+    """Runs a wake that has to sync the time again, returns the saved time sync state."""
+    sim.wake_at = sim.clock.now() + hours * 3600
+    wake = sim.wake()
+    assert wake.error is None, wake.output
+    with open(os.path.join(sim.flash_dir, "time_sync.json")) as f:
+        return json.load(f)
+
+
+def first_sync(sim):
+    sim.api.events = list(EVENTS)
+    sim.rtc_drift_ppm = 100
+    assert sim.wake().error is None
+
+
+def test_drift_is_measured_against_the_rtc():
+    with Simulator() as sim:
+        first_sync(sim)
+        data = resync_after(sim, 25)
+    assert 50 < data["drift_ppm"] < 150
+
+
+def test_drift_is_not_measured_when_the_rtc_was_not_loaded(monkeypatch):
+    with Simulator() as sim:
+        first_sync(sim)
+        pcf_to_pico_rtc = inky_frame.pcf_to_pico_rtc
+        calls = []
+
+        def unreadable_once():
+            calls.append(True)
+            if len(calls) == 1:
+                raise OSError(5, "I2C read failed")
+            pcf_to_pico_rtc()
+        monkeypatch.setattr(inky_frame, "pcf_to_pico_rtc", unreadable_once)
+        data = resync_after(sim, 25)
+    assert len(calls) > 1
+    assert "drift_ppm" not in data
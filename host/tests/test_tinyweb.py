@@ -0,0 +1,827 @@
+import asyncio
+import gzip
+import json
+import os
+import time
+from email.utils import formatdate
+
+from tinyweb import metrics
+from tinyweb.server import HEADER_BUF_SIZE, response, responsecache, webserver
+
+
+async def start(app):
+    await app._tcp_server("127.0.0.1", 0, app.backlog)
+    return app._server.sockets[0].getsockname()[1]
+
+
+async def stop(app):
+    app.shutdown()
+    await app._server.wait_closed()
+
+
+async def read_response(reader, chunks=None):
+    """Reads one response framed by Content-Length or chunked, returns (status, headers, body).
+    Payloads of the chunks are appended to the list chunks, if given.
+    """
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n":
+            break
+        name, value = line.split(b":", 1)
+        headers[name.strip().lower().decode()] = value.strip().decode()
+    if headers.get("transfer-encoding") != "chunked":
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        return status, headers, body
+    body = b""
+    while True:
+        size = int(await reader.readline(), 16)
+        chunk = await reader.readexactly(size)
+        assert await reader.readexactly(2) == b"\r\n"
+        if not size:
+            return status, headers, body
+        if chunks is not None:
+            chunks.append(chunk)
+        body += chunk
+
+
+def serve(make_app, client):
+    """Runs client(port) against the app make_app() returns, returns what client returned."""
+    async def main():
+        app = make_app()
+        port = await start(app)
+        try:
+            return await client(port)
+        finally:
+            await stop(app)
+    return asyncio.run(main())
+
+
+class Events:
+    def get(self, data):
+        return {"summary": "Zahnärzt"}
+
+
+def test_content_length_counts_bytes_of_pipelined_responses():
+    def make_app():
+        app = webserver()
+        app.add_resource(Events, "/api/events")
+        return app
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /api/events HTTP/1.1\r\nHost: frame\r\n\r\n" * 2)
+        responses = [await read_response(reader), await read_response(reader)]
+        writer.close()
+        return responses
+
+    for status, headers, body in serve(make_app, client):
+        assert status == 200
+        assert int(headers["content-length"]) == len(body)
+        assert body.decode() == '{"summary": "Zahnärzt"}'
+
+
+def test_error_message_length_counts_bytes():
+    def make_app():
+        app = webserver()
+
+        @app.route("/gone")
+        async def gone(req, resp):
+            await resp.error(410, "Vorübergehend")
+        return app
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /gone HTTP/1.1\r\nHost: frame\r\n\r\nGET /gone HTTP/1.1\r\nHost: frame\r\n\r\n")
+        responses = [await read_response(reader), await read_response(reader)]
+        writer.close()
+        return responses
+
+    for status, headers, body in serve(make_app, client):
+        assert status == 410
+        assert body == "Vorübergehend".encode()
+
+
+def test_idle_keep_alive_connections_do_not_hold_slots():
+    def make_app():
+        app = webserver(max_concurrency=3, queue_timeout=2, keep_alive_timeout=5, max_idle_connections=3)
+
+        @app.route("/ping")
+        async def ping(req, resp):
+            await resp.error(200, "pong")
+        return app
+
+    async def client(port):
+        request = b"GET /ping HTTP/1.1\r\nHost: frame\r\n\r\n"
+        idle = []
+        for _ in range(3):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(request)
+            assert (await read_response(reader))[0] == 200
+            idle.append((reader, writer))
+        # All three connections stay open, but none of them is doing anything
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(request)
+        status = (await read_response(reader))[0]
+        elapsed = loop.time() - started
+        writer.close()
+        # An idle connection gets a slot back for its next request
+        reader, writer = idle[0]
+        writer.write(request)
+        again = (await read_response(reader))[0]
+        for _, writer in idle:
+            writer.close()
+        return status, elapsed, again
+
+    status, elapsed, again = serve(make_app, client)
+    assert status == 200
+    assert elapsed < 1
+    assert again == 200
+
+
+def test_idle_keep_alive_connections_are_capped():
+    apps = []
+
+    def make_app():
+        app = webserver(max_concurrency=4, max_idle_connections=2)
+
+        @app.route("/ping")
+        async def ping(req, resp):
+            await resp.error(200, "pong")
+        apps.append(app)
+        return app
+
+    async def client(port):
+        connections = []
+        for _ in range(3):
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /ping HTTP/1.1\r\nHost: frame\r\n\r\n")
+            connections.append((await read_response(reader), reader, writer))
+            await asyncio.sleep(0.05)
+        idle = apps[0].stats()["idle"]
+        # The third connection was closed instead of joining the idle ones
+        closed = await asyncio.wait_for(connections[2][1].read(), 1)
+        for _, _, writer in connections:
+            writer.close()
+        return [response[1].get("connection") for response, _, _ in connections], idle, closed
+
+    connection, idle, closed = serve(make_app, client)
+    assert connection == [None, None, "close"]
+    assert idle == 2
+    assert closed == b""
+
+
+def upload_app(**kwargs):
+    app = webserver(**kwargs)
+
+    @app.route("/upload", methods=["POST"])
+    async def upload(req, resp):
+        size = 0
+        async for chunk in req.body(64):
+            size += len(chunk)
+        await resp.error(200, str(size))
+    return app
+
+
+async def post_slowly(port, parts, delay):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write("POST /upload HTTP/1.1\r\nHost: frame\r\nContent-Length: {}\r\n\r\n"
+                 .format(64 * 5).encode())
+    for _ in range(parts):
+        await asyncio.sleep(delay)
+        writer.write(b"x" * 64)
+        await writer.drain()
+    return reader, writer
+
+
+def test_slow_upload_is_not_cut_off_while_it_progresses():
+    async def client(port):
+        # Takes longer than read_timeout in total, but no single read waits that long
+        reader, writer = await post_slowly(port, 5, 0.15)
+        response = await read_response(reader)
+        writer.close()
+        return response
+
+    status, headers, body = serve(lambda: upload_app(read_timeout=0.4), client)
+    assert status == 200
+    assert body == b"320"
+
+
+def test_stalled_upload_times_out():
+    apps = []
+
+    def make_app():
+        apps.append(upload_app(read_timeout=0.2))
+        return apps[0]
+
+    async def client(port):
+        reader, writer = await post_slowly(port, 2, 0)
+        closed = await asyncio.wait_for(reader.read(), 2)
+        writer.close()
+        return closed
+
+    assert serve(make_app, client) == b""
+    assert apps[0].timed_out == 1
+
+
+def test_preflight_allows_methods_of_every_route_of_path():
+    def make_app():
+        app = webserver()
+
+        @app.route("/api/x")
+        async def get_x(req, resp):
+            await resp.error(200, "get")
+
+        @app.route("/api/x", methods=["POST", "PUT"])
+        async def post_x(req, resp):
+            await resp.error(200, "post")
+        return app
+
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"OPTIONS /api/x HTTP/1.1\r\nHost: frame\r\n\r\n")
+        response = await read_response(reader)
+        writer.close()
+        return response
+
+    status, headers, body = serve(make_app, client)
+    assert status == 200
+    allowed = headers["access-control-allow-methods"].split(", ")
+    assert sorted(allowed) == ["GET", "POST", "PUT"]
+
+
+def form_app(upload_dir):
+    app = webserver()
+
+    @app.route("/form", methods=["POST"], save_headers=["Content-Type", "Content-Length"], max_body_size=64)
+    async def form(req, resp):
+        await resp.error(200, json.dumps(await req.read_parse_form_data()))
+
+    @app.route("/upload", methods=["POST"], save_headers=["Content-Type", "Content-Length"], max_body_size=64)
+    async def upload(req, resp):
+        await resp.error(200, json.dumps(await req.read_multipart(upload_dir)))
+    return app
+
+
+async def post_in_pieces(port, url, content_type, body, piece):
+    """POSTs body in writes of piece bytes, so it arrives split at odd offsets."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write("POST {} HTTP/1.1\r\nHost: frame\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n"
+                 .format(url, content_type, len(body)).encode())
+    for i in range(0, len(body), piece):
+        writer.write(body[i:i + piece])
+        await writer.drain()
+        await asyncio.sleep(0.01)
+    response = await read_response(reader)
+    writer.close()
+    return response
+
+
+def test_urlencoded_form_larger_than_max_body_size_is_streamed(tmp_path):
+    fields = {"f{}".format(i): "wert+{}%21".format(i) * 6 for i in range(20)}
+    body = "&".join("{}={}".format(k, v) for k, v in fields.items()).encode()
+    assert len(body) > 1024
+
+    async def client(port):
+        return await post_in_pieces(port, "/form", "application/x-www-form-urlencoded", body, 37)
+
+    status, headers, body = serve(lambda: form_app(str(tmp_path)), client)
+    assert status == 200
+    form = json.loads(body)
+    assert len(form) == 20
+    assert form["f7"] == "wert 7!" * 6
+
+
+def test_multipart_upload_larger_than_max_body_size_is_streamed(tmp_path):
+    data = bytes(range(256)) * 8
+    body = (b"--XyZ\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nhallo\r\n"
+            b"--XyZ\r\nContent-Disposition: form-data; name=\"file\"; filename=\"events.bin\"\r\n"
+            b"Content-Type: application/octet-stream\r\n\r\n" + data + b"\r\n--XyZ--\r\n")
+
+    async def client(port):
+        return await post_in_pieces(port, "/upload", "multipart/form-data; boundary=XyZ", body, 61)
+
+    status, headers, body = serve(lambda: form_app(str(tmp_path)), client)
+    assert status == 200
+    assert (tmp_path / "events.bin").read_bytes() == data
+    assert b'"note": "hallo"' in body
+
+
+def test_json_form_larger_than_max_body_size_is_rejected(tmp_path):
+    body = ('{"summary": "' + "x" * 100 + '"}').encode()
+
+    async def client(port):
+        return await post_in_pieces(port, "/form", "application/json", body, len(body))
+
+    assert serve(lambda: form_app(str(tmp_path)), client)[0] == 413
+
+
+def router_app():
+    app = webserver()
+
+    @app.route("/calendars/<name>/events/<int:idx>")
+    async def event(req, resp, name, idx):
+        await resp.error(200, json.dumps([name, idx]))
+
+    @app.route("/calendars/<name>/events/<int:idx>", methods=["DELETE"])
+    async def delete_event(req, resp, name, idx):
+        await resp.error(200, "deleted")
+
+    @app.route("/calendars/today")
+    async def today(req, resp):
+        await resp.error(200, "today")
+    return app
+
+
+async def request(port, method, path, **headers):
+    """Sends one request, header names are given like If_None_Match."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write("{} {} HTTP/1.1\r\nHost: frame\r\n{}\r\n".format(
+        method, path, "".join("{}: {}\r\n".format(k.replace("_", "-"), v) for k, v in headers.items())).encode())
+    response = await read_response(reader)
+    writer.close()
+    return response
+
+
+def test_route_parameters_are_converted_and_passed_in_order():
+    async def client(port):
+        return await request(port, "GET", "/calendars/Familie/events/12")
+
+    status, headers, body = serve(router_app, client)
+    assert status == 200
+    assert json.loads(body) == ["Familie", 12]
+
+
+def test_static_segment_has_priority_over_parameter():
+    async def client(port):
+        return await request(port, "GET", "/calendars/today")
+
+    assert serve(router_app, client)[2] == b"today"
+
+
+def test_failed_conversion_is_not_found():
+    async def client(port):
+        return [(await request(port, "GET", path))[0] for path in
+                ("/calendars/Familie/events/zwölf", "/calendars/Familie/events", "/calendars/Familie/events/1/x")]
+
+    assert serve(router_app, client) == [404, 404, 404]
+
+
+def test_method_not_allowed_lists_the_allowed_methods():
+    async def client(port):
+        return await request(port, "POST", "/calendars/Familie/events/3")
+
+    status, headers, body = serve(router_app, client)
+    assert status == 405
+    assert sorted(headers["allow"].split(", ")) == ["DELETE", "GET"]
+
+
+FRAME = bytes(range(200))
+
+
+def file_app(path):
+    app = webserver()
+
+    @app.route("/<name>", save_headers=["Range", "Accept-Encoding", "If-Modified-Since"])
+    async def static(req, resp, name):
+        await resp.send_file(str(path / name), content_type="application/octet-stream", req=req)
+    return app
+
+
+def get_file(tmp_path, name, **headers):
+    (tmp_path / "frame.bin").write_bytes(FRAME)
+    (tmp_path / "style.css").write_bytes(b"body { color: black }" * 10)
+    (tmp_path / "style.css.gz").write_bytes(gzip.compress(b"body { color: black }" * 10))
+
+    async def client(port):
+        return await request(port, "GET", "/" + name, **headers)
+
+    return serve(lambda: file_app(tmp_path), client)
+
+
+def test_range_is_answered_with_partial_content(tmp_path):
+    status, headers, body = get_file(tmp_path, "frame.bin", Range="bytes=10-19")
+    assert status == 206
+    assert headers["content-range"] == "bytes 10-19/200"
+    assert body == FRAME[10:20]
+    status, headers, body = get_file(tmp_path, "frame.bin", Range="bytes=-5")
+    assert (status, body) == (206, FRAME[-5:])
+    # The end is clamped to the file
+    status, headers, body = get_file(tmp_path, "frame.bin", Range="bytes=150-999")
+    assert (status, headers["content-range"], body) == (206, "bytes 150-199/200", FRAME[150:])
+
+
+def test_invalid_range_is_ignored(tmp_path):
+    for value in ("bytes=5-3", "bytes=x-3", "bytes=0-1,5-6", "lines=1-2"):
+        status, headers, body = get_file(tmp_path, "frame.bin", Range=value)
+        assert (status, body) == (200, FRAME), value
+        assert "content-range" not in headers
+
+
+def test_range_past_the_end_is_not_satisfiable(tmp_path):
+    for value in ("bytes=200-", "bytes=300-400", "bytes=-0"):
+        status, headers, body = get_file(tmp_path, "frame.bin", Range=value)
+        assert status == 416, value
+        assert headers["content-range"] == "bytes */200"
+
+
+def test_not_modified_since(tmp_path):
+    (tmp_path / "frame.bin").write_bytes(FRAME)
+    mtime = os.stat(tmp_path / "frame.bin").st_mtime
+    status, headers, body = get_file(tmp_path, "frame.bin", If_Modified_Since=formatdate(mtime + 60, usegmt=True))
+    assert (status, body) == (304, b"")
+    status, headers, body = get_file(tmp_path, "frame.bin", If_Modified_Since=formatdate(mtime - 3600, usegmt=True))
+    assert (status, body) == (200, FRAME)
+
+
+def test_precompressed_file_is_sent_to_gzip_clients(tmp_path):
+    status, headers, body = get_file(tmp_path, "style.css", Accept_Encoding="gzip, deflate")
+    assert status == 200
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == b"body { color: black }" * 10
+    status, headers, body = get_file(tmp_path, "style.css")
+    assert "content-encoding" not in headers
+    assert body == b"body { color: black }" * 10
+
+
+PIECES = ["{\"n\": %d, \"summary\": \"Zahnärzt\"}, " % i for i in range(60)]
+
+
+class Feed:
+    def get(self, data):
+        yield "["
+        for piece in PIECES:
+            yield piece
+        # Larger than the writer's buffer
+        yield b"x" * 1500
+        yield "]"
+
+
+class AsyncFeed:
+    def get(self, data):
+        async def feed():
+            for piece in PIECES:
+                yield piece
+        return feed()
+
+
+def feed_app():
+    app = webserver()
+    app.add_resource(Feed, "/feed")
+    app.add_resource(AsyncFeed, "/async")
+    return app
+
+
+def test_generator_response_is_sent_in_coalesced_chunks():
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /feed HTTP/1.1\r\nHost: frame\r\n\r\nGET /feed HTTP/1.1\r\nHost: frame\r\n\r\n")
+        chunks = []
+        first = await read_response(reader, chunks)
+        # The connection stays usable after a chunked response
+        second = await read_response(reader)
+        writer.close()
+        return first, second, chunks
+
+    (status, headers, body), second, chunks = serve(feed_app, client)
+    expected = ("[" + "".join(PIECES)).encode() + b"x" * 1500 + b"]"
+    assert status == 200
+    assert headers["transfer-encoding"] == "chunked"
+    assert "content-length" not in headers
+    assert body == expected
+    # Full 512 byte chunks, not one per piece
+    assert [len(c) for c in chunks[:-1]] == [512] * (len(chunks) - 1)
+    assert len(chunks) == -(-len(expected) // 512)
+    assert second[0] == 200 and second[2] == expected
+
+
+def test_async_generator_response_is_chunked():
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /async HTTP/1.1\r\nHost: frame\r\n\r\n")
+        response = await read_response(reader)
+        writer.close()
+        return response
+
+    status, headers, body = serve(feed_app, client)
+    assert status == 200
+    assert body.decode() == "".join(PIECES)
+
+
+def test_chunked_response_to_http_1_0_closes_the_connection():
+    async def client(port):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /async HTTP/1.0\r\nHost: frame\r\nConnection: keep-alive\r\n\r\n")
+        response = await read_response(reader)
+        closed = await reader.read()
+        writer.close()
+        return response, closed
+
+    (status, headers, body), closed = serve(feed_app, client)
+    assert headers["connection"] == "close"
+    assert body.decode() == "".join(PIECES)
+    assert closed == b""
+
+
+class Status:
+    def __init__(self):
+        self.calls = 0
+        self.version = 1
+
+    def get(self, data):
+        self.calls += 1
+        return {"calls": self.calls, "data": data}
+
+
+def cache_app(status, **kwargs):
+    app = webserver()
+    app.add_resource(status, "/status", cache_version=lambda: status.version, **kwargs)
+
+    @app.resource("/missing", cache_ttl=60)
+    def missing(data):
+        status.calls += 1
+        return {"error": "not found"}, 404
+
+    @app.resource("/feed", cache_ttl=60)
+    def feed(data):
+        status.calls += 1
+        yield "[]"
+    status.app = app
+    return app
+
+
+def test_cached_resource_skips_the_handler():
+    status = Status()
+
+    async def client(port):
+        return [await request(port, "GET", path) for path in ("/status", "/status", "/status?day=1", "/status?day=1")]
+
+    responses = serve(lambda: cache_app(status), client)
+    assert [json.loads(body)["calls"] for _, _, body in responses] == [1, 1, 2, 2]
+    assert responses[0][1]["etag"] == responses[1][1]["etag"] != responses[2][1]["etag"]
+    stats = status.app.stats()
+    assert (stats["cache_hits"], stats["cache_misses"]) == (2, 2)
+    assert stats["cache_bytes"] > 0
+
+
+def test_if_none_match_is_answered_with_304():
+    status = Status()
+
+    async def client(port):
+        etag = (await request(port, "GET", "/status"))[1]["etag"]
+        return etag, await request(port, "GET", "/status", If_None_Match=etag), await request(
+            port, "GET", "/status", If_None_Match='"0000"')
+
+    etag, (code, headers, body), other = serve(lambda: cache_app(status), client)
+    assert (code, headers["etag"], body) == (304, etag, b"")
+    assert other[0] == 200 and json.loads(other[2])["calls"] == 1
+
+
+def test_cache_entry_expires_or_is_invalidated_by_version():
+    status = Status()
+
+    async def client(port):
+        calls = [json.loads((await request(port, "GET", "/status"))[2])["calls"]]
+        status.version = 2
+        calls.append(json.loads((await request(port, "GET", "/status"))[2])["calls"])
+        calls.append(json.loads((await request(port, "GET", "/status"))[2])["calls"])
+        await asyncio.sleep(0.25)
+        calls.append(json.loads((await request(port, "GET", "/status"))[2])["calls"])
+        return calls
+
+    assert serve(lambda: cache_app(status, cache_ttl=0.2), client) == [1, 2, 2, 3]
+
+
+def test_errors_and_chunked_responses_are_not_cached():
+    status = Status()
+
+    async def client(port):
+        return [(await request(port, "GET", path))[0] for path in ("/missing", "/missing", "/feed", "/feed")]
+
+    assert serve(lambda: cache_app(status), client) == [404, 404, 200, 200]
+    assert status.calls == 4
+    assert status.app.cache.entries == {}
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = responsecache(max_bytes=3 * (100 + 2 + responsecache.ENTRY_OVERHEAD))
+    for key in (b"/a", b"/b", b"/c"):
+        cache.put(key, b"x" * 100)
+    cache.get(b"/a")
+    cache.put(b"/d", b"x" * 100)
+    assert sorted(cache.entries) == [b"/a", b"/c", b"/d"]
+    assert cache.evictions == 1
+    # Too large for the budget: not stored, but still gets an ETag
+    assert cache.put(b"/e", b"x" * 1000).startswith(b'"')
+    assert b"/e" not in cache.entries
+    assert cache.size <= cache.max_bytes
+
+
+def header_app():
+    app = webserver(max_line_size=128, max_headers=8)
+
+    @app.route("/frame", methods=["GET", "POST"], save_headers=["X-Frame-Id", "Content-Length"])
+    async def frame(req, resp):
+        body = b""
+        async for chunk in req.body(16):
+            body += chunk
+        await resp.error(200, json.dumps([req.headers.get(b"X-Frame-Id", b"").decode(), body.decode()]))
+    return app
+
+
+async def send_raw(port, *parts):
+    """Sends parts one write each, returns the responses until the server closes the connection."""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for part in parts:
+        writer.write(part)
+        await writer.drain()
+        await asyncio.sleep(0.01)
+    responses = []
+    while not reader.at_eof():
+        try:
+            responses.append(await read_response(reader))
+        except (IndexError, asyncio.IncompleteReadError):
+            break
+        if responses[-1][1].get("connection") == "close":
+            break
+    writer.close()
+    return responses
+
+
+def test_saved_headers_are_matched_case_insensitively():
+    async def client(port):
+        return await send_raw(port, b"GET /frame HTTP/1.1\r\nhost: frame\r\nx-FRAME-id: \t kitchen \r\nConnection: close\r\n\r\n")
+
+    [(status, headers, body)] = serve(header_app, client)
+    assert status == 200
+    assert json.loads(body) == ["kitchen", ""]
+
+
+def test_headers_split_across_reads():
+    request = b"GET /frame HTTP/1.1\r\nHost: frame\r\nX-Frame-Id: hall\r\nConnection: close\r\n\r\n"
+
+    async def client(port):
+        return await send_raw(port, *[request[i:i + 7] for i in range(0, len(request), 7)])
+
+    [(status, headers, body)] = serve(header_app, client)
+    assert json.loads(body) == ["hall", ""]
+
+
+def test_body_and_pipelined_request_in_the_line_buffer():
+    async def client(port):
+        return await send_raw(port, b"POST /frame HTTP/1.1\r\nHost: frame\r\nContent-Length: 5\r\n\r\nhallo"
+                                    b"GET /frame HTTP/1.1\r\nHost: frame\r\nX-Frame-Id: 2\r\nConnection: close\r\n\r\n")
+
+    responses = serve(header_app, client)
+    assert [json.loads(body) for _, _, body in responses] == [["", "hallo"], ["2", ""]]
+
+
+def test_too_long_header_line_is_rejected():
+    async def client(port):
+        return [(await send_raw(port, b"GET /frame HTTP/1.1\r\nX-Frame-Id: " + b"x" * 200 + b"\r\n\r\n"))[0][0],
+                (await send_raw(port, b"GET /frame?" + b"x" * 200 + b" HTTP/1.1\r\n\r\n"))[0][0]]
+
+    assert serve(header_app, client) == [431, 431]
+
+
+def test_too_many_headers_are_rejected():
+    def headers(n):
+        return b"".join(b"X-Extra-%d: 1\r\n" % i for i in range(n))
+
+    async def client(port):
+        return [(await send_raw(port, b"GET /frame HTTP/1.1\r\n" + headers(n) + b"Connection: close\r\n\r\n"))[0][0]
+                for n in (7, 8)]
+
+    # Connection is the 8th and 9th header
+    assert serve(header_app, client) == [200, 431]
+
+
+def busy(ms):
+    """Keeps calling a function for ms, so the profiler has calls to sample."""
+    def step(n):
+        return n + 1
+
+    deadline = time.monotonic() + ms / 1000
+    n = 0
+    while time.monotonic() < deadline:
+        n = step(n)
+    return n
+
+
+def metrics_app(state):
+    app = webserver()
+    state["metrics"], state["profiler"] = metrics.install(app, profile=True)
+
+    @app.route("/events/<int:idx>")
+    async def event(req, resp, idx):
+        busy(30)
+        await resp.error(200, "event {}".format(idx))
+    return app
+
+
+def test_metrics_count_requests_per_route():
+    state = {}
+
+    async def client(port):
+        for path in ("/events/1", "/events/2", "/nowhere"):
+            await request(port, "GET", path)
+        return (await request(port, "GET", "/metrics.json"), await request(port, "GET", "/metrics"))
+
+    (status, headers, body), (text_status, text_headers, text) = serve(lambda: metrics_app(state), client)
+    routes = json.loads(body)["routes"]
+    event = routes["/events/<int:idx>"]
+    assert event["count"] == 2
+    assert event["codes"] == {"200": 2}
+    assert event["latency_ms"] >= 60
+    # Bucket of at most 25 ms stays empty, all requests are in the +Inf total
+    assert event["buckets"][2] == 0 and sum(event["buckets"]) == 2
+    assert event["bytes_in"] > 0 and event["bytes_out"] > len(b"event 1") * 2
+    assert routes["-"]["codes"] == {"404": 1}
+    assert json.loads(body)["server"]["requests"] >= 2
+
+    assert text_headers["transfer-encoding"] == "chunked"
+    text = text.decode()
+    assert 'tinyweb_request_duration_seconds_count{route="/events/<int:idx>"} 2\n' in text
+    assert 'tinyweb_request_duration_seconds_bucket{route="/events/<int:idx>",le="+Inf"} 2\n' in text
+    assert 'tinyweb_responses_total{route="-",code="404"} 1\n' in text
+    assert "# TYPE tinyweb_requests_total counter\n" in text
+
+
+def test_profiler_samples_handlers_only_while_enabled():
+    state = {}
+
+    async def client(port):
+        await request(port, "GET", "/events/1")
+        before = json.loads((await request(port, "GET", "/debug/profile"))[2])
+        await request(port, "GET", "/debug/profile?enable=1")
+        await request(port, "GET", "/events/2")
+        enabled = json.loads((await request(port, "GET", "/debug/profile?enable=0"))[2])
+        reset = json.loads((await request(port, "GET", "/debug/profile?reset=1"))[2])
+        return before, enabled, reset
+
+    before, enabled, reset = serve(lambda: metrics_app(state), client)
+    assert before["available"] and before["samples"] == []
+    assert not enabled["enabled"]
+    functions = [key.rsplit(":", 1)[1] for key, _ in enabled["samples"]]
+    assert "step" in functions
+    assert reset["samples"] == []
+
+
+def compose(version="1.1", keep_alive=True, code=200, hbuf=None, blocks=(), **headers):
+    resp = response(None, hbuf)
+    resp.version, resp.keep_alive, resp.code = version, keep_alive, code
+    for block in blocks:
+        resp.add_header_block(block)
+    for name, value in headers.items():
+        resp.add_header(name.replace("_", "-"), value)
+    return resp._compose_headers()
+
+
+def test_header_is_composed_from_blocks_in_the_connection_buffer():
+    hbuf = memoryview(bytearray(HEADER_BUF_SIZE))
+    header = compose(hbuf=hbuf, blocks=[b"Cache-Control: no-cache\r\n"], Content_Length=12, ETag=b'"ab"')
+    assert bytes(header) == (b"HTTP/1.1 200 OK\r\nCache-Control: no-cache\r\n"
+                             b"Content-Length: 12\r\nETag: \"ab\"\r\n\r\n")
+    # No new buffer for a header that fits
+    assert header.obj is hbuf.obj
+
+
+def test_header_larger_than_the_buffer_gets_its_own():
+    hbuf = memoryview(bytearray(64))
+    header = compose(hbuf=hbuf, Content_Length=0, X_Long="x" * 100)
+    assert header.obj is not hbuf.obj
+    assert bytes(header).endswith(b"X-Long: " + b"x" * 100 + b"\r\n\r\n")
+
+
+def test_status_line_and_connection_header():
+    assert bytes(compose(code=416, Content_Length=0)).startswith(b"HTTP/1.1 416 Range Not Satisfiable\r\n")
+    # No reason phrase for codes outside the table
+    assert bytes(compose(code=299, Content_Length=0)).startswith(b"HTTP/1.1 299 \r\n")
+    # Not framed: the client can only see the end when the connection closes
+    assert bytes(compose()).endswith(b"\r\nConnection: close\r\n\r\n")
+    assert bytes(compose(version="1.0", Content_Length=0)).endswith(b"\r\nConnection: keep-alive\r\n\r\n")
+    assert b"Connection" not in bytes(compose(Content_Length=0))
+
+
+def test_resource_response_carries_the_route_headers():
+    class Editable(Events):
+        def post(self, data):
+            return {"saved": True}
+
+    def make_app():
+        app = webserver()
+        app.add_resource(Editable, "/api/events")
+        return app
+
+    async def client(port):
+        return await request(port, "GET", "/api/events")
+
+    status, headers, body = serve(make_app, client)
+    assert headers["content-type"] == "application/json"
+    assert headers["access-control-allow-origin"] == "*"
+    assert headers["access-control-allow-methods"] == "GET, POST"
+    assert int(headers["content-length"]) == len(body)
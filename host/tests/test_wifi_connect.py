@@ -0,0 +1,194 @@
+import json
+import os
+
+from inkysim.simulator import Simulator
+
+STAT_CONNECT_FAIL = -1
+STAT_NO_AP_FOUND = -2
+STAT_WRONG_PASSWORD = -3
+STAT_CONNECTING = 1
+STAT_GOT_IP = 3
+
+BSSID = b"\x02\x00\x00\x00\x00\x07"
+IFCONFIG = ["192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1"]
+
+
+class FakeWLAN:
+    """A WLAN whose status() answers from scripts, one list of status codes per connect() call.
+    The last status of a script repeats until the next connect().
+    """
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.script = []
+        self.connects = []
+        self.ifconfigs = []
+        self.last = None
+
+    def active(self, is_active=None):
+        pass
+
+    def config(self, **kwargs):
+        pass
+
+    def connect(self, ssid, key, bssid=None):
+        self.connects.append((ssid, key, bssid))
+        self.script = list(self.scripts.pop(0))
+
+    def disconnect(self):
+        pass
+
+    def status(self):
+        self.last = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        return self.last
+
+    def isconnected(self):
+        # What the status() just before said
+        return self.last == STAT_GOT_IP
+
+    def ifconfig(self, config=None):
+        if config is None:
+            return tuple(IFCONFIG)
+        self.ifconfigs.append(config)
+
+    def scan(self):
+        return [(b"home", BSSID, 6, -50, 3, False)]
+
+
+def connect(sim, tmp_path, wlan, timeout_ms=30000):
+    """Runs network_connect() with wlan on the simulated board.
+    Returns (error, ms) - the InkyHelperError raised, or None, and the virtual ms it took.
+    """
+    sim.wlan = wlan
+    sim.timeout_ms = timeout_ms
+    main = tmp_path / "main.py"
+    main.write_text(
+        "import time\n"
+        "from _board import board\n"
+        "import inky_helper as ih\n"
+        "sim = board()\n"
+        "ih.load_time_from_rtc()\n"
+        "started = time.ticks_ms()\n"
+        "try:\n"
+        "    ih.network_connect('home', 'secret', sim.timeout_ms, sim.wlan)\n"
+        "    sim.error = None\n"
+        "except ih.InkyHelperError as e:\n"
+        "    sim.error = e\n"
+        "sim.ms = time.ticks_diff(time.ticks_ms(), started)\n")
+    wake = sim.wake(str(main))
+    assert wake.error is None, wake.output
+    return sim.error, sim.ms
+
+
+def wifi_cache(sim):
+    path = os.path.join(sim.flash_dir, "wifi_cache.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_wifi_cache(sim, failures=0):
+    sim.write_flash("wifi_cache.json", json.dumps({
+        "ssid": "home", "bssid": BSSID.hex(), "channel": 6, "ifconfig": IFCONFIG,
+        "saved_at": int(sim.rtc_time()), "failures": failures}))
+
+
+def test_warm_retry_stays_directed_to_the_cached_bssid(tmp_path):
+    with Simulator(provision=False) as sim:
+        write_wifi_cache(sim)
+        wlan = FakeWLAN([STAT_CONNECTING, STAT_CONNECT_FAIL], [STAT_CONNECTING, STAT_GOT_IP])
+        error, ms = connect(sim, tmp_path, wlan)
+    assert error is None
+    assert [bssid for ssid, key, bssid in wlan.connects] == [BSSID, BSSID]
+    assert wlan.ifconfigs == [tuple(IFCONFIG)]
+
+
+def test_connecting_until_an_ip_is_assigned(tmp_path):
+    with Simulator(provision=False) as sim:
+        wlan = FakeWLAN([STAT_CONNECTING] * 5 + [STAT_GOT_IP])
+        error, ms = connect(sim, tmp_path, wlan)
+    assert error is None
+    assert len(wlan.connects) == 1
+    assert ms == 5 * 100
+
+
+def test_wrong_password_fails_without_waiting_for_the_deadline(tmp_path):
+    with Simulator(provision=False) as sim:
+        wlan = FakeWLAN([STAT_CONNECTING, STAT_WRONG_PASSWORD])
+        error, ms = connect(sim, tmp_path, wlan)
+    assert error is not None and error.args[2] == STAT_WRONG_PASSWORD
+    assert len(wlan.connects) == 1
+    assert ms == 100
+
+
+def test_no_access_point_fails_without_waiting_for_the_deadline(tmp_path):
+    with Simulator(provision=False) as sim:
+        wlan = FakeWLAN([STAT_NO_AP_FOUND])
+        error, ms = connect(sim, tmp_path, wlan)
+    assert error is not None and error.args[2] == STAT_NO_AP_FOUND
+    assert ms == 0
+
+
+def test_connect_fail_is_retried_with_a_growing_backoff(tmp_path):
+    with Simulator(provision=False) as sim:
+        wlan = FakeWLAN([STAT_CONNECT_FAIL], [STAT_CONNECT_FAIL], [STAT_GOT_IP])
+        error, ms = connect(sim, tmp_path, wlan)
+    assert error is None
+    assert len(wlan.connects) == 3
+    assert ms == 500 + 1000
+
+
+def test_stuck_connection_times_out_at_the_deadline(tmp_path):
+    with Simulator(provision=False) as sim:
+        wlan = FakeWLAN([STAT_CONNECTING])
+        error, ms = connect(sim, tmp_path, wlan, timeout_ms=2000)
+    assert error is not None and error.args[2] == STAT_CONNECTING
+    assert ms == 2000
+
+
+def test_retry_backoff_does_not_overrun_the_deadline(tmp_path):
+    with Simulator(provision=False) as sim:
+        wlan = FakeWLAN(*[[STAT_CONNECT_FAIL]] * 4)
+        error, ms = connect(sim, tmp_path, wlan, timeout_ms=2000)
+    assert error is not None and error.args[2] == STAT_CONNECT_FAIL
+    # 500 + 1000, then the rest of the 2 s instead of the next 2000
+    assert len(wlan.connects) == 4
+    assert ms == 2000
+
+
+def test_wrong_password_resets_the_board():
+    with Simulator() as sim:
+        sim.access_points[sim.WIFI_SSID].password = "changed"
+        wake = sim.wake()
+    assert wake.outcome == "reset"
+    # Failed at once: only one association, not a 30 s wait
+    assert [what for _, what, _ in sim.events].count("wifi connect") == 1
+    assert wake.ms < 30000
+
+
+def test_async_connect_lets_other_tasks_run(tmp_path):
+    with Simulator(provision=False) as sim:
+        sim.wlan = FakeWLAN([STAT_CONNECTING] * 3 + [STAT_GOT_IP])
+        main = tmp_path / "main.py"
+        main.write_text(
+            "import uasyncio as asyncio\n"
+            "from _board import board\n"
+            "import inky_helper as ih\n"
+            "sim = board()\n"
+            "sim.ticks = 0\n"
+            "async def ticker():\n"
+            "    while True:\n"
+            "        sim.ticks += 1\n"
+            "        await asyncio.sleep_ms(20)\n"
+            "async def run():\n"
+            "    task = asyncio.create_task(ticker())\n"
+            "    sim.connected = await ih.network_connect_async('home', 'secret', 30000, sim.wlan)\n"
+            "    task.cancel()\n"
+            "asyncio.run(run())\n")
+        wake = sim.wake(str(main))
+    assert wake.error is None, wake.output
+    assert sim.connected is sim.wlan
+    assert len(sim.wlan.connects) == 1
+    # The ticker ran during the three 100 ms polls
+    assert sim.ticks >= 5